@@ -1,32 +1,173 @@
+import codecs
 import os
 import random
-from datetime import datetime, timezone
-from flask import Flask, jsonify, redirect, render_template, request, session, url_for
-from extensions import db
-from models import Habit
-
-app = Flask(__name__)
-app.config["SECRET_KEY"] = "dev-secret-key-change-in-production"
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///app.db"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-db.init_app(app)
-
-# Store OTPs temporarily
-otp_store = {}
-
-CATEGORIES = [
-    "Health", "Fitness", "Study", "Productivity",
-    "Mindfulness", "Finance", "Social", "Chores"
-]
-
-@app.route('/')
+import time
+from collections.abc import Mapping
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    current_app,
+    g,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    session,
+    stream_with_context,
+    url_for,
+)
+
+from assets import build_assets, compile_tailwind, init_assets
+from backup import FORMATS, ImportFormatError, export_stream, import_stream
+from bulk import BulkRequestError, apply_operations
+from categories import init_category_cache, resolve_category, user_categories
+from config import config_from_env
+from extensions import db, init_db_engine
+from http_cache import conditional_response, init_page_cache
+from instrumentation import init_instrumentation
+from live import build_hub, event_stream
+from mailer import build_mail_queue
+from migrations import assign_unowned_habits, run_migrations
+from models import Habit, User
+from otp import EXPIRED, INVALID, LOCKED, MISSING, VERIFIED, build_otp_store
+from pagination import InvalidCursorError, keyset_page, parse_page_size
+from query_budget import init_query_warnings
+from ratelimit import init_rate_limits
+from schedules import (
+    ScheduleError,
+    apply_schedule,
+    describe,
+    dispatch_reminders,
+    next_due,
+    parse_schedule,
+)
+from search import search_habits
+from sharding import (
+    create_schemas,
+    get_or_create_sharded_user,
+    init_sharding,
+    map_shards,
+    rebalance,
+    shard_stats,
+)
+from stats import DEFAULT_RANGE_DAYS, habit_stats
+from streaks import record_completion, remove_completion, repair_counters
+from sync import (
+    MAX_SYNC_PAGE_SIZE,
+    SYNC_PAGE_SIZE,
+    SyncRequestError,
+    apply_changes,
+    changes_since,
+    current_version,
+    parse_since,
+)
+
+# CLI commands are registered at the top level: ``flask migrate``, not ``flask main migrate``
+bp = Blueprint("main", __name__, cli_group=None)
+
+
+def create_app(config=None):
+    """Build a configured application.
+
+    ``config`` is either a config class, used instead of the one named by
+    ``APP_ENV``, or a mapping of overrides applied last. Creating an app
+    never touches the database; run ``flask migrate`` (or ``init_db``) for
+    that.
+    """
+    app = Flask(__name__)
+    if config is None or isinstance(config, Mapping):
+        app.config.from_object(config_from_env())
+    else:
+        app.config.from_object(config)
+    app.config.from_prefixed_env()
+    if isinstance(config, Mapping):
+        app.config.update(config)
+
+    if not app.config.get("SECRET_KEY"):
+        raise RuntimeError("SECRET_KEY is not set; export FLASK_SECRET_KEY")
+
+    init_sharding(app)
+    init_db_engine(app)
+    init_page_cache(app)
+    init_assets(app)
+    init_category_cache(app)
+    init_instrumentation(app)
+    init_query_warnings(app)
+    init_rate_limits(app)
+    # Store OTPs temporarily
+    app.extensions["otp_store"] = build_otp_store(app.config)
+    # Sign-in emails are queued and delivered off the request thread
+    app.extensions["mail_queue"] = build_mail_queue(app)
+    # Wakes open /habit-tracker/api/stream responses when habits change
+    app.extensions["live_hub"] = build_hub(app)
+    app.register_blueprint(bp)
+    return app
+
+
+def get_otp_store():
+    """Return the OTP store of the current app"""
+    return current_app.extensions["otp_store"]
+
+
+def get_mail_queue():
+    """Return the outbound mail queue of the current app"""
+    return current_app.extensions["mail_queue"]
+
+
+OTP_MESSAGES = {
+    INVALID: "Invalid OTP",
+    EXPIRED: "OTP expired, please request a new one",
+    LOCKED: "Too many attempts, please request a new OTP",
+    MISSING: "Invalid OTP",
+}
+
+
+def get_or_create_user(email):
+    """Return the User for ``email``, creating it on first sign-in"""
+    email = email.strip().lower()
+    if current_app.config.get("SHARDS"):
+        return get_or_create_sharded_user(email)
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        user = User(email=email)
+        db.session.add(user)
+        db.session.commit()
+    return user
+
+
+def current_user_id():
+    """Return the signed-in user's id, or None if nobody is signed in.
+
+    The id is cached in the session at sign-in so most requests skip the
+    email lookup entirely.
+    """
+    if "user_id" not in g:
+        user_id = None
+        if session.get("authenticated") and session.get("email"):
+            user_id = session.get("user_id")
+            if user_id is None:
+                user_id = get_or_create_user(session["email"]).id
+                session["user_id"] = user_id
+        g.user_id = user_id
+    return g.user_id
+
+
+def owned_habit(habit_id):
+    """Return the current user's habit with ``habit_id``, or None"""
+    return Habit.query.filter_by(id=habit_id, user_id=current_user_id()).first()
+
+
+@bp.route('/')
 def home():
     """Landing page"""
     return render_template("home/index.html")
 
 
-@app.route("/signin", methods=["GET", "POST"])
+@bp.route("/signin", methods=["GET", "POST"])
 def signin():
     """Sign in with OTP"""
     if request.method == "POST":
@@ -36,11 +177,12 @@ def signin():
             # Generate OTP
             email = data["email"]
             otp = str(random.randint(100000, 999999))
-            otp_store[email] = otp
+            if not get_otp_store().issue(email, otp):
+                return jsonify({"success": False, "message": "Too many OTP requests, try again later"}), 429
 
-            print(f"\n{'=' * 50}")
-            print(f"OTP for {email}: {otp}")
-            print(f"{'=' * 50}\n")
+            get_mail_queue().enqueue(
+                email, "Your sign-in code", f"OTP for {email}: {otp}"
+            )
 
             return jsonify({"success": True, "message": f"OTP sent to {email}", "otp": otp})
 
@@ -49,22 +191,23 @@ def signin():
             email = data["email"]
             otp = data["otp"]
 
-            if email in otp_store and otp_store[email] == otp:
+            status = get_otp_store().verify(email, otp)
+            if status == VERIFIED:
                 session["authenticated"] = True
                 session["email"] = email
-                del otp_store[email]
+                session["user_id"] = get_or_create_user(email).id
                 return jsonify({"success": True, "message": "Authentication successful"})
             else:
-                return jsonify({"success": False, "message": "Invalid OTP"})
+                return jsonify({"success": False, "message": OTP_MESSAGES[status]})
 
     return render_template("home/signIn.html")
 
 
-@app.route("/habit-tracker", methods=["GET", "POST"])
+@bp.route("/habit-tracker", methods=["GET", "POST"])
 def habit_tracker():
     """Habit tracker - protected"""
-    if not session.get("authenticated"):
-        return redirect(url_for("signin"))
+    if current_user_id() is None:
+        return redirect(url_for("main.signin"))
 
     if request.method == "POST":
         name = request.form.get("name", "").strip()
@@ -78,88 +221,505 @@ def habit_tracker():
             habit = Habit(
                 name=name,
                 description=description or None,
-                category=(category or None)  # safe if empty
+                category_id=resolve_category(current_user_id(), category),  # None if empty
+                user_id=current_user_id()
             )
             db.session.add(habit)
+            User.bump_habits_version(current_user_id())
             db.session.commit()
 
-        return redirect(url_for("habit_tracker"))
+        return redirect(url_for("main.habit_tracker"))
 
-    habits = Habit.query.filter_by(is_archived=False).order_by(Habit.created_at.desc()).all()
+    today = datetime.utcnow().date()
 
-    return render_template(
-        'apps/habit_tracker/index.html',
-        page_id='habit-tracker',
-        habits=habits,
-        categories=CATEGORIES
-    )
+    def render():
+        habits, next_cursor = habit_page(archived=False)
+        return render_template(
+            'apps/habit_tracker/index.html',
+            page_id='habit-tracker',
+            habits=habits,
+            next_cursor=next_cursor,
+            categories=user_categories(current_user_id()),
+            today=today
+        )
+
+    try:
+        return conditional_response(current_user_id(), today, render)
+    except InvalidCursorError:
+        return "Invalid cursor", 400
 
 
-@app.route("/habit-tracker/delete/<int:habit_id>", methods=["POST"])
+@bp.route("/habit-tracker/delete/<int:habit_id>", methods=["POST"])
 def delete_habit(habit_id):
-    habit = Habit.query.get_or_404(habit_id)
+    """Delete a habit"""
+    if current_user_id() is None:
+        return redirect(url_for("main.signin"))
+
+    habit = owned_habit(habit_id)
+    if not habit:
+        return "Habit not found", 404
+
     db.session.delete(habit)
+    User.bump_habits_version(current_user_id())
     db.session.commit()
-    return redirect(url_for("habit_tracker"))
+    return redirect(url_for("main.habit_tracker"))
+
+
+
+@bp.route("/habit-tracker/complete/<int:habit_id>", methods=["POST"])
+def complete_habit(habit_id):
+    """Mark a habit as done for today"""
+    if current_user_id() is None:
+        return redirect(url_for("main.signin"))
+
+    habit = owned_habit(habit_id)
+    if not habit:
+        return "Habit not found", 404
+
+    if record_completion(habit, datetime.utcnow().date()):
+        User.bump_habits_version(current_user_id())
+        db.session.commit()
+    return redirect(url_for("main.habit_tracker"))
 
 
+@bp.route("/habit-tracker/uncomplete/<int:habit_id>", methods=["POST"])
+def uncomplete_habit(habit_id):
+    """Undo today's check-in for a habit"""
+    if current_user_id() is None:
+        return redirect(url_for("main.signin"))
 
-@app.route("/habit-tracker/archive/<int:habit_id>", methods=["POST"])
+    habit = owned_habit(habit_id)
+    if not habit:
+        return "Habit not found", 404
+
+    if remove_completion(habit, datetime.utcnow().date()):
+        User.bump_habits_version(current_user_id())
+        db.session.commit()
+    return redirect(url_for("main.habit_tracker"))
+
+
+@bp.route("/habit-tracker/archive/<int:habit_id>", methods=["POST"])
 def archive_habit(habit_id):
     """Archive a habit"""
-    if not session.get("authenticated"):
-        return redirect(url_for("signin"))
+    if current_user_id() is None:
+        return redirect(url_for("main.signin"))
     
-    habit = db.session.get(Habit, habit_id)
+    habit = owned_habit(habit_id)
     if not habit:
         return "Habit not found", 404
     
     habit.is_archived = True
     habit.archived_at = datetime.utcnow()
+    User.bump_habits_version(current_user_id())
     db.session.commit()
-    return redirect(url_for("habit_tracker"))
+    return redirect(url_for("main.habit_tracker"))
 
 
-@app.route("/habit-tracker/unarchive/<int:habit_id>", methods=["POST"])
+@bp.route("/habit-tracker/unarchive/<int:habit_id>", methods=["POST"])
 def unarchive_habit(habit_id):
     """Unarchive a habit"""
-    if not session.get("authenticated"):
-        return redirect(url_for("signin"))
+    if current_user_id() is None:
+        return redirect(url_for("main.signin"))
     
-    habit = db.session.get(Habit, habit_id)
+    habit = owned_habit(habit_id)
     if not habit:
         return "Habit not found", 404
     
     habit.is_archived = False
     habit.archived_at = None
+    habit.next_due_at = next_due(habit, datetime.utcnow())
+    User.bump_habits_version(current_user_id())
     db.session.commit()
-    return redirect(request.referrer or url_for("habit_tracker"))
+    return redirect(request.referrer or url_for("main.habit_tracker"))
 
 
-@app.route("/habit-tracker/archived")
+@bp.route("/habit-tracker/archived")
 def archived_habits():
     """View archived habits"""
-    if not session.get("authenticated"):
-        return redirect(url_for("signin"))
+    if current_user_id() is None:
+        return redirect(url_for("main.signin"))
     
-    habits = Habit.query.filter_by(is_archived=True).order_by(Habit.archived_at.desc()).all()
-    return render_template("apps/habit_tracker/archived.html", page_id="habit-tracker", habits=habits)
+    def render():
+        habits, next_cursor = habit_page(archived=True)
+        return render_template(
+            "apps/habit_tracker/archived.html",
+            page_id="habit-tracker",
+            habits=habits,
+            next_cursor=next_cursor
+        )
+
+    try:
+        return conditional_response(current_user_id(), datetime.utcnow().date(), render)
+    except InvalidCursorError:
+        return "Invalid cursor", 400
+
+
+@bp.route("/habit-tracker/api/habits")
+def list_habits_api():
+    """JSON listing of active (or ?archived=1) habits, one keyset page at a time"""
+    if current_user_id() is None:
+        return jsonify({"success": False, "message": "Authentication required"}), 401
+
+    archived = request.args.get("archived", "0") in ("1", "true")
+    today = datetime.utcnow().date()
+
+    def render():
+        habits, next_cursor = habit_page(archived=archived)
+        return current_app.json.dumps({
+            "success": True,
+            "habits": [habit.to_dict(today) for habit in habits],
+            "next_cursor": next_cursor,
+        })
+
+    try:
+        return conditional_response(current_user_id(), today, render, "application/json")
+    except InvalidCursorError:
+        return jsonify({"success": False, "message": "Invalid cursor"}), 400
+
+
+@bp.route("/habit-tracker/api/search")
+def search_habits_api():
+    """Ranked prefix search over name, description and category.
+
+    Filters: ?category=<id>, ?archived=0 (default), 1 or all, and
+    ?created_from= / ?created_to= as inclusive YYYY-MM-DD dates.
+    """
+    if current_user_id() is None:
+        return jsonify({"success": False, "message": "Authentication required"}), 401
+
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"success": False, "message": "Missing search query"}), 400
+    archived = {"0": False, "1": True, "all": None}.get(request.args.get("archived", "0"), False)
+    try:
+        created = {
+            name: datetime.strptime(request.args[name], "%Y-%m-%d").date()
+            for name in ("created_from", "created_to")
+            if request.args.get(name)
+        }
+    except ValueError:
+        return jsonify({"success": False, "message": "Dates must be YYYY-MM-DD"}), 400
+    today = datetime.utcnow().date()
+
+    def render():
+        habits = search_habits(
+            current_user_id(),
+            query,
+            category_id=request.args.get("category", type=int),
+            archived=archived,
+            limit=parse_page_size(request.args.get("limit")),
+            **created,
+        )
+        return current_app.json.dumps({
+            "success": True,
+            "habits": [habit.to_dict(today) for habit in habits],
+        })
+
+    return conditional_response(current_user_id(), today, render, "application/json")
+
+
+@bp.route("/habit-tracker/api/habits/<int:habit_id>/schedule", methods=["GET", "PUT", "DELETE"])
+def habit_schedule_api(habit_id):
+    """Read, set or clear a habit's reminder schedule"""
+    if current_user_id() is None:
+        return jsonify({"success": False, "message": "Authentication required"}), 401
+
+    habit = owned_habit(habit_id)
+    if not habit:
+        return jsonify({"success": False, "message": "Habit not found"}), 404
+
+    if request.method != "GET":
+        values = None
+        if request.method == "PUT":
+            try:
+                values = parse_schedule(request.get_json(silent=True))
+            except ScheduleError as exc:
+                return jsonify({"success": False, "message": str(exc)}), 400
+        apply_schedule(habit, values, datetime.utcnow())
+        User.bump_habits_version(current_user_id())
+        db.session.commit()
+    return jsonify({"success": True, "schedule": describe(habit)})
+
+
+@bp.route("/habit-tracker/api/sync", methods=["GET", "POST"])
+def sync_api():
+    """Delta sync: GET changes since a version, POST a batch of client edits"""
+    if current_user_id() is None:
+        return jsonify({"success": False, "message": "Authentication required"}), 401
+
+    today = datetime.utcnow().date()
+    if request.method == "GET":
+        try:
+            since = parse_since(request.args.get("since"))
+        except SyncRequestError as exc:
+            return jsonify({"success": False, "message": str(exc)}), 400
+        limit = parse_page_size(request.args.get("limit"), SYNC_PAGE_SIZE, MAX_SYNC_PAGE_SIZE)
+        return jsonify({"success": True, **changes_since(current_user_id(), since, today, limit)})
+
+    try:
+        results = apply_changes(current_user_id(), request.get_json(silent=True), today)
+    except SyncRequestError as exc:
+        return jsonify({"success": False, "message": str(exc)}), 400
+
+    if any(r["status"] == "applied" for r in results):
+        User.bump_habits_version(current_user_id())
+    db.session.commit()
+    return jsonify({
+        "success": all(r["status"] == "applied" for r in results),
+        "results": results,
+        "version": current_version(current_user_id()),
+    })
+
+
+@bp.route("/habit-tracker/api/stream")
+def stream_api():
+    """Server-Sent Events: push sync diffs as the user's habits change"""
+    if current_user_id() is None:
+        return jsonify({"success": False, "message": "Authentication required"}), 401
+
+    raw = request.headers.get("Last-Event-ID", request.args.get("since"))
+    try:
+        since = None if raw is None else parse_since(raw)
+    except SyncRequestError as exc:
+        return jsonify({"success": False, "message": str(exc)}), 400
+
+    stream = event_stream(
+        current_app.extensions["live_hub"],
+        current_user_id(),
+        since,
+        today=lambda: datetime.utcnow().date(),
+        heartbeat=current_app.config["LIVE_HEARTBEAT_SECONDS"],
+        max_seconds=current_app.config["LIVE_MAX_SECONDS"],
+    )
+    return Response(
+        stream_with_context(stream),
+        mimetype="text/event-stream",
+        # No caching, and no proxy buffering (nginx) holding events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.route("/habit-tracker/bulk", methods=["POST"])
+def bulk_habits():
+    """Apply a batch of create/archive/unarchive/delete operations in one transaction"""
+    if current_user_id() is None:
+        return jsonify({"success": False, "message": "Authentication required"}), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        results = apply_operations(current_user_id(), data.get("operations"))
+    except BulkRequestError as exc:
+        return jsonify({"success": False, "message": str(exc)}), 400
+
+    if any(r["success"] for r in results):
+        User.bump_habits_version(current_user_id())
+    db.session.commit()
+    return jsonify({"success": all(r["success"] for r in results), "results": results})
+
+
+@bp.route("/habit-tracker/stats")
+def habit_stats_api():
+    """Heatmaps, weekday distributions and completion rates over ?days= ending ?end="""
+    if current_user_id() is None:
+        return jsonify({"success": False, "message": "Authentication required"}), 401
+
+    today = datetime.utcnow().date()
+    try:
+        days = int(request.args.get("days", DEFAULT_RANGE_DAYS))
+        end = request.args.get("end")
+        end = datetime.strptime(end, "%Y-%m-%d").date() if end else today
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid days or end date"}), 400
+    include_archived = request.args.get("archived", "0") in ("1", "true")
+
+    def render():
+        stats = habit_stats(current_user_id(), end=end, days=days, include_archived=include_archived)
+        return current_app.json.dumps({"success": True, **stats})
+
+    return conditional_response(current_user_id(), today, render, "application/json")
+
+
+@bp.route("/habit-tracker/export")
+def export_habits():
+    """Download all habits and completion history as ?format=csv (default) or ndjson"""
+    if current_user_id() is None:
+        return redirect(url_for("main.signin"))
+
+    fmt = request.args.get("format", "csv")
+    if fmt not in FORMATS:
+        return "Unknown format", 400
+
+    stamp = datetime.utcnow().strftime("%Y%m%d")
+    return current_app.response_class(
+        stream_with_context(export_stream(current_user_id(), fmt)),
+        mimetype=FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename=habits-{stamp}.{fmt}"},
+    )
+
+
+@bp.route("/habit-tracker/import", methods=["POST"])
+def import_habits():
+    """Import an export file (multipart 'file' field or raw body), chunk by chunk"""
+    if current_user_id() is None:
+        return jsonify({"success": False, "message": "Authentication required"}), 401
+
+    upload = request.files.get("file")
+    fmt = request.args.get("format")
+    if fmt is None:
+        filename = upload.filename if upload else ""
+        fmt = "ndjson" if filename.endswith((".ndjson", ".jsonl")) else "csv"
+    if fmt not in FORMATS:
+        return jsonify({"success": False, "message": "Unknown format"}), 400
+
+    raw = upload.stream if upload else request.stream
+    # Decode line by line: TextIOWrapper needs readable() etc., which the
+    # SpooledTemporaryFile behind uploads lacks before Python 3.11
+    stream = codecs.iterdecode(raw, "utf-8-sig")
+    try:
+        summary = import_stream(current_user_id(), stream, fmt)
+    except (ImportFormatError, UnicodeDecodeError) as exc:
+        return jsonify({"success": False, "message": str(exc)}), 400
+    return jsonify({"success": summary["error_count"] == 0, **summary})
+
+
+def habit_page(archived):
+    """Return one page of habits for the current request's cursor/limit args.
+
+    Active habits are ordered by created_at, archived ones by archived_at,
+    newest first; ?category=<id> narrows to one category. Raises
+    InvalidCursorError for a malformed ?cursor=.
+    """
+    sort_column = Habit.archived_at if archived else Habit.created_at
+    query = Habit.query.filter_by(user_id=current_user_id(), is_archived=archived)
+    category_id = request.args.get("category", type=int)
+    if category_id is not None:
+        query = query.filter_by(category_id=category_id)
+    return keyset_page(
+        query,
+        Habit,
+        sort_column,
+        cursor=request.args.get("cursor"),
+        limit=parse_page_size(request.args.get("limit")),
+    )
 
 
 
 # test change
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     session.clear()
-    return redirect(url_for("home"))
+    return redirect(url_for("main.home"))
 
 
-def init_db():
+def init_db(app):
+    """Create missing tables and run data migrations for ``app``"""
     with app.app_context():
-        db.create_all()
+        if app.config.get("SHARDS"):
+            create_schemas(app, run_migrations)
+        else:
+            db.create_all()
+            run_migrations()
+
+
+@bp.cli.command("migrate")
+def migrate_command():
+    """Create missing tables and run data migrations"""
+    init_db(current_app._get_current_object())
+    print("Database migrated.")
+
+
+@bp.cli.command("deliver-mail")
+@click.option("--once", is_flag=True, help="Send what is due now and exit.")
+def deliver_mail_command(once):
+    """Send queued sign-in emails (for MAIL_WORKER = "none")"""
+    queue = get_mail_queue()
+    if once:
+        totals = queue.deliver_pending()
+        print(f"Sent {totals['sent']}, retrying {totals['retrying']}, failed {totals['failed']}.")
+    else:
+        queue.run()
+
+
+@bp.cli.command("send-reminders")
+@click.option("--every", type=float, default=None,
+              help="Keep running, dispatching every N seconds.")
+def send_reminders_command(every):
+    """Queue reminder emails for habits that are due"""
+    app = current_app._get_current_object()
+    config = app.config
+    while True:
+        # Each shard's due habits are read and rescheduled in parallel
+        per_shard = map_shards(
+            app,
+            dispatch_reminders,
+            get_mail_queue(),
+            None,
+            config["REMINDER_BATCH_SIZE"],
+            timedelta(seconds=config["REMINDER_GRACE_SECONDS"]),
+        )
+        totals = {key: sum(shard[key] for shard in per_shard) for key in per_shard[0]}
+        print(f"Reminded {totals['reminded']} habit(s) in {totals['messages']} email(s); "
+              f"rescheduled {totals['rescheduled']}.")
+        if every is None:
+            return
+        time.sleep(every)
+
+
+@bp.cli.command("build-assets")
+def build_assets_command():
+    """Build purged, minified, fingerprinted CSS bundles into static/dist"""
+    app = current_app._get_current_object()
+    templates_dir = os.path.join(app.root_path, app.template_folder)
+    if not compile_tailwind(app.static_folder, templates_dir, app.config["TAILWIND_BIN"]):
+        print(f"{app.config['TAILWIND_BIN']} not found; bundling existing CSS only.")
+    manifest = build_assets(app.static_folder, templates_dir)
+    for name, filename in sorted(manifest.items()):
+        print(f"{name} -> {filename}")
+    if "css/app.css" not in manifest:
+        print("No static/css/tailwind.css; pages will keep loading Tailwind from its CDN.")
+    if "css/fonts.css" not in manifest:
+        print("No static/css/fonts.css; pages will keep loading fonts from Google Fonts.")
+
+
+@bp.cli.command("claim-habits")
+@click.argument("email")
+def claim_habits_command(email):
+    """Assign habits created before per-user accounts to EMAIL"""
+    assigned = assign_unowned_habits(get_or_create_user(email).id)
+    print(f"Assigned {assigned} habit(s) to {email}.")
+
+
+@bp.cli.command("repair-streaks")
+def repair_streaks_command():
+    """Rebuild streak counters from completion history and report drift"""
+    drift = [item for shard in map_shards(current_app._get_current_object(), repair_counters)
+             for item in shard]
+    for item in drift:
+        print(f"habit {item['habit_id']}: {item['field']} {item['stored']!r} -> {item['expected']!r}")
+    print(f"Repaired {len(drift)} drifted value(s).")
+
+
+@bp.cli.command("shard-stats")
+def shard_stats_command():
+    """Count users and habits on each shard"""
+    for stats in shard_stats(current_app._get_current_object()):
+        shard = "main" if stats["shard"] is None else stats["shard"]
+        print(f"shard {shard}: {stats['users']} user(s), {stats['habits']} habit(s)")
+
+
+@bp.cli.command("rebalance-shards")
+@click.option("--dry-run", is_flag=True, help="List the moves without making them.")
+def rebalance_shards_command(dry_run):
+    """Move users onto the shard SHARDS assigns them, including unsharded ones"""
+    if not current_app.config.get("SHARDS"):
+        raise click.UsageError("Set SHARDS to rebalance.")
+    moves = rebalance(current_app._get_current_object(), dry_run=dry_run)
+    for email, source, target in moves:
+        print(f"{email}: {'main' if source is None else source} -> {target}")
+    print(f"{'Would move' if dry_run else 'Moved'} {len(moves)} user(s).")
 
 
 if __name__ == "__main__":
-    if not os.path.exists("app.db"):
-        init_db()
-    app.run(debug=True)
\ No newline at end of file
+    app = create_app()
+    init_db(app)
+    app.run()
@@ -0,0 +1,287 @@
+"""Self-hosted, fingerprinted static assets.
+
+``flask build-assets`` compiles the Tailwind utilities used by the
+templates (when the standalone ``tailwindcss`` CLI is available), strips
+rules whose classes never appear in ``templates/``, minifies each bundle,
+and writes ``static/dist/<name>.<hash>.css`` plus ``.gz`` (and ``.br`` when
+the optional ``brotli`` package is installed) and a ``manifest.json``.
+
+Self-hosting is opt-in and needs that build step: nothing under
+``static/dist`` is committed, and until a manifest exists the templates load
+Tailwind from its CDN and Inter from Google Fonts. Fonts are self-hosted by
+adding ``static/css/fonts.css`` (``@font-face`` rules pointing at files in
+``static/fonts/``); once it is built, the pages stop loading Google Fonts.
+
+At runtime ``init_assets`` loads the manifest once and exposes two Jinja
+globals: ``asset_bundled(path)`` and ``asset_url(path)``, a
+``url_for('static')`` equivalent that resolves to the fingerprinted file.
+Fingerprinted files are served with a one-year immutable Cache-Control and
+precompressed variants are picked by ``Accept-Encoding``.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import subprocess
+
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # optional; install brotli to also emit .br files
+    brotli = None
+
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Bundle name -> source files, all relative to the static folder
+BUNDLES = {
+    "css/app.css": ["css/tailwind.css"],
+    "css/fonts.css": ["css/fonts.css"],
+    "css/style.css": ["css/style.css"],
+}
+
+_CLASS_IN_SELECTOR = re.compile(r"\.((?:\\.|[\w-])+)")
+_TEMPLATE_TOKEN = re.compile(r"[^\s\"'`<>={}]+")
+
+
+# --- CSS processing -------------------------------------------------------
+
+
+def _split_blocks(css):
+    """Split CSS into ``(prelude, body)`` pairs at nesting depth 0.
+
+    Statements without a block (``@import ...;``) have ``body`` None.
+    Comments are dropped; strings are kept intact.
+    """
+    blocks = []
+    prelude = []
+    i, n = 0, len(css)
+    while i < n:
+        char = css[i]
+        if css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        if char in "\"'":
+            end = i + 1
+            while end < n and css[end] != char:
+                end += 2 if css[end] == "\\" else 1
+            prelude.append(css[i:end + 1])
+            i = end + 1
+            continue
+        if char == ";" and "".join(prelude).strip().startswith("@"):
+            blocks.append(("".join(prelude).strip(), None))
+            prelude = []
+        elif char == "{":
+            depth, start = 1, i + 1
+            i += 1
+            while i < n and depth:
+                if css.startswith("/*", i):
+                    end = css.find("*/", i + 2)
+                    i = n if end == -1 else end + 2
+                    continue
+                if css[i] in "\"'":
+                    quote = css[i]
+                    i += 1
+                    while i < n and css[i] != quote:
+                        i += 2 if css[i] == "\\" else 1
+                elif css[i] == "{":
+                    depth += 1
+                elif css[i] == "}":
+                    depth -= 1
+                i += 1
+            blocks.append(("".join(prelude).strip(), css[start:i - 1]))
+            prelude = []
+            continue
+        else:
+            prelude.append(char)
+        i += 1
+    return blocks
+
+
+def _selector_used(selector, used_classes):
+    for part in selector.split(","):
+        classes = [re.sub(r"\\(.)", r"\1", name) for name in _CLASS_IN_SELECTOR.findall(part)]
+        if all(name in used_classes for name in classes):
+            return True
+    return False
+
+
+def _collapse(text):
+    return re.sub(r"\s+", " ", text.strip())
+
+
+def _minify_selector(selector):
+    return re.sub(r"\s*([,>+~])\s*", r"\1", _collapse(selector))
+
+
+def _minify_declarations(body):
+    declarations = []
+    for declaration in re.split(r";(?![^(]*\))", body):
+        declaration = _collapse(declaration)
+        if declaration:
+            name, _, value = declaration.partition(":")
+            declarations.append(f"{name.strip()}:{value.strip()}")
+    return ";".join(declarations)
+
+
+def _minify_nested(body):
+    """Minify the body of an at-rule such as @keyframes or @font-face."""
+    if "{" not in body:
+        return _minify_declarations(body)
+    return "".join(
+        f"{_minify_selector(prelude)}{{{_minify_declarations(inner)}}}"
+        for prelude, inner in _split_blocks(body)
+        if inner is not None
+    )
+
+
+def purge_and_minify(css, used_classes):
+    """Drop rules whose selectors need classes not in ``used_classes``, then minify."""
+    out = []
+    for prelude, body in _split_blocks(css):
+        prelude = _collapse(prelude)
+        if body is None:
+            out.append(prelude + ";")
+        elif prelude.startswith(("@media", "@supports", "@layer")):
+            inner = purge_and_minify(body, used_classes)
+            if inner:
+                out.append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith("@"):
+            out.append(f"{prelude}{{{_minify_nested(body)}}}")
+        elif _selector_used(prelude, used_classes):
+            declarations = _minify_declarations(body)
+            if declarations:
+                out.append(f"{_minify_selector(prelude)}{{{declarations}}}")
+    return "".join(out)
+
+
+def template_tokens(templates_dir):
+    """Return every class-like token appearing in the templates."""
+    tokens = set()
+    for root, _, files in os.walk(templates_dir):
+        for name in files:
+            if name.endswith(".html"):
+                with open(os.path.join(root, name), encoding="utf-8") as handle:
+                    tokens.update(_TEMPLATE_TOKEN.findall(handle.read()))
+    return tokens
+
+
+# --- Build ----------------------------------------------------------------
+
+
+def compile_tailwind(static_dir, templates_dir, tailwind_bin="tailwindcss"):
+    """Run the Tailwind CLI over the templates; return False if it is missing."""
+    executable = shutil.which(tailwind_bin)
+    if executable is None:
+        return False
+    subprocess.run(
+        [
+            executable,
+            "-i", os.path.join(static_dir, "css", "tailwind.src.css"),
+            "-o", os.path.join(static_dir, "css", "tailwind.css"),
+            "--content", os.path.join(templates_dir, "**", "*.html"),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return True
+
+
+def _write_compressed(path, data):
+    with open(path + ".gz", "wb") as handle:
+        handle.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + ".br", "wb") as handle:
+            handle.write(brotli.compress(data, quality=11))
+
+
+def build_assets(static_dir, templates_dir, bundles=None):
+    """Build every bundle whose sources exist; return the manifest written."""
+    used = template_tokens(templates_dir)
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    os.makedirs(dist_dir, exist_ok=True)
+
+    manifest = {}
+    for name, sources in (bundles or BUNDLES).items():
+        paths = [os.path.join(static_dir, source) for source in sources]
+        if not all(os.path.isfile(path) for path in paths):
+            continue
+        css = ""
+        for path in paths:
+            with open(path, encoding="utf-8") as handle:
+                css += handle.read() + "\n"
+        data = purge_and_minify(css, used).encode("utf-8")
+
+        stem, ext = os.path.splitext(os.path.basename(name))
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        filename = f"{DIST_DIR}/{stem}.{digest}{ext}"
+        output = os.path.join(static_dir, filename)
+        with open(output, "wb") as handle:
+            handle.write(data)
+        _write_compressed(output, data)
+        manifest[name] = filename
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), "w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    return manifest
+
+
+# --- Runtime --------------------------------------------------------------
+
+
+def load_manifest(static_dir):
+    """Return the build manifest, or an empty dict if assets were not built."""
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST_NAME), encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(path):
+    """``url_for('static', filename=path)``, resolved through the manifest."""
+    manifest = current_app.extensions["asset_manifest"]
+    return url_for("static", filename=manifest.get(path, path))
+
+
+def asset_bundled(path):
+    """Return True if ``path`` has a built, fingerprinted bundle."""
+    return path in current_app.extensions["asset_manifest"]
+
+
+def send_static(filename):
+    """Static view serving precompressed variants and immutable dist files."""
+    static_dir = current_app.static_folder
+    response = None
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[encoding] and os.path.isfile(
+            os.path.join(static_dir, filename + suffix)
+        ):
+            response = send_from_directory(
+                static_dir, filename + suffix, mimetype=mimetypes.guess_type(filename)[0]
+            )
+            response.headers["Content-Encoding"] = encoding
+            break
+    if response is None:
+        response = current_app.send_static_file(filename)
+
+    response.vary.add("Accept-Encoding")
+    if filename.startswith(DIST_DIR + "/"):
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    """Load the asset manifest and install the static view and Jinja helpers."""
+    app.extensions["asset_manifest"] = load_manifest(app.static_folder)
+    app.view_functions["static"] = send_static
+    app.jinja_env.globals.update(asset_url=asset_url, asset_bundled=asset_bundled)
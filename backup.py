@@ -0,0 +1,303 @@
+"""Streaming export and import of a user's habits and completion history.
+
+Both formats carry the same records: one ``habit`` record per habit
+(active and archived) followed by one ``completion`` record per completed
+day, linked by the habit id from the exporting account.
+
+* CSV: a header row of ``FIELDS``; ``type`` is "habit" or "completion".
+* NDJSON: one JSON object per line with the same keys (unused ones omitted).
+
+Exports read with ``yield_per`` and emit one chunk per batch, so memory use
+does not depend on the size of the history. Imports parse the upload as a
+stream, insert in chunks of ``IMPORT_CHUNK_SIZE`` records, commit after
+each chunk, and report bad records by line number without stopping.
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from categories import resolve_category
+from extensions import db
+from models import MAX_HABIT_NAME_LENGTH, Category, Habit, HabitCompletion, User
+from streaks import repair_counters
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+FIELDS = (
+    "type",
+    "habit_id",
+    "name",
+    "description",
+    "category",
+    "created_at",
+    "is_archived",
+    "archived_at",
+    "completed_on",
+)
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportFormatError(ValueError):
+    """Raised when an upload cannot be read as the requested format at all."""
+
+
+# --- Export ---------------------------------------------------------------
+
+
+def _records(user_id):
+    habits = db.session.execute(
+        db.select(
+            Habit.id,
+            Habit.name,
+            Habit.description,
+            Category.name,
+            Habit.created_at,
+            Habit.is_archived,
+            Habit.archived_at,
+        )
+        .outerjoin(Category, Category.id == Habit.category_id)
+        .where(Habit.user_id == user_id)
+        .order_by(Habit.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for habit_id, name, description, category, created_at, is_archived, archived_at in habits:
+        yield {
+            "type": "habit",
+            "habit_id": habit_id,
+            "name": name,
+            "description": description,
+            "category": category,
+            "created_at": created_at.isoformat() if created_at else None,
+            "is_archived": bool(is_archived),
+            "archived_at": archived_at.isoformat() if archived_at else None,
+        }
+
+    completions = db.session.execute(
+        db.select(HabitCompletion.habit_id, HabitCompletion.completed_on)
+        .join(Habit, Habit.id == HabitCompletion.habit_id)
+        .where(Habit.user_id == user_id)
+        .order_by(HabitCompletion.habit_id, HabitCompletion.completed_on)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for habit_id, completed_on in completions:
+        yield {"type": "completion", "habit_id": habit_id, "completed_on": completed_on.isoformat()}
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return value
+
+
+def export_stream(user_id, fmt="csv"):
+    """Yield ``user_id``'s habits and completions as ``fmt`` text chunks."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if fmt == "csv":
+        writer.writerow(FIELDS)
+
+    pending = 0
+    for record in _records(user_id):
+        if fmt == "csv":
+            writer.writerow([_csv_value(record.get(field)) for field in FIELDS])
+        else:
+            record = {key: value for key, value in record.items() if value is not None}
+            buffer.write(json.dumps(record) + "\n")
+        pending += 1
+        if pending >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# --- Import ---------------------------------------------------------------
+
+
+def _parse_records(stream, fmt):
+    """Yield ``(line, record_or_None, error_or_None)`` from a text stream."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        if reader.fieldnames is None or "type" not in reader.fieldnames:
+            raise ImportFormatError("CSV header must include a 'type' column")
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            yield line, None, "Invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield line, None, "Record must be a JSON object"
+            continue
+        yield line, record, None
+
+
+def _text(record, field, max_length=None):
+    value = record.get(field)
+    value = str(value).strip() if value is not None else ""
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f"'{field}' is longer than {max_length} characters")
+    return value or None
+
+
+def _datetime(record, field):
+    value = _text(record, field)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"'{field}' is not an ISO date/time") from None
+
+
+def _flag(record, field):
+    value = record.get(field)
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in ("1", "true", "yes")
+
+
+def _habit_row(user_id, record):
+    name = _text(record, "name", max_length=MAX_HABIT_NAME_LENGTH)
+    if name is None:
+        raise ValueError("'name' is required")
+    is_archived = _flag(record, "is_archived")
+    archived_at = _datetime(record, "archived_at")
+    row = {
+        "name": name,
+        "description": _text(record, "description"),
+        "created_at": _datetime(record, "created_at") or datetime.utcnow(),
+        "is_archived": is_archived,
+        "archived_at": (archived_at or datetime.utcnow()) if is_archived else None,
+        "user_id": user_id,
+    }
+    # Last, so an invalid row never creates a category
+    row["category_id"] = resolve_category(user_id, _text(record, "category"))
+    return row
+
+
+def _source_id(record):
+    value = record.get("habit_id")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError("'habit_id' must be an integer") from None
+
+
+class _Importer:
+    """Accumulates parsed records and writes them one chunk at a time."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.habit_ids = {}  # exported habit id -> new habit id
+        self.habits = []
+        self.completions = []
+        self.created = 0
+        self.completed = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def add(self, line, record):
+        kind = record.get("type")
+        try:
+            if kind == "habit":
+                self.habits.append((_source_id(record), _habit_row(self.user_id, record)))
+            elif kind == "completion":
+                completed_on = _text(record, "completed_on")
+                try:
+                    day = date.fromisoformat(completed_on or "")
+                except ValueError:
+                    raise ValueError("'completed_on' must be an ISO date") from None
+                self.completions.append((line, _source_id(record), day))
+            else:
+                raise ValueError("'type' must be 'habit' or 'completion'")
+        except ValueError as exc:
+            self.error(line, str(exc))
+            return
+        if len(self.habits) + len(self.completions) >= IMPORT_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        # Habits created or given completions by this chunk; at most
+        # IMPORT_CHUNK_SIZE ids, so their counters are repaired with one
+        # bounded IN (...) per chunk
+        touched = set()
+        if self.habits:
+            new_ids = db.session.scalars(
+                db.insert(Habit).returning(Habit.id, sort_by_parameter_order=True),
+                [row for _, row in self.habits],
+            ).all()
+            for (source_id, _), habit_id in zip(self.habits, new_ids):
+                self.habit_ids[source_id] = habit_id
+            touched.update(new_ids)
+            self.created += len(new_ids)
+            self.habits = []
+
+        rows = []
+        for line, source_id, day in self.completions:
+            habit_id = self.habit_ids.get(source_id)
+            if habit_id is None:
+                self.error(line, f"Unknown habit_id {source_id}")
+                continue
+            rows.append({"habit_id": habit_id, "user_id": self.user_id, "completed_on": day})
+            touched.add(habit_id)
+        if rows:
+            self.completed += db.session.execute(
+                db.insert(HabitCompletion.__table__).prefix_with("OR IGNORE"), rows
+            ).rowcount
+        self.completions = []
+        db.session.commit()
+        if touched:
+            repair_counters(touched)
+
+
+def import_stream(user_id, stream, fmt="csv"):
+    """Import records from a text ``stream`` for ``user_id``.
+
+    Every record becomes a new habit or completion; ids in the file only
+    link completions to habits within the same file. Each chunk is
+    committed as it is written, so a failure part-way keeps earlier chunks.
+    Returns a summary dict with per-line ``errors`` (the first
+    ``MAX_REPORTED_ERRORS``) and the total ``error_count``.
+    """
+    importer = _Importer(user_id)
+    for line, record, error in _parse_records(stream, fmt):
+        if error:
+            importer.error(line, error)
+        else:
+            importer.add(line, record)
+    importer.flush()
+
+    if importer.habit_ids:
+        User.bump_habits_version(user_id)
+        db.session.commit()
+
+    return {
+        "habits_created": importer.created,
+        "completions_created": importer.completed,
+        "error_count": importer.error_count,
+        "errors": sorted(importer.errors, key=lambda error: error["line"]),
+    }
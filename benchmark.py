@@ -0,0 +1,463 @@
+"""Latency and throughput benchmarks for the habit tracker routes.
+
+Seeds a fresh SQLite database per dataset (habit count x completion
+density), then drives each scenario through two drivers:
+
+* ``client``: the Flask test client, sequentially, in process.
+* ``server``: a threaded Werkzeug server on localhost, with ``--threads``
+  concurrent HTTP clients.
+
+For every (dataset, driver, scenario) it reports p50/p95/p99 latency,
+requests per second and SQL statements per request, and can write the
+results as a JSON baseline or compare against one::
+
+    python benchmark.py --output benchmark_baseline.json
+    python benchmark.py --sizes 10,1000 --compare benchmark_baseline.json
+
+``--compare`` exits with status 1 if any p95 is more than ``--tolerance``
+(default 25%) slower than the baseline.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app import create_app, init_db
+from extensions import db
+from models import Habit, HabitCompletion, User
+from streaks import repair_counters
+
+BENCH_EMAIL = "bench@example.com"
+HISTORY_DAYS = 30
+SEED_BATCH_SIZE = 5000
+
+# Habits, then the share of the last HISTORY_DAYS days each habit was done
+DEFAULT_SIZES = (10, 1000, 100000)
+DEFAULT_DENSITIES = (0.0, 0.5, 0.9)
+
+# Scenarios that use up one habit per request, mapped to whether the
+# throwaway habits they act on start out archived
+DISPOSABLE = {"archive_habit": False, "unarchive_habit": True, "delete_habit": False}
+
+
+# --- Datasets -------------------------------------------------------------
+
+
+def seed(habit_count, density, archived_share=0.2, rng=None):
+    """Create the benchmark user with ``habit_count`` habits and history.
+
+    Every habit is completed on each of the last ``HISTORY_DAYS`` days with
+    probability ``density``. Returns the user id.
+    """
+    rng = rng or random.Random(555)
+    user = User(email=BENCH_EMAIL)
+    db.session.add(user)
+    db.session.commit()
+
+    now = datetime.utcnow()
+    today = now.date()
+    habits = []
+    for n in range(habit_count):
+        archived = rng.random() < archived_share
+        habits.append({
+            "name": f"Habit {n}",
+            "description": f"Benchmark habit number {n}",
+            "user_id": user.id,
+            "created_at": now - timedelta(days=HISTORY_DAYS, minutes=n),
+            "is_archived": archived,
+            "archived_at": now - timedelta(minutes=n) if archived else None,
+        })
+    for start in range(0, len(habits), SEED_BATCH_SIZE):
+        db.session.execute(db.insert(Habit.__table__), habits[start:start + SEED_BATCH_SIZE])
+    db.session.commit()
+
+    if density:
+        habit_ids = db.session.scalars(db.select(Habit.id).where(Habit.user_id == user.id)).all()
+        rows = []
+        for habit_id in habit_ids:
+            for back in range(HISTORY_DAYS):
+                if rng.random() < density:
+                    rows.append({
+                        "habit_id": habit_id,
+                        "user_id": user.id,
+                        "completed_on": today - timedelta(days=back),
+                    })
+            if len(rows) >= SEED_BATCH_SIZE:
+                db.session.execute(db.insert(HabitCompletion.__table__), rows)
+                rows = []
+        if rows:
+            db.session.execute(db.insert(HabitCompletion.__table__), rows)
+        db.session.commit()
+        repair_counters()
+    return user.id
+
+
+def seed_disposable(user_id, count, archived):
+    """Add ``count`` throwaway habits for a DISPOSABLE scenario; return their ids."""
+    now = datetime.utcnow()
+    habit_ids = db.session.scalars(
+        db.insert(Habit).returning(Habit.id, sort_by_parameter_order=True),
+        [{"name": f"Disposable {n}", "user_id": user_id, "created_at": now,
+          "is_archived": archived, "archived_at": now if archived else None}
+         for n in range(count)],
+    ).all()
+    User.bump_habits_version(user_id)
+    db.session.commit()
+    return habit_ids
+
+
+def drop_habits(user_id, habit_ids):
+    """Delete what is left of a DISPOSABLE scenario's habits."""
+    db.session.execute(db.delete(Habit).where(Habit.id.in_(habit_ids)))
+    User.bump_habits_version(user_id)
+    db.session.commit()
+
+
+def build_app(db_path, page_cache=False):
+    """Return an app on a file database with the production SQLite profile."""
+    return create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "SQLITE_PROFILE": "production",
+        "SECRET_KEY": "benchmark",
+        "DEBUG": False,
+        "TESTING": False,
+        "PAGE_CACHE_SIZE": 256 if page_cache else 0,
+        "OTP_ISSUE_LIMIT": 10 ** 9,
+        # Every request comes from one address and would soon get 429s
+        "RATE_LIMITING": False,
+        # Only queue sign-in codes; the worker thread would print each one
+        "MAIL_WORKER": "none",
+    })
+
+
+class QueryCounter:
+    """Counts SQL statements executed by an engine."""
+
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+# --- Scenarios ------------------------------------------------------------
+
+
+def scenarios(habit_ids, disposable_ids):
+    """Return ``{name: request_factory}``.
+
+    A factory takes the iteration number and returns ``(method, path, body,
+    content_type)``. Complete/uncomplete alternate so history stays bounded.
+    DISPOSABLE scenarios act on habit ``disposable_ids[n]``, which the caller
+    fills before each run.
+    """
+    def toggle(n):
+        habit_id = habit_ids[(n // 2) % len(habit_ids)]
+        action = "complete" if n % 2 == 0 else "uncomplete"
+        return "POST", f"/habit-tracker/{action}/{habit_id}", None, None
+
+    return {
+        "signin_page": lambda n: ("GET", "/signin", None, None),
+        "signin_issue_otp": lambda n: (
+            "POST", "/signin", json.dumps({"email": f"otp{n}@example.com"}), "application/json"
+        ),
+        "habit_tracker": lambda n: ("GET", "/habit-tracker", None, None),
+        "habit_tracker_archived": lambda n: ("GET", "/habit-tracker/archived", None, None),
+        "habits_api": lambda n: ("GET", "/habit-tracker/api/habits", None, None),
+        "create_habit": lambda n: (
+            "POST", "/habit-tracker", f"name=Bench+{n}", "application/x-www-form-urlencoded"
+        ),
+        "complete_toggle": toggle,
+        "archive_habit": lambda n: (
+            "POST", f"/habit-tracker/archive/{disposable_ids[n]}", None, None
+        ),
+        "unarchive_habit": lambda n: (
+            "POST", f"/habit-tracker/unarchive/{disposable_ids[n]}", None, None
+        ),
+        "delete_habit": lambda n: (
+            "POST", f"/habit-tracker/delete/{disposable_ids[n]}", None, None
+        ),
+    }
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, queries):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "rps": round(count / elapsed, 1) if elapsed else 0.0,
+        "queries_per_request": round(queries / count, 2) if count else 0.0,
+    }
+
+
+# --- Drivers --------------------------------------------------------------
+
+
+def run_client(app, factory, requests, warmup):
+    """Drive one scenario sequentially through the test client."""
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["authenticated"] = True
+        sess["email"] = BENCH_EMAIL
+
+    def call(n):
+        method, path, body, content_type = factory(n)
+        response = client.open(path, method=method, data=body, content_type=content_type)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status_code}")
+
+    for n in range(warmup):
+        call(n)
+    counter = app.extensions["benchmark_queries"]
+    queries_before = counter.count
+    latencies = []
+    started = time.perf_counter()
+    for n in range(warmup, warmup + requests):
+        t0 = time.perf_counter()
+        call(n)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, counter.count - queries_before)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def _sign_in(port):
+    """Sign in over HTTP and return the session cookie."""
+    def post(payload, cookie=None):
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        headers = {"Content-Type": "application/json"}
+        if cookie:
+            headers["Cookie"] = cookie
+        connection.request("POST", "/signin", json.dumps(payload), headers)
+        response = connection.getresponse()
+        body = json.loads(response.read())
+        cookie = (response.getheader("Set-Cookie") or "").split(";", 1)[0] or cookie
+        connection.close()
+        return body, cookie
+
+    issued, cookie = post({"email": BENCH_EMAIL})
+    _, cookie = post({"email": BENCH_EMAIL, "otp": issued["otp"], "action": "verify"}, cookie)
+    return cookie
+
+
+def run_server(app, factory, requests, warmup, threads):
+    """Drive one scenario through a threaded WSGI server with ``threads`` clients."""
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    serving.start()
+    port = server.server_port
+    try:
+        cookie = _sign_in(port)
+        sequence = iter(range(warmup + requests))
+        sequence_lock = threading.Lock()
+        latencies = []
+        errors = []
+        counter = app.extensions["benchmark_queries"]
+        state = {}
+
+        def worker():
+            connection = http.client.HTTPConnection("127.0.0.1", port)
+            while True:
+                with sequence_lock:
+                    n = next(sequence, None)
+                    if n == warmup:
+                        state["queries"] = counter.count
+                        state["started"] = time.perf_counter()
+                if n is None:
+                    break
+                method, path, body, content_type = factory(n)
+                headers = {"Cookie": cookie}
+                if content_type:
+                    headers["Content-Type"] = content_type
+                t0 = time.perf_counter()
+                try:
+                    connection.request(method, path, body, headers)
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    connection = http.client.HTTPConnection("127.0.0.1", port)
+                    errors.append(path)
+                    continue
+                if response.status >= 400:
+                    errors.append(f"{method} {path} -> {response.status}")
+                if n >= warmup:
+                    latencies.append(time.perf_counter() - t0)
+            connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        if errors:
+            raise RuntimeError(f"{len(errors)} failed request(s), e.g. {errors[0]}")
+        elapsed = time.perf_counter() - state.get("started", time.perf_counter())
+        return summarize(latencies, elapsed, counter.count - state.get("queries", counter.count))
+    finally:
+        server.shutdown()
+        serving.join()
+
+
+# --- Reporting ------------------------------------------------------------
+
+
+def _key(result):
+    return result["dataset"], result["driver"], result["scenario"]
+
+
+def compare(results, baseline, tolerance):
+    """Print p95 deltas against ``baseline``; return the regressed results."""
+    previous = {_key(result): result for result in baseline.get("results", [])}
+    regressions = []
+    print(f"\n{'dataset':<12} {'driver':<7} {'scenario':<24} {'p95 ms':>9} {'base':>9} {'delta':>8}")
+    for result in results:
+        base = previous.get(_key(result))
+        if base is None or not base["p95_ms"]:
+            continue
+        delta = result["p95_ms"] / base["p95_ms"] - 1
+        flag = " !" if delta > tolerance else ""
+        if flag:
+            regressions.append(result)
+        print(
+            f"{result['dataset']:<12} {result['driver']:<7} {result['scenario']:<24} "
+            f"{result['p95_ms']:>9.2f} {base['p95_ms']:>9.2f} {delta:>+7.0%}{flag}"
+        )
+    return regressions
+
+
+def run(sizes, densities, drivers, names, requests, warmup, threads, page_cache):
+    results = []
+    for size in sizes:
+        for density in densities:
+            dataset = f"{size}h-{int(density * 100)}d"
+            with tempfile.TemporaryDirectory() as tmp:
+                app = build_app(os.path.join(tmp, "bench.db"), page_cache)
+                init_db(app)
+                with app.app_context():
+                    started = time.perf_counter()
+                    user_id = seed(size, density)
+                    seeded = time.perf_counter() - started
+                    habit_ids = db.session.scalars(
+                        db.select(Habit.id).where(Habit.user_id == user_id).limit(100)
+                    ).all()
+                    app.extensions["benchmark_queries"] = QueryCounter(db.engine)
+                print(f"# {dataset}: seeded in {seeded:.1f}s", file=sys.stderr)
+
+                disposable_ids = []
+                available = scenarios(habit_ids, disposable_ids)
+                for driver in drivers:
+                    for name in names or available:
+                        factory = available[name]
+                        if name in DISPOSABLE:
+                            with app.app_context():
+                                disposable_ids[:] = seed_disposable(
+                                    user_id, warmup + requests, DISPOSABLE[name]
+                                )
+                        if driver == "client":
+                            stats = run_client(app, factory, requests, warmup)
+                        else:
+                            stats = run_server(app, factory, requests, warmup, threads)
+                        if name in DISPOSABLE:
+                            with app.app_context():
+                                drop_habits(user_id, disposable_ids)
+                        result = {"dataset": dataset, "habits": size, "density": density,
+                                  "driver": driver, "scenario": name, **stats}
+                        results.append(result)
+                        print(
+                            f"{dataset:<12} {driver:<7} {name:<24} p50 {stats['p50_ms']:>8.2f} "
+                            f"p95 {stats['p95_ms']:>8.2f} p99 {stats['p99_ms']:>8.2f} ms "
+                            f"{stats['rps']:>8.1f} rps {stats['queries_per_request']:>6.2f} q/req"
+                        )
+                with app.app_context():
+                    db.session.remove()
+                    db.engine.dispose()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated habit counts (e.g. 10,1000 for a quick run)")
+    parser.add_argument("--densities", default=",".join(map(str, DEFAULT_DENSITIES)),
+                        help="comma-separated completion densities between 0 and 1")
+    parser.add_argument("--drivers", default="client,server", help="client, server or both")
+    parser.add_argument("--scenarios", default="", help="comma-separated subset of scenarios")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=8, help="concurrent clients for the server driver")
+    parser.add_argument("--page-cache", action="store_true", help="enable the rendered-page cache")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare p95 against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = run(
+        sizes=[int(size) for size in args.sizes.split(",")],
+        densities=[float(density) for density in args.densities.split(",")],
+        drivers=args.drivers.split(","),
+        names=[name for name in args.scenarios.split(",") if name],
+        requests=args.requests,
+        warmup=args.warmup,
+        threads=args.threads,
+        page_cache=args.page_cache,
+    )
+
+    if args.output:
+        report = {
+            "meta": {
+                "created": datetime.utcnow().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "requests": args.requests,
+                "threads": args.threads,
+                "page_cache": args.page_cache,
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+            handle.write("\n")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            regressions = compare(results, json.load(handle), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} scenario(s) regressed beyond {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
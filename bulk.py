@@ -0,0 +1,125 @@
+"""Batch habit operations applied with set-based statements.
+
+``apply_operations`` takes the operation list posted to
+``/habit-tracker/bulk`` and turns it into one category lookup (plus one
+INSERT for new categories), at most one habit INSERT, one ownership SELECT,
+and one UPDATE/DELETE per operation type, all inside the caller's
+transaction. Operations are applied grouped by type in the order
+create, archive, unarchive, delete.
+"""
+
+from datetime import datetime
+
+from categories import resolve_categories
+from extensions import db
+from models import MAX_HABIT_NAME_LENGTH, Habit, HabitCompletion
+from schedules import reschedule
+
+MAX_OPERATIONS = 1000
+
+OPERATIONS = ("create", "archive", "unarchive", "delete")
+
+
+class BulkRequestError(ValueError):
+    """Raised when the request as a whole is malformed."""
+
+
+def _result(index, op, habit_id=None, error=None):
+    result = {"index": index, "op": op, "id": habit_id, "success": error is None}
+    if error:
+        result["error"] = error
+    return result
+
+
+def apply_operations(user_id, operations):
+    """Apply ``operations`` for ``user_id`` and return per-item results.
+
+    Each operation is a dict with an ``op`` of ``create`` (``name``,
+    optional ``description``/``category``) or ``archive``/``unarchive``/
+    ``delete`` (``id``). Invalid items and habits the user does not own are
+    reported as failures without affecting the rest of the batch. The
+    caller commits.
+    """
+    if not isinstance(operations, list):
+        raise BulkRequestError("'operations' must be a list")
+    if len(operations) > MAX_OPERATIONS:
+        raise BulkRequestError(f"At most {MAX_OPERATIONS} operations per request")
+
+    results = [None] * len(operations)
+    creates = []
+    categories = []
+    targets = {op: [] for op in OPERATIONS if op != "create"}
+
+    for index, item in enumerate(operations):
+        op = item.get("op") if isinstance(item, dict) else None
+        if op not in OPERATIONS:
+            results[index] = _result(index, op, error="Unknown operation")
+        elif op == "create":
+            name = str(item.get("name") or "").strip()
+            if not name:
+                results[index] = _result(index, op, error="Name is required")
+                continue
+            if len(name) > MAX_HABIT_NAME_LENGTH:
+                results[index] = _result(
+                    index, op, error=f"Name is longer than {MAX_HABIT_NAME_LENGTH} characters"
+                )
+                continue
+            creates.append((index, {
+                "name": name,
+                "description": str(item.get("description") or "").strip() or None,
+                "user_id": user_id,
+            }))
+            categories.append(str(item.get("category") or ""))
+        else:
+            habit_id = item.get("id")
+            if not isinstance(habit_id, int) or isinstance(habit_id, bool):
+                results[index] = _result(index, op, error="Habit id must be an integer")
+                continue
+            targets[op].append((index, habit_id))
+
+    if creates:
+        category_ids = resolve_categories(user_id, categories)
+        for (_, row), category in zip(creates, categories):
+            row["category_id"] = category_ids[category]
+        new_ids = db.session.scalars(
+            db.insert(Habit).returning(Habit.id, sort_by_parameter_order=True),
+            [row for _, row in creates],
+        ).all()
+        for (index, _), habit_id in zip(creates, new_ids):
+            results[index] = _result(index, "create", habit_id)
+
+    requested = {habit_id for items in targets.values() for _, habit_id in items}
+    owned = set()
+    if requested:
+        owned = set(db.session.scalars(
+            db.select(Habit.id).where(Habit.user_id == user_id, Habit.id.in_(requested))
+        ))
+
+    now = datetime.utcnow()
+    for op, items in targets.items():
+        ids = {habit_id for _, habit_id in items if habit_id in owned}
+        for index, habit_id in items:
+            error = None if habit_id in owned else "Habit not found"
+            results[index] = _result(index, op, habit_id, error)
+        if not ids:
+            continue
+
+        if op == "archive":
+            values = {"is_archived": True, "archived_at": now}
+        elif op == "unarchive":
+            values = {"is_archived": False, "archived_at": None}
+        else:
+            db.session.execute(
+                db.delete(HabitCompletion).where(HabitCompletion.habit_id.in_(ids))
+            )
+            db.session.execute(
+                db.delete(Habit).where(Habit.user_id == user_id, Habit.id.in_(ids))
+            )
+            continue
+        db.session.execute(
+            db.update(Habit).where(Habit.user_id == user_id, Habit.id.in_(ids)).values(**values)
+        )
+        if op == "unarchive":
+            reschedule(ids, now)
+
+    return results
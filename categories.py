@@ -0,0 +1,164 @@
+"""Habit categories: a global catalog plus per-user custom entries.
+
+Global categories have ``user_id`` NULL and are seeded from
+``DEFAULT_CATEGORIES``; anything typed into "Other" becomes a category
+owned by that user. Habits point at a category through the indexed
+``Habit.category_id``.
+
+``user_categories`` is served from ``CategoryCache``, a per-process LRU of
+user id to that user's category list. Entries are tagged with the user's
+``habits_version`` (every habit write bumps it, see ``User``), so a list
+cached by one worker is reloaded once any worker changes the user's
+habits, and ``resolve_categories`` drops the entry in this process as soon
+as it creates a category (and again if that transaction rolls back).
+"""
+
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from lru import LruCache
+from models import Category, User
+
+DEFAULT_CATEGORIES = [
+    "Health", "Fitness", "Study", "Productivity",
+    "Mindfulness", "Finance", "Social", "Chores",
+]
+
+MAX_NAME_LENGTH = 60
+
+# session.info key: users whose cached lists may include uncommitted categories
+NEW_CATEGORY_USERS = "new_category_users"
+
+CategoryOption = namedtuple("CategoryOption", ["id", "name", "is_custom"])
+
+
+class CategoryCache(LruCache):
+    """LRU of ``{user_id: (version, options)}`` for ``max_entries`` users."""
+
+    def __init__(self, max_entries=10000):
+        super().__init__(max_entries)
+
+    def get(self, user_id, version):
+        entry = super().get(user_id)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def set(self, user_id, version, options):
+        super().set(user_id, (version, options))
+
+    def invalidate(self, user_id):
+        self.discard(user_id)
+
+
+def init_category_cache(app):
+    """Attach a CategoryCache sized by ``CATEGORY_CACHE_SIZE`` (0 disables it)."""
+    app.extensions["category_cache"] = CategoryCache(app.config.get("CATEGORY_CACHE_SIZE", 10000))
+
+
+def ensure_default_categories():
+    """Insert any ``DEFAULT_CATEGORIES`` missing from the global catalog.
+
+    Returns the number of categories added; the caller commits.
+    """
+    existing = set(db.session.scalars(
+        db.select(Category.name).where(Category.user_id.is_(None))
+    ))
+    missing = [{"name": name, "user_id": None} for name in DEFAULT_CATEGORIES if name not in existing]
+    if missing:
+        db.session.execute(db.insert(Category), missing)
+    return len(missing)
+
+
+def user_categories(user_id):
+    """Return the global and ``user_id``'s own categories, globals first."""
+    cache = current_app.extensions["category_cache"]
+    version = db.session.execute(
+        db.select(User.habits_version).where(User.id == user_id)
+    ).scalar() or 0
+    options = cache.get(user_id, version)
+    if options is None:
+        rows = db.session.execute(
+            db.select(Category.id, Category.name, Category.user_id)
+            .where(db.or_(Category.user_id.is_(None), Category.user_id == user_id))
+            .order_by(Category.user_id.is_not(None), Category.id)
+        )
+        options = tuple(
+            CategoryOption(id=category_id, name=name, is_custom=owner is not None)
+            for category_id, name, owner in rows
+        )
+        cache.set(user_id, version, options)
+    return options
+
+
+def find_category(user_id, name):
+    """Return the id of ``user_id``'s category called ``name`` (any case), or None."""
+    key = name.strip().casefold()
+    for option in user_categories(user_id):
+        if option.name.casefold() == key:
+            return option.id
+    return None
+
+
+def _clean_name(name):
+    return (name or "").strip()[:MAX_NAME_LENGTH]
+
+
+def resolve_categories(user_id, names):
+    """Return ``{name: category_id}`` for every entry of ``names``.
+
+    Empty names map to None. Matching is case-insensitive and global
+    categories win over custom ones. Missing names become custom
+    categories, inserted with one statement inside the caller's
+    transaction (so a rollback discards them); the caller commits.
+    """
+    wanted = {}
+    for name in names:
+        cleaned = _clean_name(name)
+        if cleaned:
+            wanted.setdefault(cleaned.casefold(), cleaned)
+
+    ids = {}
+    if wanted:
+        for option in user_categories(user_id):
+            ids.setdefault(option.name.casefold(), option.id)
+        missing = [name for key, name in wanted.items() if key not in ids]
+        if missing:
+            # DO NOTHING: another request may have created one of them first
+            db.session.execute(
+                sqlite_insert(Category).on_conflict_do_nothing(),
+                [{"user_id": user_id, "name": name} for name in missing],
+            )
+            rows = db.session.execute(
+                db.select(Category.id, Category.name)
+                .where(Category.user_id == user_id, Category.name.in_(missing))
+            )
+            for category_id, name in rows:
+                ids[name.casefold()] = category_id
+            current_app.extensions["category_cache"].invalidate(user_id)
+            db.session.info.setdefault(NEW_CATEGORY_USERS, set()).add(user_id)
+
+    return {name: ids.get(_clean_name(name).casefold()) for name in names}
+
+
+def resolve_category(user_id, name):
+    """Return the category id for ``name``; see ``resolve_categories``."""
+    return resolve_categories(user_id, [name])[name]
+
+
+@event.listens_for(db.session, "after_commit")
+def _forget_new_categories(session):
+    session.info.pop(NEW_CATEGORY_USERS, None)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _uncache_rolled_back_categories(session):
+    user_ids = session.info.pop(NEW_CATEGORY_USERS, ())
+    cache = current_app.extensions.get("category_cache") if has_app_context() else None
+    if cache is not None:
+        for user_id in user_ids:
+            cache.invalidate(user_id)
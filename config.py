@@ -0,0 +1,120 @@
+"""Configuration classes for ``create_app``.
+
+The class is picked by the ``APP_ENV`` environment variable
+("development", "production" or "testing"). Any setting can then be
+overridden from the environment with a ``FLASK_`` prefix, e.g.
+``FLASK_SECRET_KEY`` or ``FLASK_SQLALCHEMY_DATABASE_URI``; values are
+parsed as JSON where possible (see ``Flask.config.from_prefixed_env``).
+"""
+
+import os
+
+DEV_SECRET_KEY = "dev-secret-key-change-in-production"
+
+
+class Config:
+    SECRET_KEY = DEV_SECRET_KEY
+    SQLALCHEMY_DATABASE_URI = "sqlite:///app.db"
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # "memory" (per process) or "sql" (shared by all workers through app.db)
+    OTP_STORE = "memory"
+    # Sign-in emails go through a queue in app.db; see mailer.py.
+    # "console" prints them, "smtp" sends them to MAIL_SERVER
+    MAIL_TRANSPORT = "console"
+    MAIL_SERVER = "localhost"
+    MAIL_PORT = 25
+    MAIL_USE_TLS = False
+    MAIL_USERNAME = None
+    MAIL_PASSWORD = None
+    MAIL_SENDER = "no-reply@localhost"
+    # "thread": a worker thread per app process; "none": run `flask deliver-mail`
+    MAIL_WORKER = "thread"
+    MAIL_BATCH_SIZE = 50
+    MAIL_MAX_ATTEMPTS = 5
+    MAIL_RETRY_BASE_SECONDS = 30
+    MAIL_RETRY_MAX_SECONDS = 3600
+    # `flask send-reminders`: habits per batch, and how late a reminder may
+    # still go out (older ones are skipped, e.g. after downtime)
+    REMINDER_BATCH_SIZE = 500
+    REMINDER_GRACE_SECONDS = 3600
+    # Server-Sent Events at /habit-tracker/api/stream; see live.py. LIVE_HUB is
+    # "local" (one process) or "sql" (poll habit_change to hear other workers)
+    LIVE_HUB = "local"
+    LIVE_POLL_SECONDS = 1.0
+    LIVE_HEARTBEAT_SECONDS = 15
+    LIVE_MAX_SECONDS = 300
+    # Spread users over this many SQLite files (0: everything in the main
+    # database); see sharding.py. SHARD_DATABASE_URI is a template with {index}
+    SHARDS = 0
+    SHARD_DATABASE_URI = None
+    # Token buckets for POST/PUT/PATCH/DELETE, answered with 429 when empty;
+    # see ratelimit.py. "*" covers endpoints without their own entry.
+    # RATE_LIMIT_STORE is "memory" (per process) or "sql" (shared; see
+    # ProductionConfig for the cost)
+    RATE_LIMITING = True
+    RATE_LIMIT_STORE = "memory"
+    RATE_LIMIT_MAX_BUCKETS = 100000
+    RATE_LIMITS = {
+        "main.signin": {"ip": "20/minute", "email": "5/minute"},
+        "*": {"ip": "300/minute", "email": "120/minute"},
+    }
+    # WAL, tuned pragmas and a connection pool; see SQLITE_PROFILES in extensions.py
+    SQLITE_PROFILE = "production"
+    # Rendered habit pages kept per process, keyed by (user, version); 0 disables
+    PAGE_CACHE_SIZE = 256
+    # Users whose category lists are kept per process (LRU); 0 disables
+    CATEGORY_CACHE_SIZE = 10000
+    # Standalone Tailwind CLI used by `flask build-assets`
+    TAILWIND_BIN = "tailwindcss"
+    # Per-request SQL/render/session timings, Server-Timing and /metrics; see instrumentation.py
+    INSTRUMENTATION = False
+    # Statements at least this slow are sampled into the perf log and /metrics
+    SLOW_QUERY_MS = 100
+    # Log requests over their query budget or repeating a statement; see query_budget.py
+    QUERY_WARNINGS = False
+    QUERY_BUDGET = 20
+    # Per-endpoint overrides of QUERY_BUDGET, e.g. {"main.habit_tracker": 10}
+    QUERY_BUDGETS = {}
+    QUERY_REPEAT_THRESHOLD = 3
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    QUERY_WARNINGS = True
+
+
+class ProductionConfig(Config):
+    # Must come from FLASK_SECRET_KEY; create_app refuses to start without it
+    SECRET_KEY = None
+    # Several preforked workers cannot share a per-process OTP store
+    OTP_STORE = "sql"
+    # Rate-limit buckets stay per worker (RATE_LIMIT_STORE = "memory"), so each
+    # worker allows the full limit. "sql" shares them, but costs an upsert and
+    # a commit on the main database per mutating request, behind SQLite's
+    # single writer lock
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    SQLITE_PROFILE = "default"
+    # Tests deliver explicitly with MailQueue.deliver_pending
+    MAIL_WORKER = "none"
+    # Tests that need it turn it on (see test_ratelimit.py)
+    RATE_LIMITING = False
+
+
+CONFIGS = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+    "testing": TestingConfig,
+}
+
+
+def config_from_env():
+    """Return the config class named by ``APP_ENV`` (default "development")."""
+    name = os.environ.get("APP_ENV", "development")
+    try:
+        return CONFIGS[name]
+    except KeyError:
+        raise ValueError(f"Unknown APP_ENV: {name!r}") from None
@@ -1,3 +1,135 @@
+from contextvars import ContextVar
+from functools import partial
+
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.util import find_tables
+
+# Shard the current request or task works on (see sharding.py); None means
+# the main database, which is all there is unless SHARDS is set
+current_shard = ContextVar("current_shard", default=None)
+
+# Tables that stay in the main database when sharded: they are looked up
+# before the user's shard is known, or read by workers serving every shard
+SHARED_TABLES = frozenset({"user_shard", "otp_code", "outbound_message", "rate_limit_bucket"})
+
+
+def shard_bind_key(index):
+    """Return the SQLALCHEMY_BINDS key of shard ``index``."""
+    return f"shard{index}"
+
+
+def _touches_shared_table(mapper, clause):
+    if mapper is not None:
+        return inspect(mapper).local_table.name in SHARED_TABLES
+    if clause is not None:
+        return any(table.name in SHARED_TABLES
+                   for table in find_tables(clause, include_crud=True))
+    return False
+
+
+class RoutingSession(Session):
+    """Session that sends per-user tables to the engine of ``current_shard``.
+
+    With no shard selected it behaves exactly like Flask-SQLAlchemy's
+    session, so an unsharded app pays nothing for it.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = current_shard.get()
+        if bind is None and shard is not None and not _touches_shared_table(mapper, clause):
+            return self._db.engines[shard_bind_key(shard)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Named SQLite tuning profiles, selected with app.config["SQLITE_PROFILE"].
+# "pragmas" run on every new DB-API connection; "engine_options" are passed
+# to create_engine for file databases (in-memory databases keep the
+# single-connection pool Flask-SQLAlchemy picks for them).
+SQLITE_PROFILES = {
+    "default": {
+        "pragmas": {},
+        "engine_options": {},
+    },
+    "production": {
+        "pragmas": {
+            # Readers no longer block on the writer, and commits append to
+            # the WAL instead of rewriting pages under an exclusive lock.
+            "journal_mode": "WAL",
+            # Durable across application crashes; only an OS crash can
+            # lose the last transactions, which WAL makes safe to trade.
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+            "cache_size": -65536,  # KiB, i.e. 64 MiB page cache per connection
+            "mmap_size": 268435456,
+            "temp_store": "MEMORY",
+            "foreign_keys": "ON",
+        },
+        "engine_options": {
+            "pool_size": 10,
+            "max_overflow": 20,
+            "pool_timeout": 30,
+            "connect_args": {"check_same_thread": False},
+        },
+    },
+}
+
+
+def _set_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+
+def _is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _engine_options(profile, configured):
+    options = dict(profile["engine_options"])
+    connect_args = {**options.get("connect_args", {}), **configured.get("connect_args", {})}
+    options.update(configured)
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+
+def init_db_engine(app):
+    """Initialise ``db`` for ``app`` using its SQLite engine profile.
+
+    Reads ``SQLITE_PROFILE`` (default "default") and optional overrides in
+    ``SQLITE_PRAGMAS``. Explicit ``SQLALCHEMY_ENGINE_OPTIONS`` win over the
+    profile's engine options. SQLite files in ``SQLALCHEMY_BINDS`` (such as
+    shards) get the same options as the main database.
+    """
+    profile = SQLITE_PROFILES[app.config.get("SQLITE_PROFILE", "default")]
+    pragmas = {**profile["pragmas"], **app.config.get("SQLITE_PRAGMAS", {})}
+    configured = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+
+    uri = app.config.get("SQLALCHEMY_DATABASE_URI", "sqlite://")
+    if _is_sqlite_file(uri):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = _engine_options(profile, configured)
+
+    binds = app.config.get("SQLALCHEMY_BINDS", {})
+    for key, bind in binds.items():
+        if isinstance(bind, str) and _is_sqlite_file(bind):
+            binds[key] = {"url": bind, **_engine_options(profile, configured)}
+
+    db.init_app(app)
+    # Shards use the main metadata (see sharding.py); drop the empty ones made
+    # for their bind keys so db.create_all() only ever means the main database
+    for index in range(app.config.get("SHARDS", 0)):
+        db.metadatas.pop(shard_bind_key(index), None)
 
-db = SQLAlchemy()
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == "sqlite" and pragmas:
+                event.listen(engine, "connect", partial(_set_pragmas, pragmas))
@@ -0,0 +1,77 @@
+"""Conditional GET support for the per-user habit pages.
+
+Every habit mutation bumps ``User.habits_version``. A habit page is fully
+determined by (user, version, URL, today's date, asset manifest), so that
+tuple becomes a strong ETag. A matching ``If-None-Match`` (or a fresh
+``If-Modified-Since``) is answered with 304 before any habit is loaded or
+any template rendered.
+A miss can still be served from ``PageCache``, a bounded per-process LRU of
+rendered bodies keyed by the same tuple. Old versions are never looked up
+again and simply age out.
+"""
+
+import hashlib
+from datetime import datetime, time, timedelta
+
+from flask import current_app, make_response, request
+from werkzeug.http import is_resource_modified
+
+from extensions import db
+from lru import LruCache
+from models import User
+
+
+class PageCache(LruCache):
+    """LRU of rendered response bodies keyed by the ETag tuple."""
+
+    def __init__(self, max_entries=256):
+        super().__init__(max_entries)
+
+
+def init_page_cache(app):
+    """Attach a PageCache sized by ``PAGE_CACHE_SIZE`` (0 disables it)."""
+    app.extensions["page_cache"] = PageCache(app.config.get("PAGE_CACHE_SIZE", 256))
+
+
+def conditional_response(user_id, today, render, mimetype="text/html"):
+    """Return a 304 or a (possibly cached) rendered response for a habit view.
+
+    ``render`` is called with no arguments only when neither the client nor
+    the page cache has the current version of the page.
+    """
+    version, updated_at = db.session.execute(
+        db.select(User.habits_version, User.habits_updated_at).where(User.id == user_id)
+    ).first() or (0, None)
+
+    # A deploy that rebuilds the CSS bundles changes the URLs in the page
+    assets = tuple(sorted(current_app.extensions.get("asset_manifest", {}).items()))
+    key = (user_id, version, request.full_path, today.isoformat(), assets)
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()
+    # The page also changes at midnight (streaks, "this week"), so it is
+    # never older than the start of today.
+    last_modified = max(updated_at or datetime.min, datetime.combine(today, time.min))
+    # HTTP dates have whole-second resolution: round up, and don't advertise
+    # a second that isn't over yet, since another change could still share it
+    if last_modified.microsecond:
+        last_modified = last_modified.replace(microsecond=0) + timedelta(seconds=1)
+    if last_modified > datetime.utcnow():
+        last_modified = None
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response("", 304)
+    else:
+        cache = current_app.extensions["page_cache"]
+        body = cache.get(key)
+        if body is None:
+            body = render()
+            cache.set(key, body)
+        response = make_response(body)
+        response.mimetype = mimetype
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Cacheable by the browser only, and always revalidated
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
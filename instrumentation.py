@@ -0,0 +1,320 @@
+"""Opt-in per-request performance instrumentation.
+
+Enabled with ``INSTRUMENTATION = True``. ``init_instrumentation`` then
+hooks:
+
+* SQLAlchemy ``before/after_cursor_execute`` to count statements, sum SQL
+  time and sample statements slower than ``SLOW_QUERY_MS``;
+* Flask's ``before_render_template``/``template_rendered`` signals for
+  render time and a wrapper around the session interface for session
+  load/save time;
+* ``request_started``/``request_finished`` to add a ``Server-Timing``
+  header, log one JSON line per request to the ``habits.perf`` logger, and
+  feed the histograms served at ``/metrics`` in Prometheus text format.
+
+When disabled nothing is registered, so requests pay nothing. Per-request
+state lives in a ContextVar, so threaded servers keep requests apart.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from flask import (
+    before_render_template,
+    request,
+    request_finished,
+    request_started,
+    request_tearing_down,
+    template_rendered,
+)
+from sqlalchemy import event
+
+from extensions import db
+
+logger = logging.getLogger("habits.perf")
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+SLOW_QUERY_SAMPLES = 50
+_STATEMENT_PREVIEW = 200
+_SESSION_OPEN_KEY = "instrumentation.session_open"
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """Timings collected for one request."""
+
+    __slots__ = ("started", "queries", "db_time", "render_time", "session_time",
+                 "slow_queries", "render_started", "token")
+
+    def __init__(self, started):
+        self.started = started
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.session_time = 0.0
+        self.slow_queries = []
+        self.render_started = None
+        self.token = None
+
+
+# --- Prometheus registry --------------------------------------------------
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values."""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, label_values, value):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            labels = _labels(self.labels, label_values)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by label values."""
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._series = {}
+
+    def inc(self, label_values, amount=1):
+        self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{{{_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+def _labels(names, values):
+    return ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+
+
+class MetricsRegistry:
+    """The histograms and counters behind ``/metrics``, plus slow-query samples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.duration = Histogram(
+            "habits_request_duration_seconds", "Request latency.", ("endpoint", "method"),
+            SECONDS_BUCKETS,
+        )
+        self.db_time = Histogram(
+            "habits_request_db_seconds", "SQL time per request.", ("endpoint",), SECONDS_BUCKETS,
+        )
+        self.render_time = Histogram(
+            "habits_request_render_seconds", "Template render time per request.", ("endpoint",),
+            SECONDS_BUCKETS,
+        )
+        self.queries = Histogram(
+            "habits_request_queries", "SQL statements per request.", ("endpoint",), QUERY_BUCKETS,
+        )
+        self.responses = Counter(
+            "habits_responses_total", "Responses by status code.", ("endpoint", "status"),
+        )
+        self.slow_queries = Counter(
+            "habits_slow_queries_total", "Statements slower than SLOW_QUERY_MS.", ("endpoint",),
+        )
+        self.slow_samples = deque(maxlen=SLOW_QUERY_SAMPLES)
+
+    def record(self, endpoint, method, status, metrics, duration):
+        with self._lock:
+            self.duration.observe((endpoint, method), duration)
+            self.db_time.observe((endpoint,), metrics.db_time)
+            self.render_time.observe((endpoint,), metrics.render_time)
+            self.queries.observe((endpoint,), metrics.queries)
+            self.responses.inc((endpoint, status))
+            if metrics.slow_queries:
+                self.slow_queries.inc((endpoint,), len(metrics.slow_queries))
+                self.slow_samples.extend(
+                    dict(sample, endpoint=endpoint) for sample in metrics.slow_queries
+                )
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.duration, self.db_time, self.render_time, self.queries,
+                           self.responses, self.slow_queries):
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# --- Hooks ----------------------------------------------------------------
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("instrumentation_started", []).append(time.perf_counter())
+
+
+def _make_after_cursor_execute(slow_seconds):
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        metrics = _current.get()
+        starts = conn.info.get("instrumentation_started")
+        if metrics is None or not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        metrics.queries += 1
+        metrics.db_time += elapsed
+        if elapsed >= slow_seconds:
+            metrics.slow_queries.append({
+                "statement": " ".join(statement.split())[:_STATEMENT_PREVIEW],
+                "ms": round(elapsed * 1000, 3),
+            })
+    return _after_cursor_execute
+
+
+class TimedSessionInterface:
+    """Wraps a session interface to time loading and saving the session."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def open_session(self, app, request):
+        started = time.perf_counter()
+        try:
+            return self.inner.open_session(app, request)
+        finally:
+            # Runs before request_started; picked up there
+            request.environ[_SESSION_OPEN_KEY] = time.perf_counter() - started
+
+    def save_session(self, app, session, response):
+        started = time.perf_counter()
+        try:
+            return self.inner.save_session(app, session, response)
+        finally:
+            metrics = _current.get()
+            if metrics is not None:
+                metrics.session_time += time.perf_counter() - started
+
+
+def _on_request_started(sender, **extra):
+    metrics = RequestMetrics(time.perf_counter())
+    metrics.session_time = request.environ.get(_SESSION_OPEN_KEY, 0.0)
+    metrics.token = _current.set(metrics)
+
+
+def _on_before_render(sender, template, context, **extra):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.render_started = time.perf_counter()
+
+
+def _on_template_rendered(sender, template, context, **extra):
+    metrics = _current.get()
+    if metrics is not None and metrics.render_started is not None:
+        metrics.render_time += time.perf_counter() - metrics.render_started
+        metrics.render_started = None
+
+
+def server_timing(metrics, duration):
+    """Format ``metrics`` as a Server-Timing header value (milliseconds)."""
+    return ", ".join([
+        f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"',
+        f"render;dur={metrics.render_time * 1000:.2f}",
+        f"session;dur={metrics.session_time * 1000:.2f}",
+        f"total;dur={duration * 1000:.2f}",
+    ])
+
+
+def _on_request_finished(sender, response, **extra):
+    metrics = _current.get()
+    if metrics is None:
+        return
+    duration = time.perf_counter() - metrics.started
+    endpoint = request.endpoint or "unmatched"
+    response.headers["Server-Timing"] = server_timing(metrics, duration)
+    sender.extensions["metrics"].record(
+        endpoint, request.method, response.status_code, metrics, duration
+    )
+    logger.info(json.dumps({
+        "method": request.method,
+        "path": request.path,
+        "endpoint": endpoint,
+        "status": response.status_code,
+        "duration_ms": round(duration * 1000, 3),
+        "db_ms": round(metrics.db_time * 1000, 3),
+        "queries": metrics.queries,
+        "render_ms": round(metrics.render_time * 1000, 3),
+        "session_ms": round(metrics.session_time * 1000, 3),
+        "slow_queries": metrics.slow_queries,
+    }))
+
+
+def _on_request_tearing_down(sender, **extra):
+    metrics = _current.get()
+    if metrics is not None and metrics.token is not None:
+        _current.reset(metrics.token)
+
+
+def metrics_view():
+    """Prometheus text exposition of the collected histograms"""
+    from flask import current_app
+
+    return current_app.response_class(
+        current_app.extensions["metrics"].render(),
+        mimetype="text/plain; version=0.0.4",
+    )
+
+
+def init_instrumentation(app):
+    """Install the hooks and ``/metrics`` if ``INSTRUMENTATION`` is enabled.
+
+    Returns True if instrumentation was installed.
+    """
+    if not app.config.get("INSTRUMENTATION"):
+        return False
+
+    slow_seconds = app.config.get("SLOW_QUERY_MS", 100) / 1000
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _make_after_cursor_execute(slow_seconds))
+
+    app.session_interface = TimedSessionInterface(app.session_interface)
+    app.extensions["metrics"] = MetricsRegistry()
+    request_started.connect(_on_request_started, app)
+    before_render_template.connect(_on_before_render, app)
+    template_rendered.connect(_on_template_rendered, app)
+    request_finished.connect(_on_request_finished, app)
+    request_tearing_down.connect(_on_request_tearing_down, app)
+    app.add_url_rule(app.config.get("METRICS_PATH", "/metrics"), "metrics", metrics_view)
+    return True
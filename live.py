@@ -0,0 +1,238 @@
+"""Live habit list updates over Server-Sent Events.
+
+``GET /habit-tracker/api/stream`` keeps a response open and pushes an
+``event: changes`` whenever the user's habits change. The payload is the
+same diff as ``GET /habit-tracker/api/sync`` (changed habits plus
+tombstones since the client's version), and the event id is the sync
+version, so a reconnecting ``EventSource`` resumes from ``Last-Event-ID``
+without missing anything. An idle stream sends a comment every
+``LIVE_HEARTBEAT_SECONDS`` to keep proxies from closing it, and ends after
+``LIVE_MAX_SECONDS`` so the browser reconnects and no response lives
+forever.
+
+Streams don't poll. Each one waits on its own subscription in a hub, and
+``User.bump_habits_version`` marks the user so that committing the session
+notifies their subscriptions. An idle connection therefore costs one
+blocked wait and a set entry. The hub uses only ``threading`` primitives,
+which gevent/eventlet patch, so under ``gunicorn -k gevent`` each stream
+is a greenlet rather than an OS thread.
+
+Hubs are swappable through ``LIVE_HUB``:
+
+- "local": in-process only; enough for a single worker.
+- "sql": also polls the ``habit_change`` log once per ``LIVE_POLL_SECONDS``
+  per process, so changes committed by any worker reach every worker's
+  streams.
+
+A hub for another backend (e.g. Redis pub/sub) only needs to call
+``notify(user_id)`` for changes it hears about.
+"""
+
+import json
+import logging
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from extensions import db
+from models import CHANGED_USERS, HabitChange
+from sharding import shard_indexes, use_shard
+from sync import changes_since, current_version
+
+logger = logging.getLogger("habits.live")
+
+
+class Subscription:
+    """One open stream's mailbox; ``wait`` returns True once notified."""
+
+    __slots__ = ("user_id", "_event")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._event = threading.Event()
+
+    def notify(self):
+        self._event.set()
+
+    def wait(self, timeout):
+        notified = self._event.wait(timeout)
+        self._event.clear()
+        return notified
+
+
+class LocalHub:
+    """In-process fan-out from user ids to their open streams."""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.user_id]
+
+    def notify(self, user_id):
+        """Wake every stream of ``user_id`` in this process."""
+        with self._lock:
+            subscribers = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.notify()
+
+    def publish(self, user_ids):
+        """Announce that ``user_ids``' habits changed (called after commit)."""
+        for user_id in user_ids:
+            self.notify(user_id)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscriptions.values())
+
+
+class SqlPollingHub(LocalHub):
+    """LocalHub that also picks up other workers' changes from ``habit_change``.
+
+    One poller thread per process reads the users with rows above the last
+    version it saw (on each shard, if sharded), whatever the number of open
+    streams.
+    """
+
+    def __init__(self, app, poll_interval=1.0):
+        super().__init__()
+        self.app = app
+        self.poll_interval = poll_interval
+        self._last_versions = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self, user_id):
+        self.start()
+        return super().subscribe(user_id)
+
+    def _poll_shard(self, shard):
+        last = self._last_versions.get(shard)
+        if last is None:
+            self._last_versions[shard] = db.session.scalar(
+                db.select(db.func.max(HabitChange.id))
+            ) or 0
+            return 0
+        rows = db.session.execute(
+            db.select(HabitChange.user_id, db.func.max(HabitChange.id))
+            .where(HabitChange.id > last)
+            .group_by(HabitChange.user_id)
+        ).all()
+        for user_id, version in rows:
+            self._last_versions[shard] = max(self._last_versions[shard], version)
+            self.notify(user_id)
+        return len(rows)
+
+    def poll(self):
+        """Notify users with changes since the last poll; return how many."""
+        notified = 0
+        for shard in shard_indexes(self.app):
+            with use_shard(shard):
+                notified += self._poll_shard(shard)
+        return notified
+
+    def run(self):
+        while not self._stop.wait(self.poll_interval):
+            with self.app.app_context():
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception("Polling habit_change failed")
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                with self.app.app_context():
+                    self.poll()
+                self._thread = threading.Thread(target=self.run, name="live-poller", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def build_hub(app):
+    """Create the hub selected by ``LIVE_HUB`` ("local" or "sql")."""
+    backend = app.config.get("LIVE_HUB", "local")
+    if backend == "local":
+        return LocalHub()
+    if backend == "sql":
+        return SqlPollingHub(app, poll_interval=app.config.get("LIVE_POLL_SECONDS", 1.0))
+    raise ValueError(f"Unknown LIVE_HUB: {backend!r}")
+
+
+@event.listens_for(db.session, "after_commit")
+def _publish_after_commit(session):
+    user_ids = session.info.pop(CHANGED_USERS, None)
+    if user_ids and has_app_context():
+        hub = current_app.extensions.get("live_hub")
+        if hub is not None:
+            hub.publish(user_ids)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(CHANGED_USERS, None)
+
+
+def format_event(name, data, event_id=None):
+    """Encode one SSE message."""
+    lines = [f"event: {name}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def event_stream(hub, user_id, since, today, heartbeat=15.0, max_seconds=300.0,
+                 clock=time.monotonic):
+    """Yield SSE messages for ``user_id`` until ``max_seconds`` have passed.
+
+    ``since`` is the client's sync version, or None to start from now.
+    ``today`` is a callable returning the date for day-dependent fields.
+    """
+    subscription = hub.subscribe(user_id)
+    try:
+        version = current_version(user_id) if since is None else since
+        db.session.remove()  # don't hold a connection while idle
+        # Tell EventSource to come back quickly when max_seconds ends the stream
+        yield "retry: 1000\n"
+        yield format_event("hello", {"version": version}, version)
+        deadline = clock() + max_seconds
+        pending = since is not None
+        while True:
+            if pending:
+                diff = changes_since(user_id, version, today())
+                db.session.remove()  # don't hold a connection while idle
+                if diff["changed"] or diff["deleted"]:
+                    version = diff["version"]
+                    yield format_event("changes", diff, version)
+                    # A capped page means more is waiting
+                    pending = diff["has_more"]
+                    continue
+            remaining = deadline - clock()
+            if remaining <= 0:
+                return
+            pending = subscription.wait(min(heartbeat, remaining))
+            if not pending:
+                yield ": heartbeat\n\n"
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,45 @@
+"""A small thread-safe LRU mapping shared by the per-process caches.
+
+``http_cache.PageCache`` and ``categories.CategoryCache`` build on it.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LruCache:
+    """Thread-safe LRU of at most ``max_entries`` items (0 disables caching)."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value for ``key`` (marking it recently used), or None."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store ``value``, evicting the least recently used entries over the limit."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
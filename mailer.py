@@ -0,0 +1,378 @@
+"""Outbound mail queue for sign-in codes.
+
+``/signin`` only inserts a row into ``outbound_message`` (``MailQueue.enqueue``)
+and returns, so sign-in latency does not depend on the mail server. Delivery
+happens elsewhere:
+
+- a background worker thread, started on the first enqueue when
+  ``MAIL_WORKER`` is "thread" (the default), or
+- ``flask deliver-mail`` in a separate process, with ``MAIL_WORKER = "none"``.
+  Any number of these may run: batches are claimed with a single UPDATE.
+
+Each pass claims up to ``MAIL_BATCH_SIZE`` due messages and sends them over
+one transport connection. Sent messages are deleted, since they carry live
+codes. Failed ones are retried after ``MAIL_RETRY_BASE_SECONDS``, doubling
+up to ``MAIL_RETRY_MAX_SECONDS``, and are marked "failed" after
+``MAIL_MAX_ATTEMPTS``. A claim is a lease: a message stuck in a worker that
+died becomes due again after ``MAIL_LEASE_SECONDS``.
+
+Transports: ``ConsoleTransport`` prints messages (the default, like the old
+inline print), ``SmtpTransport`` talks to ``MAIL_SERVER``. ``LocalSmtpServer``
+is a minimal in-process SMTP server to point ``SmtpTransport`` at in tests
+and local development.
+"""
+
+import email
+import logging
+import smtplib
+import socketserver
+import threading
+import time
+from collections import namedtuple
+from email.message import EmailMessage
+
+from extensions import db
+from models import OutboundMessage
+
+logger = logging.getLogger("habits.mail")
+
+PENDING = "pending"
+SENDING = "sending"
+FAILED = "failed"
+
+Message = namedtuple("Message", "id recipient subject body attempts")
+
+
+class ConsoleTransport:
+    """Prints each message to stdout."""
+
+    def send_many(self, messages):
+        for message in messages:
+            print(f"\n{'=' * 50}")
+            print(f"To: {message.recipient}\nSubject: {message.subject}\n")
+            print(message.body)
+            print(f"{'=' * 50}\n")
+        return {}
+
+
+class SmtpTransport:
+    """Sends a batch of messages over one SMTP connection."""
+
+    def __init__(self, host="localhost", port=25, sender="no-reply@localhost",
+                 username=None, password=None, use_tls=False, timeout=10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+    def _email(self, message):
+        mail = EmailMessage()
+        mail["From"] = self.sender
+        mail["To"] = message.recipient
+        mail["Subject"] = message.subject
+        mail.set_content(message.body)
+        return mail
+
+    def send_many(self, messages):
+        """Send ``messages``; return ``{message id: error}`` for those not sent."""
+        failures = {}
+        remaining = list(messages)
+        try:
+            with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+                if self.use_tls:
+                    smtp.starttls()
+                if self.username:
+                    smtp.login(self.username, self.password)
+                while remaining:
+                    message = remaining[0]
+                    try:
+                        smtp.send_message(self._email(message))
+                    except smtplib.SMTPServerDisconnected:
+                        raise
+                    except smtplib.SMTPException as error:
+                        failures[message.id] = str(error)
+                    remaining.pop(0)
+        except (OSError, smtplib.SMTPException) as error:
+            # The connection failed; everything not yet handed over is retried
+            for message in remaining:
+                failures[message.id] = str(error) or type(error).__name__
+        return failures
+
+
+class MailQueue:
+    """Persistent outbound queue plus the worker that drains it."""
+
+    def __init__(self, app, transport, batch_size=50, max_attempts=5, retry_base=30,
+                 retry_max=3600, lease=60, worker="thread", poll_interval=5,
+                 clock=time.time):
+        self.app = app
+        self.transport = transport
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease = lease
+        self.worker = worker
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def enqueue(self, recipient, subject, body):
+        """Queue a message and commit; delivery happens in the background."""
+        now = self.clock()
+        db.session.add(OutboundMessage(
+            recipient=recipient, subject=subject, body=body,
+            status=PENDING, next_attempt_at=now, created_at=now,
+        ))
+        db.session.commit()
+        if self.worker == "thread":
+            self.start()
+            self._wake.set()
+
+    def enqueue_many(self, messages):
+        """Queue ``(recipient, subject, body)`` tuples with one INSERT and commit."""
+        now = self.clock()
+        rows = [
+            {"recipient": recipient, "subject": subject, "body": body, "status": PENDING,
+             "attempts": 0, "next_attempt_at": now, "created_at": now}
+            for recipient, subject, body in messages
+        ]
+        if rows:
+            db.session.execute(db.insert(OutboundMessage.__table__), rows)
+        db.session.commit()
+        if rows and self.worker == "thread":
+            self.start()
+            self._wake.set()
+        return len(rows)
+
+    def backoff(self, attempts):
+        """Seconds to wait before retrying a message that failed ``attempts`` times."""
+        return min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+
+    def _claim(self, now):
+        due = (
+            db.select(OutboundMessage.id)
+            .where(
+                OutboundMessage.status.in_((PENDING, SENDING)),
+                OutboundMessage.next_attempt_at <= now,
+            )
+            .order_by(OutboundMessage.next_attempt_at, OutboundMessage.id)
+            .limit(self.batch_size)
+        )
+        rows = db.session.execute(
+            db.update(OutboundMessage)
+            .where(OutboundMessage.id.in_(due))
+            .values(status=SENDING, next_attempt_at=now + self.lease,
+                    attempts=OutboundMessage.attempts + 1)
+            .returning(OutboundMessage.id, OutboundMessage.recipient, OutboundMessage.subject,
+                       OutboundMessage.body, OutboundMessage.attempts)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        return [Message(*row) for row in rows]
+
+    def _record(self, batch, failures, now):
+        sent = [message.id for message in batch if message.id not in failures]
+        if sent:
+            db.session.execute(
+                db.delete(OutboundMessage)
+                .where(OutboundMessage.id.in_(sent))
+                .execution_options(synchronize_session=False)
+            )
+        retrying = given_up = 0
+        for message in batch:
+            if message.id not in failures:
+                continue
+            if message.attempts >= self.max_attempts:
+                values = {"status": FAILED}
+                given_up += 1
+            else:
+                values = {"status": PENDING,
+                          "next_attempt_at": now + self.backoff(message.attempts)}
+                retrying += 1
+            db.session.execute(
+                db.update(OutboundMessage)
+                .where(OutboundMessage.id == message.id)
+                .values(last_error=failures[message.id][:1000], **values)
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+        return len(sent), retrying, given_up
+
+    def deliver_pending(self):
+        """Send every due message, batch by batch.
+
+        Returns ``{"sent": n, "retrying": n, "failed": n}``.
+        """
+        totals = {"sent": 0, "retrying": 0, "failed": 0}
+        while True:
+            now = self.clock()
+            batch = self._claim(now)
+            if not batch:
+                return totals
+            failures = self.transport.send_many(batch)
+            sent, retrying, given_up = self._record(batch, failures, self.clock())
+            totals["sent"] += sent
+            totals["retrying"] += retrying
+            totals["failed"] += given_up
+            for message in batch:
+                if message.id in failures:
+                    logger.warning("Delivery to %s failed (attempt %d): %s",
+                                   message.recipient, message.attempts, failures[message.id])
+            if len(batch) < self.batch_size:
+                return totals
+
+    def run(self):
+        """Deliver due messages until ``stop``; wakes on enqueue or every ``poll_interval``."""
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    self.deliver_pending()
+                except Exception:
+                    logger.exception("Mail delivery pass failed")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def start(self):
+        """Start the background worker thread if it is not running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self.run, name="mail-worker", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the worker thread after its current pass."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def build_mail_queue(app):
+    """Create the mail queue and transport described by ``app.config``."""
+    config = app.config
+    backend = config.get("MAIL_TRANSPORT", "console")
+    if backend == "console":
+        transport = ConsoleTransport()
+    elif backend == "smtp":
+        transport = SmtpTransport(
+            host=config.get("MAIL_SERVER", "localhost"),
+            port=config.get("MAIL_PORT", 25),
+            sender=config.get("MAIL_SENDER", "no-reply@localhost"),
+            username=config.get("MAIL_USERNAME"),
+            password=config.get("MAIL_PASSWORD"),
+            use_tls=config.get("MAIL_USE_TLS", False),
+        )
+    else:
+        raise ValueError(f"Unknown MAIL_TRANSPORT: {backend!r}")
+    return MailQueue(
+        app,
+        transport,
+        batch_size=config.get("MAIL_BATCH_SIZE", 50),
+        max_attempts=config.get("MAIL_MAX_ATTEMPTS", 5),
+        retry_base=config.get("MAIL_RETRY_BASE_SECONDS", 30),
+        retry_max=config.get("MAIL_RETRY_MAX_SECONDS", 3600),
+        lease=config.get("MAIL_LEASE_SECONDS", 60),
+        worker=config.get("MAIL_WORKER", "thread"),
+    )
+
+
+# --- Local SMTP stand-in --------------------------------------------------
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: HELO/EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT."""
+
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        server = self.server
+        self._reply("220 localhost SMTP stand-in")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            argument = command[command.find(":") + 1:].strip().strip("<>") if ":" in command else ""
+            if verb in ("HELO", "EHLO"):
+                self._reply("250 localhost")
+            elif verb == "MAIL":
+                recipients = []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                if argument in server.refuse:
+                    self._reply("550 Mailbox unavailable")
+                else:
+                    recipients.append(argument)
+                    self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    data.append(line[1:] if line.startswith(b"..") else line)
+                with server.lock:
+                    server.messages.append(email.message_from_bytes(b"".join(data)))
+                self._reply("250 OK")
+            elif verb == "RSET":
+                recipients = []
+                self._reply("250 OK")
+            elif verb == "NOOP":
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class LocalSmtpServer(socketserver.ThreadingTCPServer):
+    """In-process SMTP server collecting messages in ``messages``.
+
+    Recipients listed in ``refuse`` are rejected with a 550. Use as a
+    context manager, or ``start``/``stop``; port 0 picks a free port.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _SmtpHandler)
+        self.messages = []
+        self.refuse = set()
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
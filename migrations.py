@@ -0,0 +1,187 @@
+"""Idempotent data migrations for existing ``app.db`` files.
+
+``db.create_all()`` creates missing tables but never alters existing ones,
+so each step here checks the live schema/data before changing anything and
+is safe to run on every start-up (see ``init_db()`` in ``app.py``).
+"""
+
+import json
+from datetime import datetime
+
+from categories import MAX_NAME_LENGTH, ensure_default_categories
+from extensions import db
+from models import Category, Habit, HabitCompletion, User
+from search import create_search_index
+from streaks import repair_counters
+from sync import create_change_log
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def add_missing_columns(model):
+    """Add columns declared on ``model`` but missing from its live table.
+
+    SQLite only supports ``ALTER TABLE ... ADD COLUMN``, so this covers
+    additive schema changes; scalar Python defaults are used as SQL defaults.
+    Returns the names of the columns that were added.
+    """
+    table = model.__table__
+    bind = db.session.get_bind(model)  # the current shard's engine, if sharded
+    existing = {column["name"] for column in db.inspect(bind).get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+        ddl += column.type.compile(dialect=bind.dialect)
+        default = column.default.arg if column.default is not None and column.default.is_scalar else None
+        if not column.nullable:
+            ddl += " NOT NULL"
+        if default is not None:
+            ddl += f" DEFAULT {int(default) if isinstance(default, bool) else default!r}"
+        db.session.execute(db.text(ddl))
+        added.append(column.name)
+    db.session.commit()
+    return added
+
+
+def create_missing_indexes(model):
+    """Create indexes declared on ``model`` that its live table lacks."""
+    for index in model.__table__.indexes:
+        index.create(bind=db.session.get_bind(model), checkfirst=True)
+
+
+def parse_completed_dates(raw):
+    """Parse the legacy ``Habit.completed_dates`` text into a set of dates.
+
+    Accepts a JSON list of ISO dates (the documented format) as well as
+    comma/whitespace separated ISO dates. Unparseable tokens are skipped.
+    """
+    if not raw or not raw.strip():
+        return set()
+
+    try:
+        tokens = json.loads(raw)
+        if not isinstance(tokens, list):
+            tokens = [tokens]
+    except ValueError:
+        tokens = raw.replace(",", " ").split()
+
+    days = set()
+    for token in tokens:
+        try:
+            days.add(datetime.fromisoformat(str(token).strip()).date())
+        except ValueError:
+            continue
+    return days
+
+
+def backfill_completions():
+    """Copy legacy ``completed_dates`` text into ``habit_completion`` rows.
+
+    Habits that already have completion rows are skipped, so re-running the
+    migration never duplicates history. Returns the number of rows inserted.
+    """
+    already_migrated = db.select(HabitCompletion.habit_id).distinct()
+    legacy = (
+        db.select(Habit.id, Habit.user_id, Habit.completed_dates)
+        .where(
+            Habit.completed_dates.is_not(None),
+            Habit.completed_dates != "",
+            Habit.id.not_in(already_migrated),
+        )
+    )
+
+    rows = [
+        {"habit_id": habit_id, "user_id": user_id, "completed_on": day}
+        for habit_id, user_id, raw in db.session.execute(legacy).all()
+        for day in sorted(parse_completed_dates(raw))
+    ]
+    for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        db.session.execute(db.insert(HabitCompletion), rows[start:start + BACKFILL_BATCH_SIZE])
+    db.session.commit()
+    return len(rows)
+
+
+def deduplicate_categories():
+    """Point habits' legacy free-text ``category`` at ``Category`` rows.
+
+    Names are compared trimmed and case-insensitively. A name matching a
+    global category uses it; any other name becomes one custom category per
+    user, however many spellings of it the user's habits carry. Unowned
+    habits keep custom names as text until ``assign_unowned_habits`` gives
+    them an owner. Returns the number of habits linked.
+    """
+    ensure_default_categories()
+    known = {
+        (user_id, name.casefold()): category_id
+        for category_id, name, user_id in db.session.execute(
+            db.select(Category.id, Category.name, Category.user_id)
+        )
+    }
+    pending = db.session.execute(
+        db.select(Habit.user_id, Habit.legacy_category)
+        .where(Habit.category_id.is_(None), Habit.legacy_category.is_not(None))
+        .distinct()
+    ).all()
+
+    linked = 0
+    for user_id, raw in pending:
+        name = raw.strip()[:MAX_NAME_LENGTH]
+        if not name:
+            continue
+        key = name.casefold()
+        category_id = known.get((None, key))
+        if category_id is None:
+            if not user_id:
+                continue
+            category_id = known.get((user_id, key))
+            if category_id is None:
+                category = Category(user_id=user_id, name=name)
+                db.session.add(category)
+                db.session.flush()
+                category_id = known[(user_id, key)] = category.id
+        owner = Habit.user_id.is_(None) if user_id is None else Habit.user_id == user_id
+        linked += db.session.execute(
+            db.update(Habit)
+            .where(owner, Habit.legacy_category == raw, Habit.category_id.is_(None))
+            .values(category_id=category_id)
+        ).rowcount
+    db.session.commit()
+    return linked
+
+
+def assign_unowned_habits(user_id):
+    """Give habits created before per-user scoping to ``user_id``.
+
+    Legacy rows have ``user_id`` NULL or 0 and are invisible to every
+    signed-in user until claimed. Returns the number of habits assigned.
+    """
+    unowned = db.or_(Habit.user_id.is_(None), Habit.user_id == 0)
+    habit_ids = db.select(Habit.id).where(unowned).scalar_subquery()
+    db.session.execute(
+        db.update(HabitCompletion)
+        .where(HabitCompletion.habit_id.in_(habit_ids))
+        .values(user_id=user_id)
+    )
+    assigned = db.session.execute(
+        db.update(Habit).where(unowned).values(user_id=user_id)
+    ).rowcount
+    if assigned:
+        User.bump_habits_version(user_id)
+    db.session.commit()
+    deduplicate_categories()
+    return assigned
+
+
+def run_migrations():
+    """Apply every migration step in order."""
+    add_missing_columns(User)
+    added = add_missing_columns(Habit)
+    create_missing_indexes(Habit)
+    deduplicate_categories()
+    create_search_index()
+    create_change_log()
+    backfilled = backfill_completions()
+    if backfilled or {"current_streak", "completion_bits"} & set(added):
+        repair_counters()
@@ -1,15 +1,259 @@
-from datetime import datetime, timezone
+from datetime import datetime
 
+import history
 from extensions import db
 
+# Width of the Habit.recent_completions bitmask, in days
+RECENT_WINDOW_DAYS = 30
+
+# Longest Habit.name accepted by the bulk, sync and import APIs
+MAX_HABIT_NAME_LENGTH = 100
+
+# Session.info key: users whose habits changed in the open transaction;
+# live.py notifies their streams once it commits
+CHANGED_USERS = "changed_users"
+
+
+class User(db.Model):
+    """An account, identified by the email address used for OTP sign-in."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(254), nullable=False, unique=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped on every change to the user's habits; drives ETags (http_cache.py)
+    habits_version = db.Column(db.Integer, nullable=False, default=0)
+    habits_updated_at = db.Column(db.DateTime, nullable=True)
+
+    habits = db.relationship("Habit", backref="user", lazy="dynamic")
+
+    @classmethod
+    def bump_habits_version(cls, user_id):
+        """Record that ``user_id``'s habits changed, in the caller's transaction."""
+        db.session.execute(
+            db.update(cls)
+            .where(cls.id == user_id)
+            .values(habits_version=cls.habits_version + 1, habits_updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.info.setdefault(CHANGED_USERS, set()).add(user_id)
+
+
+class UserShard(db.Model):
+    """Directory entry saying which shard holds a user (see sharding.py).
+
+    Kept in the main database. ``id`` is the user's id in whichever shard
+    holds them, so user ids are unique across shards and survive a move.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(254), nullable=False, unique=True)
+    shard = db.Column(db.Integer, nullable=False)
+    moved_at = db.Column(db.DateTime, nullable=True)
+
+
+class Category(db.Model):
+    """A habit category: global when ``user_id`` is NULL, else custom to one user."""
+
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "name", name="uq_category_user_name"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(60), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 
 class Habit(db.Model):
+    __table_args__ = (
+        # Keyset pagination of the active and archived lists (see pagination.py)
+        db.Index("ix_habit_user_active_created", "user_id", "is_archived", "created_at", "id"),
+        db.Index("ix_habit_user_archived_at", "user_id", "is_archived", "archived_at", "id"),
+        db.Index("ix_habit_user_category", "user_id", "category_id"),
+        # Reminder dispatch reads due habits in time order (see schedules.py)
+        db.Index("ix_habit_next_due", "next_due_at"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(MAX_HABIT_NAME_LENGTH), nullable=False)
     description = db.Column(db.Text)
-    category = db.Column(db.String(60))  
+    # Legacy free-text category; superseded by category_id (see migrations.py)
+    legacy_category = db.Column("category", db.String(60))
+    category_id = db.Column(db.Integer, db.ForeignKey("category.id"), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Legacy free-text history; superseded by HabitCompletion (see migrations.py)
     completed_dates = db.Column(db.Text)
-    user_id = db.Column(db.Integer, nullable=True, default=0)
+    # Indexed through the (user_id, is_archived, ...) composite indexes above
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
     is_archived = db.Column(db.Boolean, default=False)
-    archived_at = db.Column(db.DateTime, nullable=True)
\ No newline at end of file
+    archived_at = db.Column(db.DateTime, nullable=True)
+
+    # Denormalized counters, maintained by streaks.record_completion /
+    # streaks.remove_completion and rebuilt by streaks.repair_counters.
+    # current_streak is the length of the run ending on last_completed_on;
+    # bit n of recent_completions is set if the habit was done on
+    # last_completed_on - n days.
+    current_streak = db.Column(db.Integer, nullable=False, default=0)
+    best_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_completed_on = db.Column(db.Date, nullable=True)
+    recent_completions = db.Column(db.Integer, nullable=False, default=0)
+    # Full history packed one bit per day from completion_bits_start (see
+    # history.py); maintained and rebuilt alongside the counters above.
+    completion_bits = db.Column(db.LargeBinary, nullable=True)
+    completion_bits_start = db.Column(db.Date, nullable=True)
+
+    # Reminder schedule (see schedules.py): "daily", "weekdays" (the days set
+    # in schedule_days, Monday = bit 0) or "weekly" (every day until
+    # times_per_week check-ins in the Monday-Sunday week), at reminder_time
+    # in reminder_timezone. next_due_at is the UTC time of the next reminder.
+    schedule = db.Column(db.String(10), nullable=True)
+    schedule_days = db.Column(db.Integer, nullable=False, default=0)
+    times_per_week = db.Column(db.Integer, nullable=False, default=0)
+    reminder_time = db.Column(db.Time, nullable=True)
+    reminder_timezone = db.Column(db.String(64), nullable=True)
+    next_due_at = db.Column(db.DateTime, nullable=True)
+
+    category = db.relationship("Category", lazy="joined")
+    completions = db.relationship(
+        "HabitCompletion",
+        backref="habit",
+        lazy="dynamic",
+        cascade="all, delete-orphan",
+    )
+
+    def to_dict(self, today):
+        """Serialize the habit for the JSON API."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "category": self.category.name if self.category else None,
+            "category_id": self.category_id,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "is_archived": bool(self.is_archived),
+            "archived_at": self.archived_at.isoformat() if self.archived_at else None,
+            "current_streak": self.streak_on(today),
+            "best_streak": self.best_streak or 0,
+            "last_completed_on": (
+                self.last_completed_on.isoformat() if self.last_completed_on else None
+            ),
+            "completed_last_7_days": self.completions_in_last(7, today),
+            "completed_last_30_days": self.completions_in_last(30, today),
+            "total_completions": self.total_completions(),
+            "schedule": self.schedule,
+            "next_due_at": self.next_due_at.isoformat() if self.next_due_at else None,
+        }
+
+    def done_on(self, day):
+        """Return True if the habit was completed on ``day``."""
+        return history.is_done(self.completion_bits, self.completion_bits_start, day)
+
+    def total_completions(self):
+        """Return the number of days the habit was ever completed."""
+        return history.total(self.completion_bits)
+
+    def streak_on(self, today):
+        """Return the current streak as seen on ``today``.
+
+        A streak stays alive until the end of the day after its last check-in.
+        """
+        if self.last_completed_on is None or (today - self.last_completed_on).days > 1:
+            return 0
+        return self.current_streak or 0
+
+    def completions_in_last(self, days, today):
+        """Return how many of the ``days`` days ending ``today`` were completed.
+
+        ``days`` is capped at ``RECENT_WINDOW_DAYS``.
+        """
+        if self.last_completed_on is None:
+            return 0
+        visible = min(days - max((today - self.last_completed_on).days, 0), RECENT_WINDOW_DAYS)
+        if visible <= 0:
+            return 0
+        return bin(self.recent_completions & ((1 << visible) - 1)).count("1")
+
+
+class HabitCompletion(db.Model):
+    """One row per habit per day the habit was checked off."""
+
+    __table_args__ = (
+        db.UniqueConstraint("habit_id", "completed_on", name="uq_completion_habit_day"),
+        db.Index("ix_completion_user_day", "user_id", "completed_on"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    habit_id = db.Column(
+        db.Integer, db.ForeignKey("habit.id", ondelete="CASCADE"), nullable=False
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+    completed_on = db.Column(db.Date, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class OtpCode(db.Model):
+    """Sign-in code and issue rate-limit window per email (see otp.SqlOtpStore).
+
+    Times are Unix timestamps so expiry checks are plain float comparisons.
+    """
+
+    email = db.Column(db.String(254), primary_key=True)
+    code = db.Column(db.String(12), nullable=True)
+    expires_at = db.Column(db.Float, nullable=False, default=0.0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    window_start = db.Column(db.Float, nullable=False)
+    issued = db.Column(db.Integer, nullable=False, default=0)
+
+
+class RateLimitBucket(db.Model):
+    """Token bucket shared by all workers (see ratelimit.SqlRateLimiter).
+
+    ``tokens`` is the count at ``updated_at`` (a Unix timestamp); ``allowed``
+    records whether the last request taken from the bucket was let through.
+    """
+
+    key = db.Column(db.String(300), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False, index=True)
+    allowed = db.Column(db.Boolean, nullable=False, default=True)
+
+
+class OutboundMessage(db.Model):
+    """Email waiting for delivery by the mail queue (see mailer.py).
+
+    Times are Unix timestamps, as in ``OtpCode``. Rows are deleted once sent.
+    """
+
+    __table_args__ = (db.Index("ix_outbound_message_due", "status", "next_attempt_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(254), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    # "pending", "sending" (claimed by a worker until next_attempt_at) or "failed"
+    status = db.Column(db.String(10), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.Float, nullable=False)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.Float, nullable=False)
+
+
+class HabitChange(db.Model):
+    """Latest change to each habit, per owner, for delta sync (see sync.py).
+
+    Written only by triggers on ``habit``. ``id`` is AUTOINCREMENT, so a
+    rewritten row always gets a higher id and ids double as sync versions.
+    """
+
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "habit_id", name="uq_habit_change_user_habit"),
+        db.Index("ix_habit_change_user_version", "user_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    # No foreign key: tombstones outlive the habit
+    habit_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,286 @@
+"""One-time passcode storage for ``/signin``.
+
+Two interchangeable backends implement ``OtpStore``:
+
+- ``MemoryOtpStore``: per-process, bounded LRU with TTL expiry. Expired
+  codes are dropped lazily on access and swept periodically on issue.
+- ``SqlOtpStore``: rows in the ``otp_code`` table of the app database, so
+  every worker process sees the same codes.
+
+Both expire codes after ``ttl`` seconds, invalidate a code after
+``max_attempts`` wrong guesses, and allow at most ``issue_limit`` codes per
+email per ``issue_window`` seconds. ``build_otp_store`` picks one from the
+Flask config.
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from models import OtpCode
+
+VERIFIED = "verified"
+INVALID = "invalid"
+EXPIRED = "expired"
+LOCKED = "locked"
+MISSING = "missing"
+
+
+class OtpStore(ABC):
+    """Interface shared by the OTP backends."""
+
+    def __init__(self, ttl=300, max_attempts=5, issue_limit=5, issue_window=900,
+                 sweep_interval=60, clock=time.time):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.issue_limit = issue_limit
+        self.issue_window = issue_window
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._last_sweep = clock()
+
+    @abstractmethod
+    def issue(self, email, code):
+        """Store ``code`` for ``email``; return False if rate-limited."""
+
+    @abstractmethod
+    def verify(self, email, code):
+        """Check ``code`` and consume it on success.
+
+        Returns one of VERIFIED, INVALID, EXPIRED, LOCKED or MISSING.
+        """
+
+    @abstractmethod
+    def get(self, email):
+        """Return the live code for ``email``, or None."""
+
+    @abstractmethod
+    def discard(self, email):
+        """Forget any code and rate-limit state for ``email``."""
+
+    @abstractmethod
+    def clear(self):
+        """Forget everything."""
+
+    @abstractmethod
+    def purge_expired(self):
+        """Drop expired entries; return how many were removed."""
+
+    def __contains__(self, email):
+        return self.get(email) is not None
+
+    def _maybe_sweep(self, now):
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            self.purge_expired()
+
+
+class _Entry:
+    __slots__ = ("code", "expires_at", "attempts", "window_start", "issued")
+
+    def __init__(self, window_start):
+        self.code = None
+        self.expires_at = 0.0
+        self.attempts = 0
+        self.window_start = window_start
+        self.issued = 0
+
+
+class MemoryOtpStore(OtpStore):
+    """Process-local store bounded to ``max_entries`` emails (LRU)."""
+
+    def __init__(self, max_entries=10000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _stale(self, entry, now):
+        code_dead = entry.code is None or entry.expires_at <= now
+        return code_dead and entry.window_start + self.issue_window <= now
+
+    def issue(self, email, code):
+        now = self.clock()
+        self._maybe_sweep(now)
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                entry = _Entry(now)
+            elif entry.window_start + self.issue_window <= now:
+                entry.window_start = now
+                entry.issued = 0
+            if entry.issued >= self.issue_limit:
+                return False
+            entry.code = code
+            entry.expires_at = now + self.ttl
+            entry.attempts = 0
+            entry.issued += 1
+            self._entries[email] = entry
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def verify(self, email, code):
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry.code is None:
+                return MISSING
+            if entry.expires_at <= now:
+                entry.code = None
+                return EXPIRED
+            if entry.code == code:
+                entry.code = None
+                return VERIFIED
+            entry.attempts += 1
+            if entry.attempts >= self.max_attempts:
+                entry.code = None
+                return LOCKED
+            return INVALID
+
+    def get(self, email):
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry.code is None or entry.expires_at <= now:
+                return None
+            return entry.code
+
+    def discard(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def purge_expired(self):
+        now = self.clock()
+        with self._lock:
+            stale = [email for email, entry in self._entries.items() if self._stale(entry, now)]
+            for email in stale:
+                del self._entries[email]
+        return len(stale)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqlOtpStore(OtpStore):
+    """Store backed by the ``otp_code`` table, shared by all workers.
+
+    Must be used inside an application context. Each call commits, so the
+    single-use and attempt-counter guarantees hold across processes.
+    """
+
+    def issue(self, email, code):
+        now = self.clock()
+        self._maybe_sweep(now)
+        # One upsert, so concurrent first requests for an email can't both
+        # insert it; the WHERE leaves a rate-limited row untouched and then
+        # RETURNING yields nothing
+        table = OtpCode.__table__
+        window_over = table.c.window_start + self.issue_window <= now
+        statement = (
+            sqlite_insert(OtpCode)
+            .values(email=email, code=code, expires_at=now + self.ttl, attempts=0,
+                    window_start=now, issued=1)
+            .on_conflict_do_update(
+                index_elements=[table.c.email],
+                set_={
+                    "code": code,
+                    "expires_at": now + self.ttl,
+                    "attempts": 0,
+                    "window_start": db.case((window_over, now), else_=table.c.window_start),
+                    "issued": db.case((window_over, 1), else_=table.c.issued + 1),
+                },
+                where=db.or_(window_over, table.c.issued < self.issue_limit),
+            )
+            .returning(table.c.issued)
+        )
+        issued = db.session.execute(statement).first()
+        db.session.commit()
+        return issued is not None
+
+    def verify(self, email, code):
+        now = self.clock()
+        live = db.and_(OtpCode.email == email, OtpCode.code.is_not(None))
+
+        consumed = db.session.execute(
+            db.update(OtpCode)
+            .where(live, OtpCode.code == code, OtpCode.expires_at > now)
+            .values(code=None)
+        ).rowcount
+        if consumed:
+            db.session.commit()
+            return VERIFIED
+
+        row = db.session.execute(
+            db.update(OtpCode)
+            .where(live)
+            .values(attempts=OtpCode.attempts + 1)
+            .returning(OtpCode.expires_at, OtpCode.attempts)
+        ).first()
+        if row is None:
+            db.session.commit()
+            return MISSING
+
+        expires_at, attempts = row
+        status = INVALID
+        if expires_at <= now:
+            status = EXPIRED
+        elif attempts >= self.max_attempts:
+            status = LOCKED
+        if status != INVALID:
+            db.session.execute(db.update(OtpCode).where(OtpCode.email == email).values(code=None))
+        db.session.commit()
+        return status
+
+    def get(self, email):
+        return db.session.execute(
+            db.select(OtpCode.code).where(
+                OtpCode.email == email,
+                OtpCode.code.is_not(None),
+                OtpCode.expires_at > self.clock(),
+            )
+        ).scalar()
+
+    def discard(self, email):
+        db.session.execute(db.delete(OtpCode).where(OtpCode.email == email))
+        db.session.commit()
+
+    def clear(self):
+        db.session.execute(db.delete(OtpCode))
+        db.session.commit()
+
+    def purge_expired(self):
+        now = self.clock()
+        removed = db.session.execute(
+            db.delete(OtpCode).where(
+                db.or_(OtpCode.code.is_(None), OtpCode.expires_at <= now),
+                OtpCode.window_start + self.issue_window <= now,
+            )
+        ).rowcount
+        db.session.commit()
+        return removed
+
+
+def build_otp_store(config):
+    """Create the OTP store selected by ``config["OTP_STORE"]`` ("memory" or "sql")."""
+    options = {
+        "ttl": config.get("OTP_TTL_SECONDS", 300),
+        "max_attempts": config.get("OTP_MAX_ATTEMPTS", 5),
+        "issue_limit": config.get("OTP_ISSUE_LIMIT", 5),
+        "issue_window": config.get("OTP_ISSUE_WINDOW_SECONDS", 900),
+    }
+    backend = config.get("OTP_STORE", "memory")
+    if backend == "memory":
+        return MemoryOtpStore(max_entries=config.get("OTP_MAX_ENTRIES", 10000), **options)
+    if backend == "sql":
+        return SqlOtpStore(**options)
+    raise ValueError(f"Unknown OTP_STORE backend: {backend!r}")
@@ -0,0 +1,74 @@
+"""Keyset (seek) pagination with opaque cursor tokens.
+
+Pages are ordered newest first on ``(sort_column, id)`` and the next page
+starts strictly after the last row of the previous one, so fetching page N
+costs the same index range scan as page 1 instead of an ever-growing
+``OFFSET``. Rows whose sort value is NULL (e.g. ``archived_at`` on habits
+archived before that column existed) sort after all others, as SQLite
+orders NULLs last in a descending sort.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from extensions import db
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a cursor token cannot be decoded."""
+
+
+def encode_cursor(sort_value, row_id):
+    """Encode the position after ``(sort_value, row_id)`` as a URL-safe token."""
+    payload = json.dumps([sort_value.isoformat() if sort_value else None, row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Decode a token from ``encode_cursor`` back into ``(datetime, id)``."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (datetime.fromisoformat(sort_value) if sort_value else None), int(row_id)
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursorError(token) from exc
+
+
+def parse_page_size(raw, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Clamp a user-supplied page size to ``1..maximum``; ``default`` if not a number."""
+    try:
+        size = int(raw)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def keyset_page(query, model, sort_column, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Return ``(rows, next_cursor)`` for one page of ``query``.
+
+    ``query`` is a ``Model.query`` style query already filtered down to the
+    rows being listed. ``next_cursor`` is None on the last page.
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        if sort_value is None:
+            # Already into the NULL tail; a row-value comparison with NULL is
+            # never true, so page through it on id alone
+            query = query.filter(sort_column.is_(None), model.id < row_id)
+        else:
+            query = query.filter(db.or_(
+                db.tuple_(sort_column, model.id) < (sort_value, row_id),
+                sort_column.is_(None),
+            ))
+
+    rows = query.order_by(sort_column.desc(), model.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_column.key), last.id)
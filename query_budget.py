@@ -0,0 +1,174 @@
+"""Query budgets and N+1 detection.
+
+``query_budget`` is a context manager for tests: it records every statement
+run inside the block and raises ``QueryBudgetExceededError`` if there were more
+than the budget, listing the statements and any shape that repeated.
+Statements are compared by shape (whitespace collapsed, literals and
+``IN (?, ?, ...)`` lists folded), so a lazy load per row of a template loop
+shows up as one shape run N times.
+
+``init_query_warnings`` is the development counterpart. With
+``QUERY_WARNINGS`` on (the default in ``DevelopmentConfig``) every response
+gets an ``X-Query-Count`` header, and requests over their budget
+(``QUERY_BUDGETS[endpoint]``, else ``QUERY_BUDGET``) or repeating a shape
+``QUERY_REPEAT_THRESHOLD`` times are logged on the ``habits.queries``
+logger.
+"""
+
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import request, request_finished, request_started, request_tearing_down
+from sqlalchemy import event
+
+from extensions import db
+
+logger = logging.getLogger("habits.queries")
+
+REPEAT_THRESHOLD = 3
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+_current = ContextVar("query_recorder", default=None)
+
+
+def statement_shape(statement):
+    """Normalise ``statement`` so statements differing only in values compare equal."""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _STRING.sub("?", shape)
+    shape = _NUMBER.sub("?", shape)
+    return _PARAM_LIST.sub("(?...)", shape)
+
+
+class QueryBudgetExceededError(AssertionError):
+    """A block ran more statements than its budget allowed."""
+
+
+class QueryRecorder:
+    """Statements executed while recording, in order."""
+
+    def __init__(self):
+        self.statements = []
+        self.token = None
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def add(self, statement):
+        self.statements.append(statement)
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        """Return ``(shape, count)`` for shapes run at least ``threshold`` times."""
+        shapes = Counter(statement_shape(statement) for statement in self.statements)
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+    def report(self, threshold=REPEAT_THRESHOLD):
+        lines = [f"{self.count} statements:"]
+        lines.extend(f"  {index}. {statement_shape(statement)}"
+                     for index, statement in enumerate(self.statements, 1))
+        repeats = self.repeated(threshold)
+        if repeats:
+            lines.append("Repeated statements (possible N+1):")
+            lines.extend(f"  {count}x {shape}" for shape, count in repeats)
+        return "\n".join(lines)
+
+
+@contextmanager
+def record_queries(engine=None):
+    """Record every statement run on ``engine`` in the block.
+
+    By default that is every engine of the app, so statements routed to
+    shard databases (see sharding.py) are counted too.
+    """
+    engines = [engine] if engine is not None else set(db.engines.values())
+    recorder = QueryRecorder()
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        recorder.add(statement)
+
+    for target in engines:
+        event.listen(target, "before_cursor_execute", _record)
+    try:
+        yield recorder
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", _record)
+
+
+@contextmanager
+def query_budget(max_queries, max_repeats=None, engine=None):
+    """Fail if the block runs more than ``max_queries`` statements.
+
+    With ``max_repeats`` set it also fails when any statement shape runs
+    more than that many times, which catches an N+1 that still fits the
+    budget for a small fixture.
+    """
+    with record_queries(engine) as recorder:
+        yield recorder
+    threshold = REPEAT_THRESHOLD if max_repeats is None else max_repeats + 1
+    if recorder.count > max_queries:
+        raise QueryBudgetExceededError(
+            f"Query budget of {max_queries} exceeded\n{recorder.report(threshold)}"
+        )
+    if max_repeats is not None and recorder.repeated(threshold):
+        raise QueryBudgetExceededError(
+            f"Statement repeated more than {max_repeats} times\n{recorder.report(threshold)}"
+        )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.add(statement)
+
+
+def _on_request_started(sender, **extra):
+    recorder = QueryRecorder()
+    recorder.token = _current.set(recorder)
+
+
+def _on_request_finished(sender, response, **extra):
+    recorder = _current.get()
+    if recorder is None:
+        return
+    response.headers["X-Query-Count"] = str(recorder.count)
+    endpoint = request.endpoint or "unmatched"
+    budget = sender.config.get("QUERY_BUDGETS", {}).get(endpoint, sender.config["QUERY_BUDGET"])
+    threshold = sender.config.get("QUERY_REPEAT_THRESHOLD", REPEAT_THRESHOLD)
+    repeats = recorder.repeated(threshold)
+    if recorder.count > budget or repeats:
+        logger.warning(
+            "%s %s (%s) ran %d queries, budget %d\n%s",
+            request.method, request.path, endpoint, recorder.count, budget,
+            recorder.report(threshold),
+        )
+
+
+def _on_request_tearing_down(sender, **extra):
+    recorder = _current.get()
+    if recorder is not None:
+        _current.reset(recorder.token)
+
+
+def init_query_warnings(app):
+    """Count statements per request and log over-budget or N+1 requests.
+
+    Only installed when ``QUERY_WARNINGS`` is set. Returns True if installed.
+    """
+    if not app.config.get("QUERY_WARNINGS"):
+        return False
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    request_started.connect(_on_request_started, app)
+    request_finished.connect(_on_request_finished, app)
+    request_tearing_down.connect(_on_request_tearing_down, app)
+    return True
@@ -0,0 +1,279 @@
+"""Token-bucket rate limiting for ``/signin`` and the habit mutation routes.
+
+Every POST/PUT/PATCH/DELETE takes one token from each bucket configured for
+its endpoint in ``RATE_LIMITS``, IP bucket first; at the first empty bucket
+the request is answered with 429 and a ``Retry-After`` header before any
+view code or database write runs (and before any later bucket is touched).
+Buckets are keyed by client IP and by email (the address typed into
+``/signin``, otherwise the signed-in user's):
+
+    RATE_LIMITS = {
+        "main.signin": {"ip": "20/minute", "email": "5/minute"},
+        "*": {"ip": "300/minute", "email": "120/minute"},
+    }
+
+``"*"`` covers every other endpoint, with one bucket per key shared by all
+of them. A limit of "N/period" holds at most N tokens and refills at N per
+period, so bursts of N are allowed.
+
+Two interchangeable backends implement ``RateLimiter``:
+
+- ``MemoryRateLimiter``: per-process and O(1) per request. Buckets are kept
+  in least-recently-used order and dropped once refilled (forgetting a full
+  bucket changes nothing), with a hard cap of ``max_buckets``.
+- ``SqlRateLimiter``: rows in the ``rate_limit_bucket`` table, updated with
+  one atomic upsert per bucket, so all workers share the limits.
+
+``build_rate_limiter`` picks one from the Flask config. The client IP is
+``request.remote_addr``; behind a reverse proxy, wrap the app in Werkzeug's
+``ProxyFix`` so that is the real client.
+"""
+
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, namedtuple
+
+from flask import current_app, jsonify, request, session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from models import RateLimitBucket
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+Limit = namedtuple("Limit", ["capacity", "rate"])
+
+
+def parse_limit(text):
+    """Parse "N/period" (e.g. "5/minute") into a Limit; raise ValueError if invalid."""
+    count, _, period = str(text).partition("/")
+    try:
+        capacity = int(count)
+        seconds = PERIODS[period.strip().lower()]
+    except (ValueError, KeyError):
+        raise ValueError(f"Invalid rate limit: {text!r}") from None
+    if capacity < 1:
+        raise ValueError(f"Invalid rate limit: {text!r}")
+    return Limit(capacity, capacity / seconds)
+
+
+def _refill(tokens, updated_at, limit, now):
+    return min(limit.capacity, tokens + (now - updated_at) * limit.rate)
+
+
+def _wait(tokens, limit):
+    """Seconds until a bucket holding ``tokens`` has one to give."""
+    return max(1, math.ceil((1 - tokens) / limit.rate))
+
+
+class RateLimiter(ABC):
+    """Interface shared by the rate-limit backends."""
+
+    def __init__(self, sweep_interval=60, clock=time.time):
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._last_sweep = clock()
+
+    @abstractmethod
+    def hit(self, key, limit):
+        """Take a token from bucket ``key``.
+
+        Returns ``(True, 0)`` if the request may proceed, else ``(False,
+        retry_after_seconds)``.
+        """
+
+    @abstractmethod
+    def clear(self):
+        """Forget every bucket."""
+
+    @abstractmethod
+    def purge_expired(self):
+        """Drop buckets that have refilled; return how many were removed."""
+
+    def _maybe_sweep(self, now):
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            self.purge_expired()
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Process-local buckets, at most ``max_buckets`` of them (LRU)."""
+
+    def __init__(self, max_buckets=100000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_buckets = max_buckets
+        # key -> [tokens, updated_at, limit], least recently used first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit):
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = limit.capacity if bucket is None else _refill(bucket[0], bucket[1], limit, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = [tokens, now, limit]
+            self._buckets.move_to_end(key)
+            self._drop_refilled(now)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return (True, 0) if allowed else (False, _wait(tokens, limit))
+
+    def _drop_refilled(self, now):
+        # The oldest buckets are at the front; stop at the first still refilling,
+        # so each call does O(1) amortized work
+        while self._buckets:
+            key, (tokens, updated_at, limit) = next(iter(self._buckets.items()))
+            if _refill(tokens, updated_at, limit, now) < limit.capacity:
+                return
+            del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def purge_expired(self):
+        now = self.clock()
+        with self._lock:
+            full = [key for key, (tokens, updated_at, limit) in self._buckets.items()
+                    if _refill(tokens, updated_at, limit, now) >= limit.capacity]
+            for key in full:
+                del self._buckets[key]
+        return len(full)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SqlRateLimiter(RateLimiter):
+    """Buckets in the ``rate_limit_bucket`` table, shared by all workers.
+
+    Must be used inside an application context. Each hit is one upsert,
+    committed at once, so concurrent workers cannot both spend the last
+    token. Rows untouched for ``expiry`` seconds (the longest refill time
+    of any configured limit) are swept periodically.
+    """
+
+    def __init__(self, expiry=86400, **kwargs):
+        super().__init__(**kwargs)
+        self.expiry = expiry
+
+    def hit(self, key, limit):
+        now = self.clock()
+        self._maybe_sweep(now)
+        table = RateLimitBucket.__table__
+        refill = db.func.min(limit.capacity, table.c.tokens + (now - table.c.updated_at) * limit.rate)
+        can_take = refill >= 1
+        statement = (
+            sqlite_insert(RateLimitBucket)
+            .values(key=key, tokens=limit.capacity - 1, updated_at=now, allowed=True)
+            .on_conflict_do_update(
+                index_elements=[table.c.key],
+                set_={
+                    "tokens": db.case((can_take, refill - 1), else_=table.c.tokens),
+                    "updated_at": db.case((can_take, now), else_=table.c.updated_at),
+                    "allowed": can_take,
+                },
+            )
+            .returning(table.c.tokens, table.c.updated_at, table.c.allowed)
+        )
+        tokens, updated_at, allowed = db.session.execute(statement).one()
+        db.session.commit()
+        if allowed:
+            return True, 0
+        return False, _wait(_refill(tokens, updated_at, limit, now), limit)
+
+    def clear(self):
+        db.session.execute(db.delete(RateLimitBucket))
+        db.session.commit()
+
+    def purge_expired(self):
+        removed = db.session.execute(
+            db.delete(RateLimitBucket).where(RateLimitBucket.updated_at <= self.clock() - self.expiry)
+        ).rowcount
+        db.session.commit()
+        return removed
+
+
+def parse_limits(config):
+    """Parse ``RATE_LIMITS`` into ``{endpoint: {kind: Limit}}``."""
+    limits = {}
+    for endpoint, by_kind in config.get("RATE_LIMITS", {}).items():
+        for kind, text in by_kind.items():
+            if kind not in ("ip", "email"):
+                raise ValueError(f"Unknown rate limit key {kind!r} for {endpoint!r}")
+            limits.setdefault(endpoint, {})[kind] = parse_limit(text)
+    return limits
+
+
+def build_rate_limiter(config, limits):
+    """Create the limiter selected by ``config["RATE_LIMIT_STORE"]`` ("memory" or "sql")."""
+    backend = config.get("RATE_LIMIT_STORE", "memory")
+    if backend == "memory":
+        return MemoryRateLimiter(max_buckets=config.get("RATE_LIMIT_MAX_BUCKETS", 100000))
+    if backend == "sql":
+        longest = max(
+            (limit.capacity / limit.rate for by_kind in limits.values() for limit in by_kind.values()),
+            default=0,
+        )
+        return SqlRateLimiter(expiry=max(longest, 60))
+    raise ValueError(f"Unknown RATE_LIMIT_STORE backend: {backend!r}")
+
+
+def _client_email():
+    if request.endpoint == "main.signin":
+        data = request.get_json(silent=True)
+        email = data.get("email") if isinstance(data, dict) else None
+    else:
+        email = session.get("email") if session.get("authenticated") else None
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def _check_rate_limits():
+    if request.method in SAFE_METHODS or request.endpoint is None:
+        return None
+    limits = current_app.extensions["rate_limits"]
+    scope = request.endpoint if request.endpoint in limits else "*"
+    by_kind = limits.get(scope)
+    if not by_kind:
+        return None
+
+    limiter = current_app.extensions["rate_limiter"]
+    identities = {"ip": request.remote_addr, "email": _client_email()}
+    retry_after = 0
+    # IP first, stopping at the first empty bucket: a throttled client must
+    # not create a bucket per email it tries (pushing its own IP bucket out
+    # of the memory limiter's LRU)
+    for kind in ("ip", "email"):
+        identity = identities[kind]
+        if kind not in by_kind or identity is None:
+            continue
+        allowed, retry_after = limiter.hit(f"{scope}:{kind}:{identity}", by_kind[kind])
+        if not allowed:
+            break
+    if not retry_after:
+        return None
+
+    response = jsonify({"success": False, "message": "Too many requests, try again later"})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def init_rate_limits(app):
+    """Throttle state-changing requests per ``RATE_LIMITS``.
+
+    Does nothing (and returns False) unless ``RATE_LIMITING`` is set.
+    """
+    if not app.config.get("RATE_LIMITING"):
+        return False
+    limits = parse_limits(app.config)
+    app.extensions["rate_limits"] = limits
+    app.extensions["rate_limiter"] = build_rate_limiter(app.config, limits)
+    app.before_request(_check_rate_limits)
+    return True
@@ -0,0 +1,247 @@
+"""Habit reminder schedules and the batched reminder dispatcher.
+
+A scheduled habit is reminded at ``reminder_time`` in ``reminder_timezone``:
+
+- DAILY: every day;
+- WEEKDAYS: on the days set in ``schedule_days`` (bit 0 = Monday);
+- WEEKLY: every day until ``times_per_week`` check-ins in the Monday-Sunday
+  week.
+
+Days already checked off get no reminder. Check-ins are recorded per UTC
+day elsewhere in the app, so a local day is looked up by its date.
+
+``Habit.next_due_at`` holds the UTC time of the next reminder and is
+indexed, so ``dispatch_reminders`` reads only the habits that are due,
+oldest first, ``batch_size`` at a time, sends one email per user per batch
+and writes the following reminder times back with one executemany UPDATE.
+Nothing scans every schedule per tick. The column is computed when a
+schedule is set or a habit is unarchived; check-ins and archiving in
+between are noticed when the reminder comes due, so no other write path
+has to keep it in step.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import history
+from extensions import db
+from models import CHANGED_USERS, Habit, User
+
+DAILY = "daily"
+WEEKDAYS = "weekdays"
+WEEKLY = "weekly"
+KINDS = (DAILY, WEEKDAYS, WEEKLY)
+
+WEEKDAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+# Far enough ahead to get past a fully completed week
+SEARCH_DAYS = 15
+
+# Columns next_due needs; dispatch loads only these
+_SCHEDULE_COLUMNS = (
+    Habit.id, Habit.user_id, Habit.name, Habit.is_archived, Habit.schedule,
+    Habit.schedule_days, Habit.times_per_week, Habit.reminder_time, Habit.reminder_timezone,
+    Habit.completion_bits, Habit.completion_bits_start, Habit.next_due_at,
+)
+
+# Executemany UPDATE by primary key; the ORM bulk path is several times slower
+_SET_NEXT_DUE = (
+    db.update(Habit.__table__)
+    .where(Habit.__table__.c.id == db.bindparam("habit_id"))
+    .values(next_due_at=db.bindparam("due"))
+)
+
+
+class ScheduleError(ValueError):
+    """A schedule request that cannot be applied."""
+
+
+def parse_schedule(data):
+    """Validate a schedule from the JSON API and return ``Habit`` column values.
+
+    ``data`` has ``schedule`` (one of ``KINDS``), ``time`` ("HH:MM"),
+    optional ``timezone`` (IANA name, default UTC), ``days`` (weekday
+    names, for WEEKDAYS) and ``times_per_week`` (1-7, for WEEKLY).
+    """
+    if not isinstance(data, dict):
+        raise ScheduleError("Expected a JSON object")
+    kind = data.get("schedule")
+    if kind not in KINDS:
+        raise ScheduleError(f"schedule must be one of {', '.join(KINDS)}")
+
+    try:
+        reminder_time = time.fromisoformat(str(data.get("time", "")))
+    except ValueError:
+        raise ScheduleError("time must be HH:MM") from None
+
+    zone = data.get("timezone") or "UTC"
+    try:
+        ZoneInfo(zone)
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        raise ScheduleError(f"Unknown timezone: {zone!r}") from None
+
+    days = 0
+    if kind == WEEKDAYS:
+        names = data.get("days")
+        if not isinstance(names, list) or not names:
+            raise ScheduleError("days must list at least one weekday")
+        for name in names:
+            if str(name).lower() not in WEEKDAY_NAMES:
+                raise ScheduleError(f"Unknown weekday: {name!r}")
+            days |= 1 << WEEKDAY_NAMES.index(str(name).lower())
+
+    per_week = 0
+    if kind == WEEKLY:
+        per_week = data.get("times_per_week")
+        if not isinstance(per_week, int) or isinstance(per_week, bool) or not 1 <= per_week <= 7:
+            raise ScheduleError("times_per_week must be between 1 and 7")
+
+    return {
+        "schedule": kind,
+        "schedule_days": days,
+        "times_per_week": per_week,
+        "reminder_time": reminder_time.replace(second=0, microsecond=0),
+        "reminder_timezone": zone,
+    }
+
+
+def describe(habit):
+    """Serialize ``habit``'s schedule for the JSON API, or None if unscheduled."""
+    if not habit.schedule:
+        return None
+    return {
+        "schedule": habit.schedule,
+        "days": [name for bit, name in enumerate(WEEKDAY_NAMES) if habit.schedule_days >> bit & 1],
+        "times_per_week": habit.times_per_week or None,
+        "time": habit.reminder_time.strftime("%H:%M"),
+        "timezone": habit.reminder_timezone,
+        "next_due_at": habit.next_due_at.isoformat() if habit.next_due_at else None,
+    }
+
+
+def _scheduled_on(habit, day):
+    if habit.schedule == WEEKDAYS:
+        return bool(habit.schedule_days >> day.weekday() & 1)
+    if habit.schedule == WEEKLY:
+        monday = day - timedelta(days=day.weekday())
+        done = history.count_between(
+            habit.completion_bits, habit.completion_bits_start, monday, monday + timedelta(days=6)
+        )
+        return done < habit.times_per_week
+    return habit.schedule == DAILY
+
+
+def next_due(habit, after):
+    """Return the first reminder time strictly after ``after``, or None.
+
+    Times are naive UTC datetimes, like the rest of the app. ``habit`` may
+    be a ``Habit`` or a row with the schedule columns.
+    """
+    if not habit.schedule or habit.is_archived or habit.reminder_time is None:
+        return None
+    zone = ZoneInfo(habit.reminder_timezone or "UTC")
+    first_day = after.replace(tzinfo=timezone.utc).astimezone(zone).date()
+    for offset in range(SEARCH_DAYS):
+        day = first_day + timedelta(days=offset)
+        if not _scheduled_on(habit, day):
+            continue
+        if history.is_done(habit.completion_bits, habit.completion_bits_start, day):
+            continue
+        due = (
+            datetime.combine(day, habit.reminder_time, zone)
+            .astimezone(timezone.utc)
+            .replace(tzinfo=None)
+        )
+        if due > after:
+            return due
+    return None
+
+
+def apply_schedule(habit, values, now):
+    """Set ``habit``'s schedule (``parse_schedule`` output, or None to clear)."""
+    values = values or {
+        "schedule": None, "schedule_days": 0, "times_per_week": 0,
+        "reminder_time": None, "reminder_timezone": None,
+    }
+    for name, value in values.items():
+        setattr(habit, name, value)
+    habit.next_due_at = next_due(habit, now)
+
+
+def reschedule(habit_ids, now):
+    """Recompute ``next_due_at`` for the scheduled habits among ``habit_ids``."""
+    rows = db.session.execute(
+        db.select(*_SCHEDULE_COLUMNS)
+        .where(Habit.id.in_(habit_ids), Habit.schedule.is_not(None))
+    ).all()
+    updates = [{"habit_id": row.id, "due": next_due(row, now)} for row in rows]
+    if updates:
+        db.session.execute(_SET_NEXT_DUE, updates)
+    return len(updates)
+
+
+def _reminder(names):
+    if len(names) == 1:
+        return f"Reminder: {names[0]}", f"Time for your habit: {names[0]}."
+    listed = "\n".join(f"- {name}" for name in names)
+    return f"Reminder: {len(names)} habits due", f"Time for your habits:\n{listed}"
+
+
+def dispatch_reminders(mail_queue, now=None, batch_size=500, grace=timedelta(hours=1)):
+    """Send every reminder due at ``now`` and schedule the next ones.
+
+    Reminders more than ``grace`` late (the dispatcher was not running)
+    are skipped rather than sent. Each batch is committed on its own.
+    Returns ``{"reminded": habits, "messages": emails, "rescheduled": habits}``.
+    """
+    now = now or datetime.utcnow()
+    totals = {"reminded": 0, "messages": 0, "rescheduled": 0}
+    while True:
+        rows = db.session.execute(
+            db.select(*_SCHEDULE_COLUMNS)
+            .where(Habit.next_due_at <= now)
+            .order_by(Habit.next_due_at, Habit.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return totals
+
+        due_names = defaultdict(list)
+        updates = []
+        for row in rows:
+            # Re-check the slot: the habit may have been checked off or archived since
+            slot = next_due(row, row.next_due_at - timedelta(microseconds=1))
+            if slot is not None and slot <= now:
+                if now - grace <= slot and row.user_id is not None:
+                    due_names[row.user_id].append(row.name)
+                slot = next_due(row, now)
+            updates.append({"habit_id": row.id, "due": slot})
+
+        db.session.execute(_SET_NEXT_DUE, updates)
+        owners = {row.user_id for row in rows if row.user_id is not None}
+        if owners:
+            # next_due_at is part of the JSON API, so cached pages and open
+            # streams are stale; one UPDATE for the batch, then the same
+            # notification User.bump_habits_version would queue
+            db.session.execute(
+                db.update(User)
+                .where(User.id.in_(owners))
+                .values(habits_version=User.habits_version + 1, habits_updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.info.setdefault(CHANGED_USERS, set()).update(owners)
+        emails = dict(db.session.execute(
+            db.select(User.id, User.email).where(User.id.in_(due_names))
+        ).all())
+        messages = [
+            (emails[user_id], *_reminder(names))
+            for user_id, names in due_names.items() if user_id in emails
+        ]
+        mail_queue.enqueue_many(messages)  # commits the batch
+
+        totals["reminded"] += sum(len(names) for names in due_names.values())
+        totals["messages"] += len(messages)
+        totals["rescheduled"] += len(rows)
+        if len(rows) < batch_size:
+            return totals
@@ -0,0 +1,148 @@
+"""Full-text habit search backed by an SQLite FTS5 index.
+
+``habit_fts`` holds one row per habit (``rowid`` = ``habit.id``) with the
+habit's name, description and category name, plus an ``owner`` token
+(``u<user_id>``). Matching ``owner:u<id>`` inside the FTS query intersects
+posting lists instead of filtering every match across all users
+afterwards, so a search only touches the signed-in user's entries.
+
+Short prefixes, the common search-as-you-type case, are served from
+FTS5's 2- and 3-character prefix indexes instead of a term-range scan.
+
+Triggers on ``habit`` and ``category`` keep the index in step with every
+write, including bulk statements that bypass the ORM. The table and
+triggers are created with the ``habit`` table and, for existing databases,
+by ``create_search_index`` from the migrations.
+"""
+
+import re
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import event
+
+from extensions import db
+from models import Habit
+
+MAX_TERMS = 8
+
+# bm25 weights, in column order: name, description, category, owner
+RANK_WEIGHTS = (10.0, 2.0, 5.0, 0.0)
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+_HABIT_DOCUMENT = """
+    VALUES (
+        new.id,
+        new.name,
+        coalesce(new.description, ''),
+        coalesce((SELECT name FROM category WHERE id = new.category_id), ''),
+        'u' || coalesce(new.user_id, 0)
+    )
+"""
+
+SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS habit_fts
+    USING fts5(name, description, category, owner, prefix='2 3')
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS habit_fts_insert AFTER INSERT ON habit BEGIN
+        INSERT INTO habit_fts (rowid, name, description, category, owner) {_HABIT_DOCUMENT};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS habit_fts_delete AFTER DELETE ON habit BEGIN
+        DELETE FROM habit_fts WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS habit_fts_update
+    AFTER UPDATE OF name, description, category_id, user_id ON habit BEGIN
+        DELETE FROM habit_fts WHERE rowid = old.id;
+        INSERT INTO habit_fts (rowid, name, description, category, owner) {_HABIT_DOCUMENT};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS category_fts_rename AFTER UPDATE OF name ON category BEGIN
+        UPDATE habit_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM habit WHERE category_id = new.id);
+    END
+    """,
+]
+
+REBUILD = """
+    INSERT INTO habit_fts (rowid, name, description, category, owner)
+    SELECT habit.id, habit.name, coalesce(habit.description, ''),
+           coalesce(category.name, ''), 'u' || coalesce(habit.user_id, 0)
+    FROM habit LEFT JOIN category ON category.id = habit.category_id
+"""
+
+
+def _create_schema(connection):
+    created = not connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'habit_fts'"
+    ).first()
+    for statement in SCHEMA:
+        connection.exec_driver_sql(statement)
+    if created:
+        connection.exec_driver_sql(REBUILD)
+    return created
+
+
+@event.listens_for(Habit.__table__, "after_create")
+def _after_habit_create(target, connection, **kw):
+    _create_schema(connection)
+
+
+def create_search_index():
+    """Create the FTS table and triggers if missing, indexing existing habits.
+
+    Returns True if the index was created.
+    """
+    created = _create_schema(db.session.connection())
+    db.session.commit()
+    return created
+
+
+def match_expression(text, user_id):
+    """Build an FTS5 query: every word as a prefix, ANDed, scoped to ``user_id``.
+
+    Returns None if ``text`` has no searchable words. Only ``\\w`` runs are
+    kept, so user input can never inject FTS5 syntax.
+    """
+    terms = _TERM.findall(text or "")[:MAX_TERMS]
+    if not terms:
+        return None
+    return " AND ".join([f"owner:u{int(user_id)}", *(f'"{term}"*' for term in terms)])
+
+
+def search_habits(user_id, text, category_id=None, archived=False,
+                  created_from=None, created_to=None, limit=20):
+    """Return ``user_id``'s habits matching ``text``, best match first.
+
+    ``archived`` is True, False, or None for both. ``created_from`` and
+    ``created_to`` are inclusive dates. Returns an empty list when
+    ``text`` contains no searchable words.
+    """
+    match = match_expression(text, user_id)
+    if match is None:
+        return []
+
+    fts = db.table("habit_fts", db.column("rowid"))
+    rank = db.func.bm25(db.literal_column("habit_fts"), *RANK_WEIGHTS)
+    query = (
+        db.select(Habit)
+        .join(fts, fts.c.rowid == Habit.id)
+        .where(db.literal_column("habit_fts").op("MATCH")(match), Habit.user_id == user_id)
+    )
+    if category_id is not None:
+        query = query.where(Habit.category_id == category_id)
+    if archived is not None:
+        query = query.where(Habit.is_archived.is_(archived))
+    if created_from is not None:
+        query = query.where(Habit.created_at >= datetime.combine(created_from, time.min))
+    if created_to is not None:
+        query = query.where(
+            Habit.created_at < datetime.combine(created_to + timedelta(days=1), time.min)
+        )
+    return db.session.scalars(query.order_by(rank, Habit.id).limit(limit)).unique().all()
@@ -0,0 +1,356 @@
+"""Optional sharding of per-user data across several SQLite files.
+
+SQLite allows one writer per database file, so with a single ``app.db``
+every commit in the app queues behind every other. With ``SHARDS = N``
+each user's rows (account, habits, categories, completions, change log)
+live in one of N files instead, and writers on different shards never wait
+for each other.
+
+- The main database (``SQLALCHEMY_DATABASE_URI``) keeps the tables in
+  ``SHARED_TABLES``: the ``user_shard`` directory, OTP codes, rate-limit
+  buckets and the mail queue. Shards hold everything else, including their
+  own copy of the global categories.
+- ``db.session`` is a ``RoutingSession`` (extensions.py): statements on
+  per-user tables go to the shard in ``current_shard``. At the start of a
+  request the signed-in user's directory entry selects it, so routes use
+  ``db.session`` and the models as before.
+- New users go to ``shard_for(email)``. The directory hands out user ids,
+  so ids are unique across shards and caches keyed by user id stay correct.
+- ``map_shards`` runs a function against every shard in parallel threads;
+  schema creation, reminders, streak repair and ``flask shard-stats`` use
+  it.
+- ``rebalance`` moves users whose shard no longer matches ``shard_for``
+  (after ``SHARDS`` grows), and the users of an unsharded ``app.db`` into
+  their shards.
+
+Shard files default to the main file's name with ``.shard<N>`` before the
+extension (``app.shard0.db``...); ``SHARD_DATABASE_URI`` overrides that
+with a template containing ``{index}``.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import current_app, request, request_started, request_tearing_down, session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+
+from extensions import SHARED_TABLES, current_shard, db, shard_bind_key
+from models import Category, Habit, HabitChange, HabitCompletion, User, UserShard
+
+_TOKEN_KEY = "habits.shard_token"
+
+
+def shard_for(email, count):
+    """Return the shard a new user with ``email`` belongs on."""
+    digest = hashlib.sha1(email.strip().lower().encode()).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def shard_uri(config, index):
+    """Return the database URI of shard ``index``."""
+    template = config.get("SHARD_DATABASE_URI")
+    if template:
+        return template.format(index=index)
+    url = make_url(config.get("SQLALCHEMY_DATABASE_URI", "sqlite://"))
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        raise ValueError("SHARDS needs a SQLite file database or SHARD_DATABASE_URI")
+    root, ext = os.path.splitext(url.database)
+    return url.set(database=f"{root}.shard{index}{ext}").render_as_string(hide_password=False)
+
+
+def shard_indexes(app=None):
+    """Return the shard indexes of ``app``, or ``[None]`` (the main database) if unsharded."""
+    count = (app or current_app).config.get("SHARDS", 0)
+    return list(range(count)) if count else [None]
+
+
+def _engine(index):
+    return db.engines[None if index is None else shard_bind_key(index)]
+
+
+@contextmanager
+def use_shard(index):
+    """Route ``db.session`` to shard ``index`` (None: the main database) in the block."""
+    token = current_shard.set(index)
+    try:
+        yield
+    finally:
+        current_shard.reset(token)
+
+
+def _run_on_shard(app, index, function, args):
+    with app.app_context(), use_shard(index):
+        try:
+            return function(*args)
+        finally:
+            db.session.remove()
+
+
+def map_shards(app, function, *args):
+    """Call ``function(*args)`` once per shard, in parallel; return the results in shard order.
+
+    Each call gets its own app context and session routed to its shard.
+    Unsharded apps call it once, against the main database.
+    """
+    indexes = shard_indexes(app)
+    if len(indexes) == 1:
+        return [_run_on_shard(app, indexes[0], function, args)]
+    with ThreadPoolExecutor(max_workers=len(indexes), thread_name_prefix="shard") as pool:
+        futures = [pool.submit(_run_on_shard, app, index, function, args) for index in indexes]
+        return [future.result() for future in futures]
+
+
+def _select_shard(sender, **extra):
+    request.environ[_TOKEN_KEY] = current_shard.set(None)
+    user_id = session.get("user_id") if session.get("authenticated") else None
+    if user_id is None:
+        return
+    entry = db.session.get(UserShard, user_id)
+    if entry is None:
+        # Signed in before sharding was enabled: current_user_id looks the user up again
+        session.pop("user_id")
+    else:
+        current_shard.set(entry.shard)
+
+
+def _reset_shard(sender, **extra):
+    token = request.environ.pop(_TOKEN_KEY, None)
+    if token is not None:
+        current_shard.reset(token)
+
+
+def init_sharding(app):
+    """Add the shard databases to ``app``'s binds and route requests to them.
+
+    Must run before ``init_db_engine``. Does nothing (and returns False)
+    unless ``SHARDS`` is set.
+    """
+    count = app.config.get("SHARDS", 0)
+    if not count:
+        return False
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    for index in range(count):
+        binds[shard_bind_key(index)] = shard_uri(app.config, index)
+    app.config["SQLALCHEMY_BINDS"] = binds
+    request_started.connect(_select_shard, app)
+    request_tearing_down.connect(_reset_shard, app)
+    return True
+
+
+def get_or_create_sharded_user(email):
+    """Return the User for ``email`` from its shard, creating both on first sign-in.
+
+    Also routes the rest of the current request or command to that shard.
+    """
+    entry = db.session.scalar(db.select(UserShard).where(UserShard.email == email))
+    if entry is None:
+        entry = UserShard(email=email, shard=shard_for(email, current_app.config["SHARDS"]))
+        db.session.add(entry)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent first sign-in created it
+            db.session.rollback()
+            entry = db.session.scalar(db.select(UserShard).where(UserShard.email == email))
+
+    current_shard.set(entry.shard)
+    user = db.session.get(User, entry.id)
+    if user is None:
+        user = User(id=entry.id, email=email)
+        db.session.add(user)
+        db.session.commit()
+    return user
+
+
+def _create_shard_schema(migrate):
+    bind = db.session.get_bind()
+    db.metadata.create_all(
+        bind, tables=[t for t in db.metadata.sorted_tables if t.name not in SHARED_TABLES]
+    )
+    migrate()
+    db.session.commit()
+
+
+def create_schemas(app, migrate):
+    """Create the shared tables in the main database and migrate every shard.
+
+    ``migrate`` (``migrations.run_migrations``) runs on each shard in
+    parallel.
+    """
+    db.metadata.create_all(
+        _engine(None), tables=[t for t in db.metadata.sorted_tables if t.name in SHARED_TABLES]
+    )
+    map_shards(app, _create_shard_schema, migrate)
+
+
+def _count_rows():
+    return {
+        "shard": current_shard.get(),
+        "users": db.session.scalar(db.select(db.func.count(User.id))),
+        "habits": db.session.scalar(db.select(db.func.count(Habit.id))),
+    }
+
+
+def shard_stats(app):
+    """Return ``{"shard", "users", "habits"}`` for every shard, counted in parallel."""
+    return map_shards(app, _count_rows)
+
+
+# --- Moving users between shards ---
+
+_SEQUENCE = "SELECT seq FROM sqlite_sequence WHERE name = 'habit_change'"
+
+
+def _raise_change_sequence(dst, floor):
+    # Versions a client got from the old shard must stay below the new ones
+    dst.exec_driver_sql(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'habit_change', 0 "
+        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'habit_change')"
+    )
+    dst.exec_driver_sql(
+        "UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'habit_change'", (floor,)
+    )
+
+
+def _copy_categories(src, dst, user_id, new_id):
+    table = Category.__table__
+    global_ids = dict(dst.execute(
+        db.select(table.c.name, table.c.id).where(table.c.user_id.is_(None))
+    ).all())
+    own_ids = dict(dst.execute(
+        db.select(table.c.name, table.c.id).where(table.c.user_id == new_id)
+    ).all())
+    mapping = {}
+    for row in src.execute(
+        db.select(table).where(db.or_(table.c.user_id.is_(None), table.c.user_id == user_id))
+    ).mappings():
+        if row["user_id"] is None:
+            mapping[row["id"]] = global_ids.get(row["name"])
+        elif row["name"] in own_ids:
+            mapping[row["id"]] = own_ids[row["name"]]
+        else:
+            values = {**row, "user_id": new_id}
+            del values["id"]
+            mapping[row["id"]] = dst.execute(db.insert(table).values(values)).inserted_primary_key[0]
+    return mapping
+
+
+def _copy_user(src, dst, user_id, new_id):
+    """Copy ``user_id``'s rows from ``src`` to ``dst`` as ``new_id``; return the old habit ids."""
+    users, habits, completions = User.__table__, Habit.__table__, HabitCompletion.__table__
+    user = src.execute(db.select(users).where(users.c.id == user_id)).mappings().one()
+    if dst.execute(db.select(users.c.id).where(users.c.id == new_id)).first() is None:
+        dst.execute(db.insert(users).values({**user, "id": new_id}))
+    _raise_change_sequence(dst, src.exec_driver_sql(_SEQUENCE).scalar() or 0)
+
+    categories = _copy_categories(src, dst, user_id, new_id)
+    habit_ids = {}
+    for row in src.execute(db.select(habits).where(habits.c.user_id == user_id)).mappings():
+        values = {**row, "user_id": new_id, "category_id": categories.get(row["category_id"])}
+        del values["id"]
+        habit_ids[row["id"]] = dst.execute(db.insert(habits).values(values)).inserted_primary_key[0]
+
+    rows = []
+    for row in src.execute(
+        db.select(completions).where(completions.c.habit_id.in_(list(habit_ids)))
+    ).mappings():
+        values = {**row, "habit_id": habit_ids[row["habit_id"]],
+                  "user_id": new_id if row["user_id"] is not None else None}
+        del values["id"]
+        rows.append(values)
+    if rows:
+        dst.execute(db.insert(completions), rows)
+
+    # Habits get new ids on the new shard: tell sync clients the old ones are gone
+    stale = set(habit_ids) - set(habit_ids.values())
+    if stale:
+        now = datetime.utcnow()
+        dst.execute(
+            sqlite_insert(HabitChange.__table__).prefix_with("OR REPLACE"),
+            [{"user_id": new_id, "habit_id": habit_id, "deleted": True, "changed_at": now}
+             for habit_id in sorted(stale)],
+        )
+    return list(habit_ids)
+
+
+def _delete_user(src, user_id):
+    habits = db.select(Habit.__table__.c.id).where(Habit.__table__.c.user_id == user_id)
+    completions = HabitCompletion.__table__
+    src.execute(db.delete(completions).where(completions.c.habit_id.in_(habits)))
+    src.execute(db.delete(Habit.__table__).where(Habit.__table__.c.user_id == user_id))
+    src.execute(db.delete(HabitChange.__table__).where(HabitChange.__table__.c.user_id == user_id))
+    src.execute(db.delete(Category.__table__).where(Category.__table__.c.user_id == user_id))
+    src.execute(db.delete(User.__table__).where(User.__table__.c.id == user_id))
+
+
+def move_user(user_id, source, target, new_id=None):
+    """Move a user's rows from shard ``source`` to ``target`` (None: the main database).
+
+    The source shard's write lock is held for the whole move, so no write
+    for the user is lost. Habits get new ids on the target; the user keeps
+    ``user_id`` unless ``new_id`` is given. The directory is updated once
+    the target has committed and before the source copy is deleted.
+    Returns the number of habits moved.
+    """
+    new_id = new_id or user_id
+    users = User.__table__
+    with _engine(source).begin() as src:
+        # A no-op write takes the source's write lock until we commit
+        src.execute(db.update(users).where(users.c.id == user_id).values(email=users.c.email))
+        with _engine(target).begin() as dst:
+            moved = _copy_user(src, dst, user_id, new_id)
+        if source is not None:
+            with _engine(None).begin() as main:
+                main.execute(
+                    db.update(UserShard.__table__)
+                    .where(UserShard.__table__.c.id == new_id)
+                    .values(shard=target, moved_at=datetime.utcnow())
+                )
+        _delete_user(src, user_id)
+    return len(moved)
+
+
+def _legacy_users():
+    """Return ``(id, email)`` of users still in an unsharded main database."""
+    main = _engine(None)
+    if not db.inspect(main).has_table(User.__tablename__):
+        return []
+    with main.connect() as connection:
+        return connection.execute(db.select(User.__table__.c.id, User.__table__.c.email)).all()
+
+
+def rebalance(app, dry_run=False):
+    """Put every user on the shard ``shard_for`` picks under the current ``SHARDS``.
+
+    Users left in the main database from before sharding are given
+    directory entries and moved too, so run this once after turning
+    sharding on and whenever ``SHARDS`` changes. Returns the moves as
+    ``(email, source, target)`` tuples.
+    """
+    count = app.config["SHARDS"]
+    moves = []
+    for user_id, email in _legacy_users():
+        entry = db.session.scalar(db.select(UserShard).where(UserShard.email == email))
+        if entry is None:
+            entry = UserShard(email=email, shard=shard_for(email, count))
+            db.session.add(entry)
+            if not dry_run:
+                db.session.commit()
+        moves.append((email, None, entry.shard))
+        if not dry_run:
+            move_user(user_id, None, entry.shard, new_id=entry.id)
+
+    for entry in db.session.scalars(db.select(UserShard).order_by(UserShard.id)).all():
+        target = shard_for(entry.email, count)
+        if entry.shard != target:
+            moves.append((entry.email, entry.shard, target))
+            if not dry_run:
+                move_user(entry.id, entry.shard, target)
+    if dry_run:
+        db.session.rollback()
+    return moves
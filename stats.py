@@ -0,0 +1,171 @@
+"""Completion statistics for ``/habit-tracker/stats``.
+
+Completions in the requested range come back from SQLite already grouped
+(one row per habit, one row per category id/day), and each habit's history is
+turned into an integer bitmap with bit ``i`` set when the habit was done on
+``start + i`` days. Weekday distributions and window rates are then
+popcounts of the bitmap ANDed with precomputed masks, so the per-habit work
+is a handful of big-integer operations rather than a loop over days.
+"""
+
+from datetime import date, timedelta
+from itertools import accumulate
+
+from extensions import db
+from models import Category, Habit, HabitCompletion
+
+DEFAULT_RANGE_DAYS = 365
+MAX_RANGE_DAYS = 731
+UNCATEGORIZED = "Uncategorized"
+
+
+def _popcount(bits):
+    return bin(bits).count("1")
+
+
+def weekday_masks(start, days):
+    """Return seven bitmaps, Monday first, selecting the days of that weekday."""
+    masks = []
+    for weekday in range(7):
+        first = (weekday - start.weekday()) % 7
+        mask = 0
+        for offset in range(first, days, 7):
+            mask |= 1 << offset
+        masks.append(mask)
+    return masks
+
+
+def completion_bitmaps(habit_ids, start, end):
+    """Return ``{habit_id: bitmap}`` of completions between ``start`` and ``end``."""
+    offset = db.cast(
+        db.func.julianday(HabitCompletion.completed_on) - db.func.julianday(start.isoformat()),
+        db.Integer,
+    )
+    rows = db.session.execute(
+        db.select(HabitCompletion.habit_id, db.func.group_concat(offset))
+        .where(
+            HabitCompletion.habit_id.in_(habit_ids),
+            HabitCompletion.completed_on >= start,
+            HabitCompletion.completed_on <= end,
+        )
+        .group_by(HabitCompletion.habit_id)
+    )
+    bitmaps = {habit_id: 0 for habit_id in habit_ids}
+    for habit_id, offsets in rows:
+        bits = 0
+        for value in offsets.split(","):
+            bits |= 1 << int(value)
+        bitmaps[habit_id] = bits
+    return bitmaps
+
+
+def category_daily_counts(user_id, start, end, days, include_archived):
+    """Return ``{category_id: [completions per day]}`` from one GROUP BY query."""
+    offset = db.cast(
+        db.func.julianday(HabitCompletion.completed_on) - db.func.julianday(start.isoformat()),
+        db.Integer,
+    )
+    query = (
+        db.select(Habit.category_id, offset, db.func.count())
+        .join(Habit, Habit.id == HabitCompletion.habit_id)
+        .where(
+            HabitCompletion.user_id == user_id,
+            HabitCompletion.completed_on >= start,
+            HabitCompletion.completed_on <= end,
+        )
+        .group_by(Habit.category_id, offset)
+    )
+    if not include_archived:
+        query = query.where(Habit.is_archived.is_(False))
+
+    counts = {}
+    for category_id, day, count in db.session.execute(query):
+        counts.setdefault(category_id, [0] * days)[day] = count
+    return counts
+
+
+def _rate(bits, days, window):
+    window = min(window, days)
+    return round(_popcount(bits >> (days - window)) / window, 4)
+
+
+def habit_stats(user_id, end=None, days=DEFAULT_RANGE_DAYS, include_archived=False):
+    """Compute heatmaps, weekday distributions and completion rates.
+
+    Covers the ``days`` days ending on ``end`` (default today). Returns a
+    JSON-serializable dict with per-habit, per-category and daily series.
+    """
+    end = end or date.today()
+    days = max(1, min(days, MAX_RANGE_DAYS))
+    start = end - timedelta(days=days - 1)
+
+    query = (
+        db.select(Habit.id, Habit.name, Habit.category_id, Category.name)
+        .outerjoin(Category, Category.id == Habit.category_id)
+        .where(Habit.user_id == user_id)
+    )
+    if not include_archived:
+        query = query.where(Habit.is_archived.is_(False))
+    habits = db.session.execute(query.order_by(Habit.id)).all()
+
+    bitmaps = completion_bitmaps([habit.id for habit in habits], start, end)
+    masks = weekday_masks(start, days)
+
+    habit_rows = []
+    category_names = {}
+    category_habits = {}
+    category_weekdays = {}
+    for habit_id, name, category_id, category in habits:
+        bits = bitmaps[habit_id]
+        weekdays = [_popcount(bits & mask) for mask in masks]
+        category = category or UNCATEGORIZED
+        category_names[category_id] = category
+        category_habits[category_id] = category_habits.get(category_id, 0) + 1
+        category_weekdays[category_id] = [
+            a + b for a, b in zip(category_weekdays.get(category_id, [0] * 7), weekdays)
+        ]
+        habit_rows.append({
+            "id": habit_id,
+            "name": name,
+            "category_id": category_id,
+            "category": category,
+            "total": _popcount(bits),
+            # One character per day, oldest first
+            "heatmap": format(bits, f"0{days}b")[::-1],
+            "weekdays": weekdays,
+            "rate_7d": _rate(bits, days, 7),
+            "rate_30d": _rate(bits, days, 30),
+            "rate_range": _rate(bits, days, days),
+        })
+
+    category_counts = category_daily_counts(user_id, start, end, days, include_archived)
+    categories = []
+    daily = [0] * days
+    for category_id in sorted(category_habits, key=category_names.get):
+        heatmap = category_counts.get(category_id, [0] * days)
+        daily = [a + b for a, b in zip(daily, heatmap)]
+        categories.append({
+            "category_id": category_id,
+            "category": category_names[category_id],
+            "habits": category_habits[category_id],
+            "total": sum(heatmap),
+            "heatmap": heatmap,
+            "weekdays": category_weekdays[category_id],
+        })
+
+    prefix = [0, *accumulate(daily)]
+    # The first six windows are cut short by the start of the range
+    rolling = [
+        round((prefix[i + 1] - prefix[max(0, i - 6)]) / (min(i + 1, 7) * len(habits)), 4)
+        if habits else 0.0
+        for i in range(days)
+    ]
+
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": days,
+        "habits": habit_rows,
+        "categories": categories,
+        "daily": {"completions": daily, "rolling_7d_rate": rolling},
+    }
@@ -0,0 +1,333 @@
+"""Streak computation over the indexed ``habit_completion`` table.
+
+Streaks are derived from ``HabitCompletion.completed_on`` with set-based
+queries rather than by parsing the legacy ``Habit.completed_dates`` text.
+Consecutive days are grouped into runs ("gaps and islands") in SQL, so the
+Python side only ever sees one row per run instead of one row per day.
+
+The habit list does not call into this module on render: it reads the
+denormalized counters on ``Habit`` that ``record_completion`` and
+``remove_completion`` keep up to date, and ``repair_counters`` rebuilds
+them from the raw history.
+"""
+
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import history
+from extensions import db
+from models import RECENT_WINDOW_DAYS, Habit, HabitCompletion, User
+
+StreakSummary = namedtuple("StreakSummary", ["current", "longest", "last_completed_on"])
+
+EMPTY_SUMMARY = StreakSummary(current=0, longest=0, last_completed_on=None)
+
+COUNTER_FIELDS = (
+    "current_streak",
+    "best_streak",
+    "last_completed_on",
+    "recent_completions",
+    "completion_bits",
+    "completion_bits_start",
+)
+
+
+def _today():
+    return datetime.utcnow().date()
+
+
+def _as_date(value):
+    # SQLite hands back aggregates over Date columns as ISO strings
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    return value
+
+
+def _runs_query(habit_ids):
+    """Group completions into runs of consecutive days per habit.
+
+    ``julianday(day) - row_number()`` is constant within a run of
+    consecutive days, so grouping on it yields one row per run.
+    """
+    ordinal = db.func.row_number().over(
+        partition_by=HabitCompletion.habit_id,
+        order_by=HabitCompletion.completed_on,
+    )
+    numbered = (
+        db.select(
+            HabitCompletion.habit_id.label("habit_id"),
+            HabitCompletion.completed_on.label("completed_on"),
+            (db.func.julianday(HabitCompletion.completed_on) - ordinal).label("run_key"),
+        )
+        .where(HabitCompletion.habit_id.in_(habit_ids))
+        .subquery()
+    )
+    return db.select(
+        numbered.c.habit_id,
+        db.func.min(numbered.c.completed_on).label("run_start"),
+        db.func.max(numbered.c.completed_on).label("run_end"),
+        db.func.count().label("length"),
+    ).group_by(numbered.c.habit_id, numbered.c.run_key)
+
+
+def current_streak(habit_id, today=None):
+    """Return the number of consecutive days ending today (or yesterday).
+
+    Walks the ``(habit_id, completed_on)`` index backwards from ``today`` and
+    stops at the first gap, so the cost is bounded by the streak length.
+    """
+    today = today or _today()
+    rows = db.session.execute(
+        db.select(HabitCompletion.completed_on)
+        .where(HabitCompletion.habit_id == habit_id, HabitCompletion.completed_on <= today)
+        .order_by(HabitCompletion.completed_on.desc())
+        .execution_options(yield_per=64)
+    ).scalars()
+
+    streak = 0
+    expected = None
+    for day in rows:
+        if expected is None:
+            if day < today - timedelta(days=1):
+                break
+        elif day != expected:
+            break
+        streak += 1
+        expected = day - timedelta(days=1)
+    rows.close()
+    return streak
+
+
+def longest_streak(habit_id):
+    """Return the longest run of consecutive completed days for a habit."""
+    runs = _runs_query([habit_id]).subquery()
+    longest = db.session.execute(db.select(db.func.max(runs.c.length))).scalar()
+    return longest or 0
+
+
+def streak_summaries(habit_ids, today=None):
+    """Return ``{habit_id: StreakSummary}`` for many habits in one query.
+
+    Habits without completions map to ``EMPTY_SUMMARY``.
+    """
+    habit_ids = list(habit_ids)
+    summaries = {habit_id: EMPTY_SUMMARY for habit_id in habit_ids}
+    if not habit_ids:
+        return summaries
+
+    today = today or _today()
+    yesterday = today - timedelta(days=1)
+    for habit_id, run_start, run_end, length in db.session.execute(_runs_query(habit_ids)):
+        run_end = _as_date(run_end)
+        summary = summaries[habit_id]
+        current = summary.current
+        if run_end in (today, yesterday):
+            current = length
+        last = summary.last_completed_on
+        summaries[habit_id] = StreakSummary(
+            current=current,
+            longest=max(summary.longest, length),
+            last_completed_on=run_end if last is None or run_end > last else last,
+        )
+    return summaries
+
+
+def completion_counts(habit_ids, start, end):
+    """Return ``{habit_id: days completed}`` for ``start <= day <= end``."""
+    habit_ids = list(habit_ids)
+    if not habit_ids:
+        return {}
+    rows = db.session.execute(
+        db.select(HabitCompletion.habit_id, db.func.count())
+        .where(
+            HabitCompletion.habit_id.in_(habit_ids),
+            HabitCompletion.completed_on >= start,
+            HabitCompletion.completed_on <= end,
+        )
+        .group_by(HabitCompletion.habit_id)
+    )
+    counts = {habit_id: 0 for habit_id in habit_ids}
+    counts.update(dict(rows.all()))
+    return counts
+
+
+def compute_counters(habit_ids):
+    """Compute the denormalized ``Habit`` counters from raw history.
+
+    Returns ``{habit_id: {field: value}}`` for every id in ``habit_ids``
+    using three grouped queries regardless of how many habits are passed.
+    """
+    habit_ids = list(habit_ids)
+    counters = {
+        habit_id: {
+            "current_streak": 0,
+            "best_streak": 0,
+            "last_completed_on": None,
+            "recent_completions": 0,
+            "completion_bits": None,
+            "completion_bits_start": None,
+        }
+        for habit_id in habit_ids
+    }
+    if not habit_ids:
+        return counters
+
+    for habit_id, _run_start, run_end, length in db.session.execute(_runs_query(habit_ids)):
+        run_end = _as_date(run_end)
+        entry = counters[habit_id]
+        entry["best_streak"] = max(entry["best_streak"], length)
+        if entry["last_completed_on"] is None or run_end > entry["last_completed_on"]:
+            entry["last_completed_on"] = run_end
+            entry["current_streak"] = length
+
+    latest = (
+        db.select(
+            HabitCompletion.habit_id.label("habit_id"),
+            db.func.max(HabitCompletion.completed_on).label("last_day"),
+        )
+        .where(HabitCompletion.habit_id.in_(habit_ids))
+        .group_by(HabitCompletion.habit_id)
+        .subquery()
+    )
+    offset = db.cast(
+        db.func.julianday(latest.c.last_day) - db.func.julianday(HabitCompletion.completed_on),
+        db.Integer,
+    )
+    recent = db.session.execute(
+        db.select(HabitCompletion.habit_id, offset)
+        .join(latest, latest.c.habit_id == HabitCompletion.habit_id)
+        .where(offset < RECENT_WINDOW_DAYS)
+    )
+    for habit_id, days_back in recent:
+        counters[habit_id]["recent_completions"] |= 1 << days_back
+
+    packed = db.session.execute(
+        db.select(
+            HabitCompletion.habit_id,
+            db.func.min(HabitCompletion.completed_on),
+            db.func.group_concat(HabitCompletion.completed_on),
+        )
+        .where(HabitCompletion.habit_id.in_(habit_ids))
+        .group_by(HabitCompletion.habit_id)
+    )
+    for habit_id, first_day, days in packed:
+        start = _as_date(first_day)
+        counters[habit_id]["completion_bits_start"] = start
+        counters[habit_id]["completion_bits"] = history.encode_days(
+            (date.fromisoformat(day) for day in days.split(",")), start
+        )
+    return counters
+
+
+def _apply_counters(habit, values):
+    for field in COUNTER_FIELDS:
+        setattr(habit, field, values[field])
+
+
+def refresh_counters(habit):
+    """Recompute one habit's counters from its history (bounded index scan)."""
+    db.session.flush()
+    _apply_counters(habit, compute_counters([habit.id])[habit.id])
+
+
+def record_completion(habit, day):
+    """Add a completion for ``day`` and update the habit's counters in place.
+
+    The caller commits, so the new row and the counters land in the same
+    transaction. Returns False if ``day`` was already recorded.
+    """
+    # A conflict (already recorded, possibly by a concurrent request) inserts
+    # nothing. No savepoint: with pysqlite one opened before any other write
+    # becomes the outer transaction and releasing it would commit.
+    inserted = db.session.execute(
+        sqlite_insert(HabitCompletion)
+        .values(habit_id=habit.id, user_id=habit.user_id, completed_on=day)
+        .on_conflict_do_nothing(index_elements=["habit_id", "completed_on"])
+    ).rowcount
+    if not inserted:
+        return False
+
+    habit.completion_bits, habit.completion_bits_start = history.set_day(
+        habit.completion_bits, habit.completion_bits_start, day
+    )
+    last = habit.last_completed_on
+    if last is not None and day <= last:
+        # Back-filling a past day can join runs; rebuild from history
+        refresh_counters(habit)
+        return True
+
+    gap = (day - last).days if last is not None else None
+    window = (1 << RECENT_WINDOW_DAYS) - 1
+    if gap is None or gap >= RECENT_WINDOW_DAYS:
+        habit.recent_completions = 1
+    else:
+        habit.recent_completions = ((habit.recent_completions or 0) << gap | 1) & window
+    habit.current_streak = (habit.current_streak or 0) + 1 if gap == 1 else 1
+    habit.best_streak = max(habit.best_streak or 0, habit.current_streak)
+    habit.last_completed_on = day
+    return True
+
+
+def remove_completion(habit, day):
+    """Delete the completion for ``day`` and update the habit's counters.
+
+    Undo is rare and can shorten ``best_streak`` or expose history outside
+    the recent window, so the counters are rebuilt for this habit only.
+    Returns False if there was nothing to remove.
+    """
+    deleted = (
+        HabitCompletion.query.filter_by(habit_id=habit.id, completed_on=day)
+        .delete(synchronize_session=False)
+    )
+    if not deleted:
+        return False
+    refresh_counters(habit)
+    return True
+
+
+def repair_counters(habit_ids=None, fix=True, batch_size=500):
+    """Rebuild ``Habit`` counters from raw history and report drift.
+
+    Processes habits in batches of ``batch_size``. Returns a list of
+    ``{"habit_id", "field", "stored", "expected"}`` dicts, one per drifted
+    value. When ``fix`` is true the expected values are written back and
+    committed.
+    """
+    query = db.select(Habit).order_by(Habit.id)
+    if habit_ids is not None:
+        query = query.where(Habit.id.in_(list(habit_ids)))
+
+    drift = []
+    changed_users = set()
+    last_id = 0
+    while True:
+        batch = db.session.execute(
+            query.where(Habit.id > last_id).limit(batch_size)
+        ).scalars().all()
+        if not batch:
+            break
+        expected = compute_counters(habit.id for habit in batch)
+        for habit in batch:
+            values = expected[habit.id]
+            for field in COUNTER_FIELDS:
+                stored = getattr(habit, field)
+                if stored != values[field]:
+                    drift.append({
+                        "habit_id": habit.id,
+                        "field": field,
+                        "stored": stored,
+                        "expected": values[field],
+                    })
+                    changed_users.add(habit.user_id)
+            if fix:
+                _apply_counters(habit, values)
+        last_id = batch[-1].id
+        if fix:
+            db.session.commit()
+    if fix:
+        for user_id in changed_users - {None}:
+            User.bump_habits_version(user_id)
+        db.session.commit()
+    return drift
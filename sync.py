@@ -0,0 +1,319 @@
+"""Delta sync for offline-first clients.
+
+``habit_change`` keeps one row per (owner, habit): the habit's latest
+change. Triggers on ``habit`` rewrite the row on every insert, update of a
+synced column and delete, so bulk statements, imports and migrations are
+covered without touching each write path. Because the table is
+AUTOINCREMENT, the rewritten row gets a fresh, higher id; that id is the
+sync version. A habit moved to another owner leaves a tombstone for the old
+one, and renaming a category marks the habits in it.
+
+``changes_since`` answers ``GET /habit-tracker/api/sync?since=N`` with one
+indexed range scan over the user's rows above N plus one query for the
+changed habits, so work and payload scale with what changed rather than
+with the habit count. ``next_due_at`` is recomputed by the reminder
+dispatcher without counting as a change, and day-dependent fields such as
+``current_streak`` are as of the sync.
+
+``apply_changes`` takes a client's batched edits. Each edit names the
+version it was based on (``base_version``, per edit or for the whole
+upload). An update or delete of a habit changed on the server since then is
+a conflict: it is not applied and the server copy is returned, unless the
+edit sets ``force``. Check-ins (``complete``/``uncomplete``) commute and
+never conflict.
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import event
+
+from categories import resolve_category
+from extensions import db
+from models import MAX_HABIT_NAME_LENGTH, Habit, HabitChange
+from schedules import next_due
+from streaks import record_completion, remove_completion
+
+MAX_CHANGES = 500
+# Page sizes for GET /habit-tracker/api/sync (see pagination.parse_page_size)
+SYNC_PAGE_SIZE = 500
+MAX_SYNC_PAGE_SIZE = 2000
+
+OPERATIONS = ("create", "update", "delete", "complete", "uncomplete")
+UPDATABLE = ("name", "description", "category", "is_archived")
+
+# Every habit column that appears in Habit.to_dict, except next_due_at
+_SYNCED_COLUMNS = (
+    "name, description, category_id, user_id, is_archived, archived_at, current_streak, "
+    "best_streak, last_completed_on, recent_completions, completion_bits, "
+    "completion_bits_start, schedule, schedule_days, times_per_week, reminder_time, "
+    "reminder_timezone"
+)
+
+_RECORD = """
+    INSERT OR REPLACE INTO habit_change (user_id, habit_id, deleted, changed_at)
+"""
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS habit_change_insert AFTER INSERT ON habit
+    WHEN new.user_id IS NOT NULL BEGIN
+        {_RECORD} VALUES (new.user_id, new.id, 0, CURRENT_TIMESTAMP);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS habit_change_update
+    AFTER UPDATE OF {_SYNCED_COLUMNS} ON habit BEGIN
+        {_RECORD} SELECT old.user_id, old.id, 1, CURRENT_TIMESTAMP
+            WHERE old.user_id IS NOT NULL AND old.user_id IS NOT new.user_id;
+        {_RECORD} SELECT new.user_id, new.id, 0, CURRENT_TIMESTAMP
+            WHERE new.user_id IS NOT NULL;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS habit_change_delete AFTER DELETE ON habit
+    WHEN old.user_id IS NOT NULL BEGIN
+        {_RECORD} VALUES (old.user_id, old.id, 1, CURRENT_TIMESTAMP);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS category_change_rename AFTER UPDATE OF name ON category BEGIN
+        {_RECORD} SELECT user_id, id, 0, CURRENT_TIMESTAMP FROM habit
+            WHERE category_id = new.id AND user_id IS NOT NULL;
+    END
+    """,
+]
+
+BACKFILL = f"""
+    {_RECORD} SELECT user_id, id, 0, CURRENT_TIMESTAMP FROM habit
+    WHERE user_id IS NOT NULL ORDER BY id
+"""
+
+
+class SyncRequestError(ValueError):
+    """Raised when a sync request as a whole is malformed."""
+
+
+def _create_triggers(connection):
+    created = not connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'habit_change_insert'"
+    ).first()
+    for statement in TRIGGERS:
+        connection.exec_driver_sql(statement)
+    return created
+
+
+@event.listens_for(Habit.__table__, "after_create")
+def _after_habit_create(target, connection, **kw):
+    _create_triggers(connection)
+
+
+def create_change_log():
+    """Create the change-log triggers if missing, recording existing habits.
+
+    Expects the ``habit_change`` table to exist (``db.create_all``).
+    Returns True if the triggers were created.
+    """
+    connection = db.session.connection()
+    created = _create_triggers(connection)
+    if created:
+        connection.exec_driver_sql(BACKFILL)
+    db.session.commit()
+    return created
+
+
+def current_version(user_id):
+    """Return the user's latest sync version (0 if nothing ever changed)."""
+    return db.session.scalar(
+        db.select(db.func.max(HabitChange.id)).where(HabitChange.user_id == user_id)
+    ) or 0
+
+
+def parse_since(raw):
+    """Parse the ``since`` query argument; raise SyncRequestError if invalid."""
+    try:
+        since = int(raw or 0)
+    except ValueError:
+        raise SyncRequestError("'since' must be a sync version") from None
+    if since < 0:
+        raise SyncRequestError("'since' must be a sync version")
+    return since
+
+
+def changes_since(user_id, since, today, limit=SYNC_PAGE_SIZE):
+    """Return the user's habit changes after version ``since``, oldest first.
+
+    ``version`` in the result is the value to send as ``since`` next time;
+    ``has_more`` is True if the page was cut off at ``limit``.
+    """
+    rows = db.session.execute(
+        db.select(HabitChange.id, HabitChange.habit_id, HabitChange.deleted)
+        .where(HabitChange.user_id == user_id, HabitChange.id > since)
+        .order_by(HabitChange.id)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    live_ids = [row.habit_id for row in rows if not row.deleted]
+    habits = {}
+    if live_ids:
+        habits = {
+            habit.id: habit
+            for habit in db.session.scalars(
+                db.select(Habit).where(Habit.id.in_(live_ids), Habit.user_id == user_id)
+            ).unique()
+        }
+
+    changed = []
+    deleted = []
+    for row in rows:
+        habit = habits.get(row.habit_id)
+        if row.deleted or habit is None:
+            deleted.append({"version": row.id, "id": row.habit_id})
+        else:
+            changed.append({"version": row.id, "habit": habit.to_dict(today)})
+    return {
+        "version": rows[-1].id if rows else since,
+        "has_more": has_more,
+        "changed": changed,
+        "deleted": deleted,
+    }
+
+
+def _result(index, op, status, habit_id=None, **extra):
+    return {"index": index, "op": op, "id": habit_id, "status": status, **extra}
+
+
+def _parse_day(raw):
+    try:
+        return date.fromisoformat(str(raw))
+    except ValueError:
+        return None
+
+
+def _apply_fields(habit, user_id, fields, now):
+    """Apply an ``update``'s fields to ``habit``; return an error message or None."""
+    if "name" in fields:
+        name = str(fields["name"] or "").strip()
+        if not name:
+            return "Name is required"
+        if len(name) > MAX_HABIT_NAME_LENGTH:
+            return f"Name is longer than {MAX_HABIT_NAME_LENGTH} characters"
+        habit.name = name
+    if "description" in fields:
+        habit.description = str(fields["description"] or "").strip() or None
+    if "category" in fields:
+        habit.category_id = resolve_category(user_id, str(fields["category"] or ""))
+    if "is_archived" in fields and bool(fields["is_archived"]) != bool(habit.is_archived):
+        habit.is_archived = bool(fields["is_archived"])
+        habit.archived_at = now if habit.is_archived else None
+        habit.next_due_at = next_due(habit, now)
+    return None
+
+
+def apply_changes(user_id, payload, today):
+    """Apply a client's batched edits for ``user_id`` and return per-edit results.
+
+    ``payload`` is ``{"base_version": n, "changes": [...]}``; each change has
+    an ``op`` of ``create`` (``fields``), ``update`` (``id``, ``fields``),
+    ``delete`` (``id``) or ``complete``/``uncomplete`` (``id``, ``date``),
+    and may carry its own ``base_version`` and ``force``. Statuses are
+    "applied", "conflict" (with the server's ``habit``, or ``deleted``) and
+    "error". The caller commits.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("changes"), list):
+        raise SyncRequestError("'changes' must be a list")
+    changes = payload["changes"]
+    if len(changes) > MAX_CHANGES:
+        raise SyncRequestError(f"At most {MAX_CHANGES} changes per request")
+    base_version = payload.get("base_version", 0)
+    if not isinstance(base_version, int) or isinstance(base_version, bool):
+        raise SyncRequestError("'base_version' must be a sync version")
+
+    ids = {
+        change.get("id") for change in changes
+        if isinstance(change, dict) and isinstance(change.get("id"), int)
+    }
+    habits = {}
+    versions = {}
+    if ids:
+        habits = {
+            habit.id: habit
+            for habit in db.session.scalars(
+                db.select(Habit).where(Habit.id.in_(ids), Habit.user_id == user_id)
+            ).unique()
+        }
+        versions = {
+            row.habit_id: row
+            for row in db.session.execute(
+                db.select(HabitChange.habit_id, HabitChange.id, HabitChange.deleted)
+                .where(HabitChange.user_id == user_id, HabitChange.habit_id.in_(ids))
+            )
+        }
+
+    now = datetime.utcnow()
+    results = []
+    for index, change in enumerate(changes):
+        op = change.get("op") if isinstance(change, dict) else None
+        if op not in OPERATIONS:
+            results.append(_result(index, op, "error", error="Unknown operation"))
+            continue
+
+        if op == "create":
+            fields = change.get("fields") if isinstance(change.get("fields"), dict) else {}
+            habit = Habit(user_id=user_id, name="")
+            error = _apply_fields(habit, user_id, {"name": None, **fields}, now)
+            if error:
+                results.append(_result(index, op, "error", error=error))
+                continue
+            db.session.add(habit)
+            db.session.flush()
+            results.append(_result(index, op, "applied", habit.id,
+                                   client_id=change.get("client_id")))
+            continue
+
+        habit_id = change.get("id")
+        habit = habits.get(habit_id)
+        seen = versions.get(habit_id)
+        if habit is None:
+            if seen is not None and seen.deleted:
+                results.append(_result(index, op, "conflict", habit_id, deleted=True))
+            else:
+                results.append(_result(index, op, "error", habit_id, error="Habit not found"))
+            continue
+
+        if op in ("complete", "uncomplete"):
+            day = _parse_day(change.get("date", today.isoformat()))
+            if day is None:
+                results.append(_result(index, op, "error", habit_id, error="Invalid date"))
+                continue
+            (record_completion if op == "complete" else remove_completion)(habit, day)
+            results.append(_result(index, op, "applied", habit_id))
+            continue
+
+        based_on = change.get("base_version", base_version)
+        if not isinstance(based_on, int) or isinstance(based_on, bool):
+            results.append(_result(index, op, "error", habit_id,
+                                   error="base_version must be a sync version"))
+            continue
+        if seen is not None and seen.id > based_on and not change.get("force"):
+            results.append(_result(index, op, "conflict", habit_id, habit=habit.to_dict(today)))
+            continue
+
+        if op == "delete":
+            db.session.delete(habit)
+            del habits[habit_id]
+            results.append(_result(index, op, "applied", habit_id))
+            continue
+
+        fields = change.get("fields")
+        if not isinstance(fields, dict) or not set(fields) <= set(UPDATABLE):
+            results.append(_result(index, op, "error", habit_id,
+                                   error=f"fields may only contain {', '.join(UPDATABLE)}"))
+            continue
+        error = _apply_fields(habit, user_id, fields, now)
+        results.append(_result(index, op, "error" if error else "applied", habit_id,
+                               **({"error": error} if error else {})))
+
+    db.session.flush()
+    return results
@@ -2,47 +2,115 @@
 Pytest configuration and fixtures for testing.
 
 This module provides shared fixtures used across all test files:
-- app: Flask application instance with test configuration
+- app: Flask application instance with test configuration, on a copy of a
+  template database (seeded by the test's ``dataset`` marker, if any)
+- database_templates: builds each template database once per session
 - client: Flask test client for making HTTP requests
+- otp_store: the OTP store of the test application
+- user_id: the User that logged_in_client is signed in as
+- query_budget: context manager failing a test that runs too many queries
+- clock: a fake ``time.time`` for stores, limiters and queues taking ``clock=``
 """
 
+import shutil
+
 import pytest
 
-from app import app as flask_app
-from app import otp_store
+from app import create_app
+from categories import ensure_default_categories
+from config import TestingConfig
 from extensions import db
+from models import User
+from query_budget import query_budget as _query_budget
+
+
+class FakeClock:
+    """A ``time.time`` stand-in that only moves when a test sets ``now``."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _test_config(db_path):
+    class Config(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{db_path}"
+        SQLALCHEMY_ENGINE_OPTIONS = {"connect_args": {"check_same_thread": False}}
+
+    return Config
+
+
+def _build_database(db_path, seed=None):
+    flask_app = create_app(_test_config(db_path))
+    with flask_app.app_context():
+        db.create_all()
+        ensure_default_categories()
+        if seed is not None:
+            seed()
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def database_templates(tmp_path_factory):
+    """
+    Return a function giving the path of a template database file.
+
+    ``database_templates()`` is the empty schema with default categories;
+    ``database_templates(seed)`` also holds the rows ``seed()`` adds (it runs
+    in an app context and need not commit). Each template is built once per
+    session, and under pytest-xdist once per worker, since every worker has
+    its own temporary directory.
+
+    Args:
+        tmp_path_factory: pytest fixture creating session temporary directories
+
+    Returns:
+        function taking an optional seed callable and returning a path
+    """
+    templates = {}
+
+    def template(seed=None):
+        if seed not in templates:
+            path = tmp_path_factory.mktemp("template") / "template.db"
+            _build_database(path, seed)
+            templates[seed] = path
+        return templates[seed]
+
+    return template
 
 
 @pytest.fixture
-def app(tmp_path):
+def app(tmp_path, request, database_templates):
     """
     Create and configure a Flask application instance for testing.
 
-    Uses a temporary SQLite database that is created fresh for each test
-    and cleaned up after the test completes.
+    Each test gets its own SQLite file, copied from a template database
+    instead of building the schema again. Mark a test with
+    ``@pytest.mark.dataset(seed=fn)`` to start from the template seeded by
+    ``fn`` (see ``database_templates``).
 
     Args:
         tmp_path: pytest fixture providing a temporary directory path
+        request: pytest fixture giving access to the test's markers
+        database_templates: session fixture building template databases
 
     Yields:
         Flask application configured for testing
     """
+    marker = request.node.get_closest_marker("dataset")
     db_path = tmp_path / "test.db"
-    flask_app.config.update(
-        TESTING=True,
-        SQLALCHEMY_DATABASE_URI=f"sqlite:///{db_path}",
-        SQLALCHEMY_ENGINE_OPTIONS={"connect_args": {"check_same_thread": False}},
-    )
+    shutil.copyfile(database_templates(marker.kwargs["seed"] if marker else None), db_path)
+
+    flask_app = create_app(_test_config(db_path))
 
     with flask_app.app_context():
-        db.session.remove()
-        db.drop_all()
-        db.create_all()
-        otp_store.clear()
         yield flask_app
-        otp_store.clear()
         db.session.remove()
-        db.drop_all()
+        db.engine.dispose()
 
 
 @pytest.fixture
@@ -59,6 +127,73 @@ def client(app):
     return app.test_client()
 
 
+@pytest.fixture
+def otp_store(app):
+    """
+    Return the OTP store used by the /signin route of the test app.
+
+    Args:
+        app: Flask application fixture
+
+    Returns:
+        OtpStore instance
+    """
+    return app.extensions["otp_store"]
+
+
+@pytest.fixture
+def user_id(app):
+    """
+    Return the User the logged_in_client fixture signs in as, creating it
+    unless the test's dataset already has it.
+
+    Args:
+        app: Flask application fixture
+
+    Returns:
+        id of the test@example.com User
+    """
+    user = User.query.filter_by(email="test@example.com").first()
+    if user is None:
+        user = User(email="test@example.com")
+        db.session.add(user)
+        db.session.commit()
+    return user.id
+
+
+@pytest.fixture
+def query_budget(app):
+    """
+    Return a context manager that fails the test if the block it wraps runs
+    more than a given number of SQL statements.
+
+    Use ``max_repeats`` to also fail on a statement repeated per row (N+1):
+
+        with query_budget(5, max_repeats=1):
+            client.get("/habit-tracker")
+
+    Args:
+        app: Flask application fixture
+
+    Returns:
+        query_budget(max_queries, max_repeats=None) context manager
+    """
+    return _query_budget
+
+
+@pytest.fixture
+def clock():
+    """
+    Return a fake clock starting at 1000.0 seconds.
+
+    Pass it as ``clock=`` and advance time with ``clock.now += seconds``.
+
+    Returns:
+        FakeClock instance
+    """
+    return FakeClock()
+
+
 @pytest.fixture
 def logged_in_client(client):
     """
@@ -0,0 +1,91 @@
+import gzip
+
+from assets import build_assets, load_manifest, purge_and_minify
+
+# === Asset Build Tests ===
+
+
+def test_purge_keeps_used_rules_and_minifies():
+    """Rules for classes absent from the templates are dropped; the rest is minified."""
+    css = """
+    /* comment */
+    *, ::before { box-sizing: border-box; }
+    .text-red { color : red ; }
+    .text-blue { color: blue; }
+    .hover\\:underline:hover { text-decoration: underline; }
+    @media (min-width: 640px) { .sm\\:flex { display: flex; } .unused { display: none; } }
+    @keyframes fadeIn { from { opacity: 0; } to { opacity: 1; } }
+    """
+
+    out = purge_and_minify(css, {"text-red", "hover:underline", "sm:flex"})
+
+    assert out == (
+        "*,::before{box-sizing:border-box}"
+        ".text-red{color:red}"
+        ".hover\\:underline:hover{text-decoration:underline}"
+        "@media (min-width: 640px){.sm\\:flex{display:flex}}"
+        "@keyframes fadeIn{from{opacity:0}to{opacity:1}}"
+    )
+
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def test_build_assets_writes_fingerprinted_bundle(tmp_path):
+    """build_assets writes hashed, gzipped bundles and a manifest."""
+    static_dir, templates_dir = tmp_path / "static", tmp_path / "templates"
+    _write(templates_dir / "page.html", '<div class="card">x</div>')
+    _write(static_dir / "css" / "style.css", ".card { padding: 1rem; } .other { margin: 0; }")
+
+    manifest = build_assets(str(static_dir), str(templates_dir))
+
+    filename = manifest["css/style.css"]
+    assert filename.startswith("dist/style.") and filename.endswith(".css")
+    assert "css/app.css" not in manifest  # no compiled Tailwind source
+    built = (static_dir / filename).read_bytes()
+    assert built == b".card{padding:1rem}"
+    assert gzip.decompress((static_dir / (filename + ".gz")).read_bytes()) == built
+    assert load_manifest(str(static_dir)) == manifest
+
+
+def test_static_serves_precompressed_immutable_bundle(app, client, tmp_path):
+    """Fingerprinted files get long-lived caching and gzip when accepted."""
+    static_dir, templates_dir = tmp_path / "static", tmp_path / "templates"
+    _write(templates_dir / "page.html", '<div class="card">x</div>')
+    _write(static_dir / "css" / "style.css", ".card { padding: 1rem; }")
+    manifest = build_assets(str(static_dir), str(templates_dir))
+    app.static_folder = str(static_dir)
+    app.extensions["asset_manifest"] = manifest
+
+    with app.test_request_context():
+        from assets import asset_url
+        url = asset_url("css/style.css")
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert url == f"/static/{manifest['css/style.css']}"
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.mimetype == "text/css"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data) == b".card{padding:1rem}"
+    response.close()
+
+
+def test_pages_fall_back_to_cdn_without_build(client):
+    """Without a built bundle the templates keep using the Tailwind CDN."""
+    html = client.get("/").data.decode("utf-8")
+    assert "cdn.tailwindcss.com" in html
+
+
+def test_pages_use_self_hosted_fonts_when_built(app, client):
+    """A built fonts bundle replaces the Google Fonts stylesheet."""
+    app.extensions["asset_manifest"] = {"css/fonts.css": "dist/fonts.0123456789ab.css"}
+
+    html = client.get("/signin").data.decode("utf-8")
+
+    assert "/static/dist/fonts.0123456789ab.css" in html
+    assert "fonts.googleapis.com" not in html
+    assert "cdn.tailwindcss.com" in html
@@ -0,0 +1,69 @@
+from datetime import date, timedelta
+
+import history
+
+START = date(2025, 3, 1)
+
+
+def _days(*offsets):
+    return [START + timedelta(days=n) for n in offsets]
+
+
+def test_encode_decode_round_trip():
+    """Packed histories decode back to the same sorted dates."""
+    days = _days(0, 1, 2, 9, 40, 364)
+
+    blob = history.encode_days(days, START)
+
+    assert len(blob) == 46
+    assert history.decode_days(blob, START) == days
+    assert history.decode_days(b"", START) == []
+
+
+def test_is_done_checks_single_day():
+    """is_done is true only for set days inside the packed range."""
+    blob = history.encode_days(_days(0, 9), START)
+
+    assert history.is_done(blob, START, START)
+    assert history.is_done(blob, START, START + timedelta(days=9))
+    assert not history.is_done(blob, START, START + timedelta(days=1))
+    assert not history.is_done(blob, START, START - timedelta(days=1))
+    assert not history.is_done(blob, START, START + timedelta(days=500))
+    assert not history.is_done(None, None, START)
+
+
+def test_total_and_runs():
+    """Totals are popcounts; runs are found with shifts and masks."""
+    blob = history.encode_days(_days(0, 1, 2, 5, 6, 7, 8, 10), START)
+
+    assert history.total(blob) == 8
+    assert history.longest_run(blob) == 4
+    assert history.run_ending(blob, START, START + timedelta(days=8)) == 4
+    assert history.run_ending(blob, START, START + timedelta(days=2)) == 3
+    assert history.run_ending(blob, START, START + timedelta(days=9)) == 0
+    assert history.longest_run(None) == 0
+
+
+def test_set_and_clear_day():
+    """Setting a day before the start rebases the history."""
+    blob, start = history.set_day(None, None, START)
+    blob, start = history.set_day(blob, start, START + timedelta(days=3))
+    blob, start = history.set_day(blob, start, START - timedelta(days=2))
+
+    assert start == START - timedelta(days=2)
+    assert history.decode_days(blob, start) == _days(-2, 0, 3)
+
+    blob = history.clear_day(blob, start, START + timedelta(days=3))
+    assert history.decode_days(blob, start) == _days(-2, 0)
+    assert len(blob) == 1
+
+
+def test_count_between_counts_inclusive_range():
+    """count_between counts set days inside the window only."""
+    blob = history.encode_days(_days(0, 3, 4, 10), START)
+
+    assert history.count_between(blob, START, START, START + timedelta(days=4)) == 3
+    assert history.count_between(blob, START, START - timedelta(days=5), START) == 1
+    assert history.count_between(blob, START, START + timedelta(days=5),
+                                 START + timedelta(days=9)) == 0
+    assert history.count_between(blob, None, START, START) == 0
@@ -0,0 +1,109 @@
+import json
+from datetime import date
+
+from extensions import db
+from live import LocalHub, SqlPollingHub, event_stream
+from models import Habit, User
+
+TODAY = date(2026, 1, 5)
+
+
+def _user(email="live@example.com"):
+    user = User(email=email)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def _add_habit(user_id, name, bump=True):
+    db.session.add(Habit(name=name, user_id=user_id))
+    if bump:
+        User.bump_habits_version(user_id)
+    db.session.commit()
+
+
+def _data(message):
+    return json.loads(message.split("data: ", 1)[1])
+
+
+# === Hub Tests ===
+
+
+def test_local_hub_wakes_only_the_changed_users_streams():
+    """publish notifies each subscription of the named users and no others."""
+    hub = LocalHub()
+    first, second, other = hub.subscribe(1), hub.subscribe(1), hub.subscribe(2)
+
+    hub.publish({1})
+
+    assert first.wait(0) and second.wait(0)
+    assert not other.wait(0)
+    assert not first.wait(0)  # one notification, one wake-up
+    hub.unsubscribe(first)
+    hub.unsubscribe(second)
+    hub.unsubscribe(other)
+    assert len(hub) == 0
+
+
+def test_commit_publishes_to_the_app_hub(app):
+    """Bumping the habits version notifies the user's streams on commit, not on rollback."""
+    user_id = _user()
+    subscription = app.extensions["live_hub"].subscribe(user_id)
+
+    User.bump_habits_version(user_id)
+    db.session.rollback()
+    assert not subscription.wait(0)
+
+    _add_habit(user_id, "Read")
+    assert subscription.wait(0)
+
+
+def test_sql_hub_hears_changes_committed_elsewhere(app):
+    """The polling hub notices habit_change rows written without a publish."""
+    user_id = _user()
+    hub = SqlPollingHub(app, poll_interval=0.01)
+    subscription = hub.subscribe(user_id)
+    try:
+        _add_habit(user_id, "Read", bump=False)
+        assert subscription.wait(5)
+    finally:
+        hub.stop(timeout=5)
+
+
+# === Event Stream Tests ===
+
+
+def test_event_stream_pushes_changes_then_heartbeats(app):
+    """A stream says hello, sends a diff after a commit, and heartbeats when idle."""
+    user_id = _user()
+    hub = app.extensions["live_hub"]
+    stream = event_stream(hub, user_id, None, lambda: TODAY, heartbeat=0.01, max_seconds=5)
+
+    assert next(stream).startswith("retry:")
+    hello = next(stream)
+    _add_habit(user_id, "Read")
+    changes = next(stream)
+    heartbeat = next(stream)
+    stream.close()
+
+    assert hello.startswith("event: hello\n") and _data(hello) == {"version": 0}
+    assert changes.startswith("event: changes\n")
+    diff = _data(changes)
+    assert [change["habit"]["name"] for change in diff["changed"]] == ["Read"]
+    assert f"\nid: {diff['version']}\n" in changes
+    assert heartbeat == ": heartbeat\n\n"
+    assert len(hub) == 0
+
+
+def test_event_stream_catches_up_from_since_and_ends(app):
+    """Given a version, the stream first sends what changed since, then stops at max_seconds."""
+    user_id = _user()
+    _add_habit(user_id, "Read")
+    _add_habit(user_id, "Walk")
+
+    messages = list(event_stream(LocalHub(), user_id, 1, lambda: TODAY,
+                                 heartbeat=0.01, max_seconds=0.05))
+
+    changes = [m for m in messages if m.startswith("event: changes")]
+    assert len(changes) == 1
+    assert [c["habit"]["name"] for c in _data(changes[0])["changed"]] == ["Walk"]
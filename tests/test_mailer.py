@@ -0,0 +1,143 @@
+import time
+
+import pytest
+
+from extensions import db
+from mailer import FAILED, PENDING, LocalSmtpServer, MailQueue, SmtpTransport, build_mail_queue
+from models import OutboundMessage
+
+# === Mail Queue Tests ===
+
+
+class SlowTransport:
+    """Records deliveries after a delay, like a slow mail server."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.sent = []
+
+    def send_many(self, messages):
+        time.sleep(self.delay)
+        self.sent.extend(messages)
+        return {}
+
+
+@pytest.fixture
+def smtp_server():
+    """A local SMTP server collecting delivered messages."""
+    with LocalSmtpServer() as server:
+        yield server
+
+
+@pytest.fixture
+def queue(app, smtp_server, clock):
+    """A queue delivering to smtp_server, driven by hand with a fake clock."""
+    transport = SmtpTransport(port=smtp_server.port)
+    return MailQueue(app, transport, batch_size=2, max_attempts=3, retry_base=30,
+                     worker="none", clock=clock)
+
+
+def _rows():
+    db.session.expire_all()
+    return db.session.scalars(db.select(OutboundMessage).order_by(OutboundMessage.id)).all()
+
+
+def test_signin_enqueues_code_without_sending(client, app):
+    """POST /signin queues the email instead of sending it inline."""
+    response = client.post("/signin", json={"email": "a@example.com"})
+
+    rows = _rows()
+    assert response.status_code == 200
+    assert [row.recipient for row in rows] == ["a@example.com"]
+    assert response.get_json()["otp"] in rows[0].body
+    assert rows[0].status == PENDING
+
+
+def test_deliver_pending_sends_in_batches(queue, smtp_server):
+    """Every due message is sent, batch by batch, and removed from the queue."""
+    for index in range(5):
+        queue.enqueue(f"user{index}@example.com", "Your sign-in code", f"code {index}")
+
+    totals = queue.deliver_pending()
+
+    assert totals == {"sent": 5, "retrying": 0, "failed": 0}
+    assert sorted(message["To"] for message in smtp_server.messages) == [
+        f"user{index}@example.com" for index in range(5)
+    ]
+    assert smtp_server.messages[0].get_payload().strip() == "code 0"
+    assert _rows() == []
+
+
+def test_refused_recipient_is_retried_with_backoff(queue, smtp_server, clock):
+    """A rejected message backs off exponentially, then is marked failed."""
+    smtp_server.refuse.add("bad@example.com")
+    queue.enqueue("bad@example.com", "Code", "123456")
+    queue.enqueue("good@example.com", "Code", "654321")
+
+    assert queue.deliver_pending() == {"sent": 1, "retrying": 1, "failed": 0}
+    [row] = _rows()
+    assert (row.status, row.attempts, row.next_attempt_at) == (PENDING, 1, 1030.0)
+    assert "550" in row.last_error
+
+    assert queue.deliver_pending()["retrying"] == 0  # not due yet
+    clock.now = 1030.0
+    assert queue.deliver_pending()["retrying"] == 1
+    assert _rows()[0].next_attempt_at == 1090.0
+
+    clock.now = 1090.0
+    assert queue.deliver_pending() == {"sent": 0, "retrying": 0, "failed": 1}
+    assert _rows()[0].status == FAILED
+    clock.now = 10 ** 6
+    assert queue.deliver_pending() == {"sent": 0, "retrying": 0, "failed": 0}
+
+
+def test_unreachable_server_retries_whole_batch(app, smtp_server, clock):
+    """If the server cannot be reached every claimed message is retried."""
+    port = smtp_server.port
+    smtp_server.stop()
+    queue = MailQueue(app, SmtpTransport(port=port, timeout=1), worker="none", clock=clock)
+    queue.enqueue("a@example.com", "Code", "1")
+    queue.enqueue("b@example.com", "Code", "2")
+
+    assert queue.deliver_pending() == {"sent": 0, "retrying": 2, "failed": 0}
+    assert {row.status for row in _rows()} == {PENDING}
+
+
+def test_stale_claim_is_delivered_after_lease(queue, smtp_server, clock):
+    """A message claimed by a worker that died is picked up once its lease ends."""
+    queue.enqueue("a@example.com", "Code", "1")
+    queue._claim(clock.now)
+
+    assert queue.deliver_pending()["sent"] == 0
+    clock.now += queue.lease
+    assert queue.deliver_pending()["sent"] == 1
+    assert len(smtp_server.messages) == 1
+
+
+def test_signin_does_not_wait_for_slow_mail(app, client):
+    """With the worker thread, /signin returns before a slow send finishes."""
+    transport = SlowTransport(delay=0.5)
+    queue = MailQueue(app, transport, worker="thread", poll_interval=0.05)
+    app.extensions["mail_queue"] = queue
+    try:
+        started = time.perf_counter()
+        response = client.post("/signin", json={"email": "a@example.com"})
+        elapsed = time.perf_counter() - started
+
+        deadline = time.time() + 5
+        while not transport.sent and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        queue.stop(timeout=5)
+
+    assert response.status_code == 200
+    assert elapsed < transport.delay
+    assert [message.recipient for message in transport.sent] == ["a@example.com"]
+
+
+def test_build_mail_queue_rejects_unknown_transport(app):
+    """An unknown MAIL_TRANSPORT fails loudly."""
+    app.config["MAIL_TRANSPORT"] = "pigeon"
+
+    with pytest.raises(ValueError):
+        build_mail_queue(app)
@@ -1,5 +1,27 @@
-from extensions import db
-from models import Habit
+import threading
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db, init_db_engine
+from migrations import (
+    add_missing_columns,
+    assign_unowned_habits,
+    backfill_completions,
+    deduplicate_categories,
+)
+from models import Habit, HabitCompletion, User
+from streaks import (
+    COUNTER_FIELDS,
+    EMPTY_SUMMARY,
+    current_streak,
+    longest_streak,
+    record_completion,
+    remove_completion,
+    repair_counters,
+    streak_summaries,
+)
 
 # === Habit Model Tests ===
 #
@@ -35,3 +57,397 @@ def test_habit_allows_optional_description(app):
     assert stored is not None
     assert stored.description is None
     assert stored.description is None
+
+
+# === Habit Completion & Streak Tests ===
+
+
+def _habit_with_days(name, days):
+    habit = Habit(name=name)
+    db.session.add(habit)
+    db.session.flush()
+    for day in days:
+        db.session.add(HabitCompletion(habit_id=habit.id, completed_on=day))
+    db.session.commit()
+    return habit
+
+
+def test_completion_unique_per_habit_per_day(app):
+    """A habit cannot be completed twice on the same day."""
+    habit = _habit_with_days("Stretch", [date(2025, 1, 1)])
+
+    db.session.add(HabitCompletion(habit_id=habit.id, completed_on=date(2025, 1, 1)))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+
+def test_deleting_habit_removes_completions(app):
+    """Completions are deleted along with their habit."""
+    habit = _habit_with_days("Journal", [date(2025, 1, 1), date(2025, 1, 2)])
+
+    db.session.delete(habit)
+    db.session.commit()
+
+    assert HabitCompletion.query.count() == 0
+
+
+def test_current_and_longest_streak(app):
+    """Streaks are computed from consecutive completion days."""
+    today = date(2025, 3, 10)
+    days = [date(2025, 3, 1), date(2025, 3, 2), date(2025, 3, 3), date(2025, 3, 4)]
+    days += [today - timedelta(days=n) for n in range(3)]
+    habit = _habit_with_days("Read", days)
+
+    assert current_streak(habit.id, today=today) == 3
+    assert longest_streak(habit.id) == 4
+
+
+def test_current_streak_survives_until_end_of_next_day(app):
+    """A streak ending yesterday is still current; one ending earlier is broken."""
+    today = date(2025, 3, 10)
+    habit = _habit_with_days("Walk", [date(2025, 3, 8), date(2025, 3, 9)])
+
+    assert current_streak(habit.id, today=today) == 2
+    assert current_streak(habit.id, today=today + timedelta(days=1)) == 0
+
+
+def test_streak_summaries_batch(app):
+    """streak_summaries returns one summary per habit, including empty ones."""
+    today = date(2025, 3, 10)
+    active = _habit_with_days("Meditate", [date(2025, 3, 9), today])
+    idle = _habit_with_days("Floss", [])
+
+    summaries = streak_summaries([active.id, idle.id], today=today)
+
+    assert summaries[active.id].current == 2
+    assert summaries[active.id].longest == 2
+    assert summaries[active.id].last_completed_on == today
+    assert summaries[idle.id] == EMPTY_SUMMARY
+
+
+def test_backfill_completions_from_legacy_text(app):
+    """Legacy completed_dates text is migrated once into completion rows."""
+    habit = Habit(name="Run", completed_dates='["2025-01-01", "2025-01-02", "2025-01-02"]')
+    other = Habit(name="Swim", completed_dates="2025-02-01, 2025-02-03 not-a-date")
+    db.session.add_all([habit, other])
+    db.session.commit()
+
+    assert backfill_completions() == 4
+    assert backfill_completions() == 0
+    assert habit.completions.count() == 2
+    assert longest_streak(habit.id) == 2
+    assert other.completions.count() == 2
+
+
+# === Denormalized Counter Tests ===
+
+
+def test_record_completion_updates_counters(app):
+    """Consecutive check-ins extend the streak; a gap restarts it."""
+    habit = _habit_with_days("Pushups", [])
+
+    for day in (date(2025, 3, 1), date(2025, 3, 2), date(2025, 3, 3), date(2025, 3, 5)):
+        assert record_completion(habit, day)
+        db.session.commit()
+    assert not record_completion(habit, date(2025, 3, 5))
+
+    assert habit.current_streak == 1
+    assert habit.best_streak == 3
+    assert habit.last_completed_on == date(2025, 3, 5)
+    assert habit.done_on(date(2025, 3, 3))
+    assert not habit.done_on(date(2025, 3, 4))
+    assert habit.streak_on(date(2025, 3, 6)) == 1
+    assert habit.streak_on(date(2025, 3, 7)) == 0
+    assert habit.completions_in_last(7, date(2025, 3, 7)) == 4
+    assert habit.completions_in_last(3, date(2025, 3, 7)) == 1
+    assert habit.total_completions() == 4
+    assert habit.completion_bits == b"\x17"
+    assert repair_counters() == []
+
+
+def test_record_completion_rolls_back_with_the_caller(app):
+    """The completion row is not committed until the caller commits."""
+    habit = _habit_with_days("Pushups", [])
+
+    assert record_completion(habit, date(2025, 3, 1))
+    db.session.rollback()
+
+    assert habit.completions.count() == 0
+    assert repair_counters() == []
+
+
+def test_concurrent_record_completion_counts_once(app):
+    """Simultaneous check-ins for the same day record one row, without errors."""
+    habit_id = _habit_with_days("Pushups", []).id
+    barrier = threading.Barrier(4)
+    results = []
+
+    def complete():
+        with app.app_context():
+            habit = db.session.get(Habit, habit_id)
+            barrier.wait()
+            results.append(record_completion(habit, date(2025, 3, 1)))
+            db.session.commit()
+
+    threads = [threading.Thread(target=complete) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    habit = db.session.get(Habit, habit_id)
+    db.session.refresh(habit)
+    assert sorted(results) == [False, False, False, True]
+    assert habit.completions.count() == 1
+    assert habit.current_streak == 1
+    assert repair_counters() == []
+
+
+def test_remove_completion_rebuilds_counters(app):
+    """Undoing the last check-in restores the previous streak state."""
+    habit = _habit_with_days("Pushups", [])
+    for day in (date(2025, 3, 1), date(2025, 3, 2)):
+        record_completion(habit, day)
+    db.session.commit()
+
+    assert remove_completion(habit, date(2025, 3, 2))
+    db.session.commit()
+
+    assert habit.current_streak == 1
+    assert habit.best_streak == 1
+    assert habit.last_completed_on == date(2025, 3, 1)
+    assert habit.recent_completions == 1
+    assert not remove_completion(habit, date(2025, 3, 2))
+
+
+def test_repair_counters_reports_and_fixes_drift(app):
+    """repair_counters rebuilds counters from raw rows and reports drift."""
+    habit = _habit_with_days("Sketch", [date(2025, 3, 1), date(2025, 3, 2)])
+
+    drift = repair_counters()
+    assert {item["field"] for item in drift} == set(COUNTER_FIELDS)
+    assert habit.current_streak == 2
+    assert habit.best_streak == 2
+    assert habit.last_completed_on == date(2025, 3, 2)
+    assert habit.recent_completions == 0b11
+    assert habit.completion_bits == b"\x03"
+    assert habit.completion_bits_start == date(2025, 3, 1)
+
+    assert repair_counters() == []
+
+
+def test_add_missing_columns_upgrades_legacy_table(app):
+    """Columns added to a model are created on an existing table with defaults."""
+    db.session.add(Habit(name="Legacy"))
+    db.session.commit()
+    db.session.execute(db.text("ALTER TABLE habit DROP COLUMN best_streak"))
+    db.session.commit()
+
+    assert add_missing_columns(Habit) == ["best_streak"]
+    assert add_missing_columns(Habit) == []
+    assert db.session.execute(db.text("SELECT best_streak FROM habit")).scalar() == 0
+
+
+# === User Tests ===
+
+
+def test_assign_unowned_habits(app):
+    """Legacy habits without an owner are assigned along with their completions."""
+    user = User(email="owner@example.com")
+    db.session.add(user)
+    db.session.commit()
+    legacy = _habit_with_days("Legacy", [date(2025, 1, 1)])
+    owned = Habit(name="Owned", user_id=user.id)
+    db.session.add(owned)
+    db.session.commit()
+
+    assert assign_unowned_habits(user.id) == 1
+    assert legacy.user_id == user.id
+    assert legacy.completions.first().user_id == user.id
+    assert user.habits.count() == 2
+
+
+# === Category Tests ===
+
+
+def test_deduplicate_categories_links_legacy_text(app):
+    """Free-text categories collapse onto one Category per name and user."""
+    user = User(email="owner@example.com")
+    db.session.add(user)
+    db.session.commit()
+    db.session.add_all([
+        Habit(name="Run", legacy_category="fitness", user_id=user.id),
+        Habit(name="Walk", legacy_category="Sleep ", user_id=user.id),
+        Habit(name="Nap", legacy_category="sleep", user_id=user.id),
+        Habit(name="Orphan", legacy_category="Sleep"),
+    ])
+    db.session.commit()
+
+    assert deduplicate_categories() == 3
+    assert deduplicate_categories() == 0
+
+    habits = {habit.name: habit for habit in Habit.query.all()}
+    assert habits["Run"].category.name == "Fitness"
+    assert habits["Run"].category.user_id is None
+    assert habits["Walk"].category_id == habits["Nap"].category_id
+    assert habits["Walk"].category.user_id == user.id
+    assert habits["Orphan"].category_id is None
+
+    assign_unowned_habits(user.id)
+    assert habits["Orphan"].category_id == habits["Nap"].category_id
+
+
+def test_user_categories_cached_until_version_changes(app):
+    """The category list is cached per user and reloaded after a habit write."""
+    from categories import resolve_category, user_categories
+
+    user = User(email="owner@example.com")
+    db.session.add(user)
+    db.session.commit()
+    cache = app.extensions["category_cache"]
+
+    first = user_categories(user.id)
+    assert user_categories(user.id) is first
+    assert [option.name for option in first][:2] == ["Health", "Fitness"]
+
+    sleep_id = resolve_category(user.id, "Sleep")
+    assert len(cache) == 0
+    assert resolve_category(user.id, "SLEEP") == sleep_id
+    assert resolve_category(user.id, "health") == first[0].id
+    assert resolve_category(user.id, "  ") is None
+
+    cached = user_categories(user.id)
+    User.bump_habits_version(user.id)
+    db.session.commit()
+    assert user_categories(user.id) is not cached
+    assert user_categories(user.id)[-1].is_custom
+
+
+def test_new_categories_belong_to_the_callers_transaction(app):
+    """Categories created while resolving names are discarded by a rollback."""
+    from categories import resolve_categories, user_categories
+
+    user = User(email="owner@example.com")
+    db.session.add(user)
+    db.session.commit()
+
+    ids = resolve_categories(user.id, ["Sleep", "sleep ", "Health", "Reading", ""])
+    assert ids["Sleep"] == ids["sleep "] is not None
+    assert ids["Health"] == user_categories(user.id)[0].id
+    assert ids[""] is None
+    assert sum(option.is_custom for option in user_categories(user.id)) == 2
+
+    db.session.rollback()
+
+    assert not any(option.is_custom for option in user_categories(user.id))
+
+
+def test_category_cache_is_bounded():
+    """The category cache keeps only the most recently used users."""
+    from categories import CategoryCache
+
+    cache = CategoryCache(max_entries=2)
+    cache.set(1, 0, ("a",))
+    cache.set(2, 0, ("b",))
+    cache.get(1, 0)
+    cache.set(3, 0, ("c",))
+
+    assert len(cache) == 2
+    assert cache.get(2, 0) is None
+    assert cache.get(1, 0) == ("a",)
+
+
+# === SQLite Engine Profile Tests ===
+
+
+def _profiled_app(tmp_path, **config):
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'profile.db'}", **config)
+    init_db_engine(app)
+    return app
+
+
+def _pragma(name):
+    return db.session.execute(db.text(f"PRAGMA {name}")).scalar()
+
+
+def test_production_profile_applies_pragmas_and_pool(tmp_path):
+    """The production profile enables WAL and tuned pragmas on every connection."""
+    app = _profiled_app(tmp_path, SQLITE_PROFILE="production")
+
+    with app.app_context():
+        assert _pragma("journal_mode") == "wal"
+        assert _pragma("synchronous") == 1  # NORMAL
+        assert _pragma("busy_timeout") == 5000
+        assert _pragma("foreign_keys") == 1
+        assert db.engine.pool.size() == 10
+        db.session.remove()
+
+
+def test_sqlite_pragmas_override_profile(tmp_path):
+    """SQLITE_PRAGMAS entries override the selected profile."""
+    app = _profiled_app(
+        tmp_path, SQLITE_PROFILE="production", SQLITE_PRAGMAS={"busy_timeout": 250}
+    )
+
+    with app.app_context():
+        assert _pragma("busy_timeout") == 250
+        db.session.remove()
+
+
+def test_default_profile_leaves_sqlite_defaults(tmp_path):
+    """Without a profile the database keeps SQLite's rollback journal."""
+    app = _profiled_app(tmp_path)
+
+    with app.app_context():
+        assert _pragma("journal_mode") == "delete"
+        db.session.remove()
+
+
+# === Test Database Isolation Tests ===
+
+
+def _seed_dataset_user():
+    db.session.add(User(email="seeded@example.com"))
+
+
+def test_test_database_accepts_writes(app):
+    """Writes are committed to the test's own database copy (checked by the next test)."""
+    user = User(email="leak@example.com")
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Habit(name="Leak", user_id=user.id))
+    db.session.commit()
+
+    assert db.session.scalar(db.select(db.func.count()).select_from(Habit)) == 1
+
+
+def test_test_database_starts_clean(app):
+    """Each test starts from the template, without rows left by earlier tests."""
+    from categories import DEFAULT_CATEGORIES, user_categories
+
+    assert db.session.scalar(db.select(db.func.count()).select_from(User)) == 0
+    assert db.session.scalar(db.select(db.func.count()).select_from(Habit)) == 0
+    assert [option.name for option in user_categories(None)] == DEFAULT_CATEGORIES
+
+
+@pytest.mark.dataset(seed=_seed_dataset_user)
+def test_dataset_marker_seeds_the_database(app):
+    """A dataset-marked test starts with the seeded rows; its writes stay in its copy."""
+    emails = db.session.scalars(db.select(User.email)).all()
+    db.session.add(User(email="extra@example.com"))
+    db.session.commit()
+
+    assert emails == ["seeded@example.com"]
+
+
+@pytest.mark.dataset(seed=_seed_dataset_user)
+def test_dataset_template_is_reused_unchanged(app, database_templates):
+    """The seeded template is built once and not modified by tests using it."""
+    emails = db.session.scalars(db.select(User.email)).all()
+
+    assert emails == ["seeded@example.com"]
+    assert database_templates(_seed_dataset_user) == database_templates(_seed_dataset_user)
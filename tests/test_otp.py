@@ -0,0 +1,131 @@
+import threading
+
+import pytest
+
+from otp import (
+    EXPIRED,
+    INVALID,
+    LOCKED,
+    MISSING,
+    VERIFIED,
+    MemoryOtpStore,
+    SqlOtpStore,
+    build_otp_store,
+)
+
+# === OTP Store Tests ===
+
+
+@pytest.fixture(params=["memory", "sql"])
+def store_and_clock(request, app, clock):
+    """An OTP store of each backend, driven by the fake clock."""
+    store_class = MemoryOtpStore if request.param == "memory" else SqlOtpStore
+    store = store_class(ttl=60, max_attempts=3, issue_limit=2, issue_window=600, clock=clock)
+    return store, clock
+
+
+def test_issue_and_verify_consumes_code(store_and_clock):
+    """A correct code verifies once and is then gone."""
+    store, _ = store_and_clock
+    assert store.issue("a@example.com", "123456")
+    assert store.get("a@example.com") == "123456"
+
+    assert store.verify("a@example.com", "123456") == VERIFIED
+    assert "a@example.com" not in store
+    assert store.verify("a@example.com", "123456") == MISSING
+
+
+def test_code_expires_after_ttl(store_and_clock):
+    """Codes stop verifying once the TTL has passed."""
+    store, clock = store_and_clock
+    store.issue("a@example.com", "123456")
+
+    clock.now += 61
+
+    assert store.get("a@example.com") is None
+    assert store.verify("a@example.com", "123456") == EXPIRED
+
+
+def test_code_locked_after_max_attempts(store_and_clock):
+    """Too many wrong guesses invalidate the code."""
+    store, _ = store_and_clock
+    store.issue("a@example.com", "123456")
+
+    assert store.verify("a@example.com", "000000") == INVALID
+    assert store.verify("a@example.com", "000000") == INVALID
+    assert store.verify("a@example.com", "000000") == LOCKED
+    assert store.verify("a@example.com", "123456") == MISSING
+
+
+def test_issue_rate_limited_per_window(store_and_clock):
+    """Only issue_limit codes can be requested per email per window."""
+    store, clock = store_and_clock
+    assert store.issue("a@example.com", "111111")
+    assert store.issue("a@example.com", "222222")
+    assert not store.issue("a@example.com", "333333")
+    assert store.get("a@example.com") == "222222"
+
+    clock.now += 601
+
+    assert store.issue("a@example.com", "444444")
+
+
+def test_purge_expired_drops_stale_entries(store_and_clock):
+    """Entries whose code and rate window have both lapsed are purged."""
+    store, clock = store_and_clock
+    store.issue("old@example.com", "111111")
+    clock.now += 30
+    store.issue("new@example.com", "222222")
+    clock.now += 580
+
+    assert store.purge_expired() == 1
+    assert store.get("new@example.com") is None
+
+
+def test_issue_sweeps_expired_entries_periodically(clock):
+    """Issuing after sweep_interval purges stale entries without an explicit call."""
+    store = MemoryOtpStore(ttl=60, issue_window=600, sweep_interval=60, clock=clock)
+    store.issue("old@example.com", "111111")
+
+    clock.now += 601
+    store.issue("new@example.com", "222222")
+
+    assert len(store) == 1
+
+
+def test_memory_store_is_bounded():
+    """The in-memory store evicts least recently issued emails."""
+    store = MemoryOtpStore(max_entries=2)
+    for n in range(3):
+        store.issue(f"user{n}@example.com", "123456")
+
+    assert len(store) == 2
+    assert "user0@example.com" not in store
+    assert "user2@example.com" in store
+
+
+def test_build_otp_store_rejects_unknown_backend():
+    """An unknown OTP_STORE value is a configuration error."""
+    with pytest.raises(ValueError):
+        build_otp_store({"OTP_STORE": "redis"})
+
+
+def test_sql_store_concurrent_first_issue(app):
+    """Simultaneous first requests for one email all succeed up to the issue limit."""
+    store = SqlOtpStore(issue_limit=3)
+    barrier = threading.Barrier(6)
+    results = []
+
+    def request_code(n):
+        with app.app_context():
+            barrier.wait()
+            results.append(store.issue("race@example.com", f"{n:06d}"))
+
+    threads = [threading.Thread(target=request_code, args=(n,)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [False] * 3 + [True] * 3
+    assert store.get("race@example.com") is not None
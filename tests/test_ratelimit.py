@@ -0,0 +1,158 @@
+import pytest
+
+from app import create_app
+from config import TestingConfig
+from extensions import db
+from models import RateLimitBucket
+from ratelimit import MemoryRateLimiter, SqlRateLimiter, parse_limit
+
+# === Token Bucket Tests ===
+
+
+@pytest.fixture(params=["memory", "sql"])
+def limiter_and_clock(request, app, clock):
+    """A rate limiter of each backend, driven by the fake clock."""
+    limiter_class = MemoryRateLimiter if request.param == "memory" else SqlRateLimiter
+    return limiter_class(clock=clock), clock
+
+
+def test_parse_limit():
+    """"N/period" gives a bucket of N tokens refilling N per period."""
+    assert parse_limit("5/minute") == (5, 5 / 60)
+    for bad in ("five/minute", "5/fortnight", "0/second", "5"):
+        with pytest.raises(ValueError):
+            parse_limit(bad)
+
+
+def test_bucket_allows_burst_then_refuses(limiter_and_clock):
+    """A full bucket lets `capacity` requests through, then asks the client to wait."""
+    limiter, _ = limiter_and_clock
+    limit = parse_limit("3/minute")
+
+    results = [limiter.hit("ip:1.2.3.4", limit) for _ in range(4)]
+
+    assert results[:3] == [(True, 0)] * 3
+    assert results[3] == (False, 20)
+
+
+def test_bucket_refills_over_time(limiter_and_clock):
+    """Tokens come back at the configured rate and buckets are independent."""
+    limiter, clock = limiter_and_clock
+    limit = parse_limit("2/minute")
+    limiter.hit("a", limit)
+    limiter.hit("a", limit)
+
+    assert limiter.hit("a", limit)[0] is False
+    assert limiter.hit("b", limit)[0] is True
+    clock.now += 30
+    assert limiter.hit("a", limit) == (True, 0)
+    assert limiter.hit("a", limit) == (False, 30)
+
+
+def test_memory_limiter_forgets_refilled_buckets(clock):
+    """Idle buckets are dropped once full again, and the total is capped."""
+    limiter = MemoryRateLimiter(max_buckets=3, clock=clock)
+    limit = parse_limit("1/second")
+
+    for key in ("a", "b", "c", "d"):
+        limiter.hit(key, limit)
+    assert len(limiter) == 3
+
+    clock.now += 2
+    limiter.hit("e", limit)
+    assert len(limiter) == 1
+
+
+def test_sql_limiter_purges_expired_rows(app, clock):
+    """Rows untouched for longer than the expiry are swept."""
+    limiter = SqlRateLimiter(expiry=60, clock=clock)
+    limiter.hit("a", parse_limit("1/minute"))
+
+    clock.now += 61
+
+    assert limiter.purge_expired() == 1
+
+
+# === Middleware Tests ===
+
+
+@pytest.fixture(params=["memory", "sql"])
+def limited_app(request, tmp_path):
+    """An app with tight limits on sign-in and on every other mutation."""
+
+    class Config(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'limited.db'}"
+        RATE_LIMITING = True
+        RATE_LIMIT_STORE = request.param
+        RATE_LIMITS = {
+            "main.signin": {"ip": "3/minute", "email": "2/minute"},
+            "*": {"ip": "2/minute"},
+        }
+
+    flask_app = create_app(Config)
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_signin_limited_per_email_with_retry_after(limited_app):
+    """Repeated codes for one email get 429 with Retry-After, other emails still work."""
+    client = limited_app.test_client()
+
+    statuses = [client.post("/signin", json={"email": "a@example.com"}).status_code
+                for _ in range(2)]
+    refused = client.post("/signin", json={"email": "a@example.com"})
+    other = client.post("/signin", json={"email": "b@example.com"},
+                        environ_base={"REMOTE_ADDR": "10.0.0.2"})
+
+    assert statuses == [200, 200]
+    assert refused.status_code == 429
+    assert refused.headers["Retry-After"] == "30"
+    assert refused.get_json()["success"] is False
+    assert other.status_code == 200
+
+
+def test_signin_limited_per_ip(limited_app):
+    """One address cycling through emails runs out of its IP bucket."""
+    client = limited_app.test_client()
+
+    statuses = [client.post("/signin", json={"email": f"u{n}@example.com"}).status_code
+                for n in range(4)]
+    other_ip = client.post("/signin", json={"email": "u9@example.com"},
+                           environ_base={"REMOTE_ADDR": "10.0.0.2"})
+
+    assert statuses == [200, 200, 200, 429]
+    assert other_ip.status_code == 200
+
+
+def test_throttled_ip_creates_no_email_buckets(limited_app):
+    """Once the IP bucket is empty, new emails are refused without a bucket each."""
+    client = limited_app.test_client()
+
+    def buckets():
+        limiter = limited_app.extensions["rate_limiter"]
+        if isinstance(limiter, MemoryRateLimiter):
+            return len(limiter)
+        return db.session.scalar(db.select(db.func.count()).select_from(RateLimitBucket))
+
+    for n in range(3):
+        client.post("/signin", json={"email": f"u{n}@example.com"})
+    before = buckets()
+    statuses = [client.post("/signin", json={"email": f"v{n}@example.com"}).status_code
+                for n in range(5)]
+
+    assert statuses == [429] * 5
+    assert buckets() == before == 4
+
+
+def test_mutations_limited_but_reads_are_not(limited_app):
+    """Mutation routes share the default bucket; GET requests are never limited."""
+    client = limited_app.test_client()
+
+    statuses = [client.post("/habit-tracker/delete/1").status_code for _ in range(3)]
+    pages = [client.get("/signin").status_code for _ in range(5)]
+
+    assert statuses[2] == 429 and 429 not in statuses[:2]
+    assert pages == [200] * 5
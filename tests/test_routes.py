@@ -1,7 +1,6 @@
 import pytest
 
-from app import otp_store
-from models import Habit
+from models import Category, Habit, HabitCompletion
 
 # === Habit Tracker Tests ===
 
@@ -14,7 +13,7 @@ def test_signin_get_returns_ok(client):
     assert response.status_code == 200
 
 
-def test_otp_generation_success(client):
+def test_otp_generation_success(client, otp_store):
     """Test that posting an email to /signin generates a 6-digit OTP."""
     # Arrange
     email = "test@example.com"
@@ -32,7 +31,7 @@ def test_otp_generation_success(client):
     assert otp_store.get(email) == json_data["otp"]  # Check global store
 
 
-def test_otp_verification_success(client):
+def test_otp_verification_success(client, otp_store):
     """Test successful OTP verification logs the user in and clears the OTP."""
     # Arrange: Request and store OTP first
     email = "success@example.com"
@@ -55,7 +54,7 @@ def test_otp_verification_success(client):
     assert email not in otp_store  # OTP should be consumed and deleted
 
 
-def test_otp_verification_failure_invalid_otp(client):
+def test_otp_verification_failure_invalid_otp(client, otp_store):
     """Test failed OTP verification with an incorrect OTP."""
     # Arrange: Request and store OTP first
     email = "failure@example.com"
@@ -136,11 +135,11 @@ def test_habit_tracker_post_creates_habit(logged_in_client, app):
         assert stored.description == "Daily reading goal"
 
 
-def test_habit_tracker_delete_removes_habit(client, app):
+def test_habit_tracker_delete_removes_habit(logged_in_client, app, user_id):
     """Test that POST /habit-tracker/delete/<id> removes a habit from the database."""
     # Arrange
     with app.app_context():
-        habit = Habit(name="Morning Run", description="Run 5k every morning")
+        habit = Habit(name="Morning Run", description="Run 5k every morning", user_id=user_id)
         from extensions import db
 
         db.session.add(habit)
@@ -148,7 +147,7 @@ def test_habit_tracker_delete_removes_habit(client, app):
         habit_id = habit.id
 
     # Act
-    response = client.post(f"/habit-tracker/delete/{habit_id}", follow_redirects=False)
+    response = logged_in_client.post(f"/habit-tracker/delete/{habit_id}", follow_redirects=False)
 
     # Assert
     assert response.status_code == 302
@@ -158,10 +157,10 @@ def test_habit_tracker_delete_removes_habit(client, app):
         assert deleted_habit is None
 
 
-def test_habit_tracker_delete_invalid_id_returns_404(client):
+def test_habit_tracker_delete_invalid_id_returns_404(logged_in_client):
     """Test that POST /habit-tracker/delete/<invalid_id> returns 404."""
     # Act
-    response = client.post("/habit-tracker/delete/99999", follow_redirects=False)
+    response = logged_in_client.post("/habit-tracker/delete/99999", follow_redirects=False)
 
     # Assert
     assert response.status_code == 404
@@ -182,7 +181,8 @@ def test_habit_tracker_post_saves_predefined_category(logged_in_client, app):
     with app.app_context():
         stored = Habit.query.filter_by(name="Read 10 pages").first()
         assert stored is not None
-        assert stored.category == "Fitness"
+        assert stored.category.name == "Fitness"
+        assert stored.category.user_id is None
 
 
 def test_habit_tracker_post_uses_category_custom_when_other_selected(logged_in_client, app):
@@ -199,7 +199,42 @@ def test_habit_tracker_post_uses_category_custom_when_other_selected(logged_in_c
     with app.app_context():
         stored = Habit.query.filter_by(name="Evening Walk").first()
         assert stored is not None
-        assert stored.category == "Wellness"
+        assert stored.category.name == "Wellness"
+        assert stored.category.user_id == stored.user_id
+
+
+def test_custom_category_is_offered_and_reused(logged_in_client, app, user_id):
+    """A custom category shows up in the form and is matched case-insensitively."""
+    for name in ("Walk", "Run"):
+        logged_in_client.post("/habit-tracker", data={
+            "name": name, "category": "other", "category_custom": "wellness " if name == "Run" else "Wellness",
+        })
+
+    html = logged_in_client.get("/habit-tracker").data.decode("utf-8")
+
+    assert '<option value="Wellness">Wellness</option>' in html
+    assert '<option value="Health">Health</option>' in html
+    with app.app_context():
+        assert Category.query.filter_by(user_id=user_id).count() == 1
+        assert len({h.category_id for h in Habit.query.all()}) == 1
+
+
+def test_habits_api_filters_by_category(logged_in_client, app, user_id):
+    """?category=<id> lists only habits in that category."""
+    from extensions import db
+    with app.app_context():
+        health = Category.query.filter_by(name="Health", user_id=None).one()
+        db.session.add_all([
+            Habit(name="Water", category=health, user_id=user_id),
+            Habit(name="Read", user_id=user_id),
+        ])
+        db.session.commit()
+        health_id = health.id
+
+    data = logged_in_client.get(f"/habit-tracker/api/habits?category={health_id}").get_json()
+
+    assert [h["name"] for h in data["habits"]] == ["Water"]
+    assert data["habits"][0]["category"] == "Health"
 
 
 def test_habit_dashboard_displays_category(logged_in_client, app):
@@ -220,10 +255,10 @@ def test_habit_dashboard_displays_category(logged_in_client, app):
 
 
 
-def test_archive_habit_success(logged_in_client, app):
+def test_archive_habit_success(logged_in_client, app, user_id):
     """Test that POST /habit-tracker/archive/<id> archives a habit successfully."""
     with app.app_context():
-        habit = Habit(name='Morning Yoga', description='Daily yoga routine', is_archived=False)
+        habit = Habit(name='Morning Yoga', description='Daily yoga routine', is_archived=False, user_id=user_id)
         from extensions import db
         db.session.add(habit)
         db.session.commit()
@@ -254,7 +289,7 @@ def test_archive_habit_invalid_id_returns_404(logged_in_client):
     assert response.status_code == 404
 
 
-def test_unarchive_habit_success(logged_in_client, app):
+def test_unarchive_habit_success(logged_in_client, app, user_id):
     """Test that POST /habit-tracker/unarchive/<id> unarchives a habit successfully."""
     with app.app_context():
         from datetime import datetime, timezone
@@ -262,7 +297,8 @@ def test_unarchive_habit_success(logged_in_client, app):
             name='Evening Walk',
             description='30 min walk',
             is_archived=True,
-            archived_at=datetime.now(timezone.utc)
+            archived_at=datetime.now(timezone.utc),
+            user_id=user_id
         )
         from extensions import db
         db.session.add(habit)
@@ -306,18 +342,19 @@ def test_archived_habits_page_requires_auth(client):
     assert response.location == '/signin'
 
 
-def test_archived_habits_page_shows_only_archived(logged_in_client, app):
+def test_archived_habits_page_shows_only_archived(logged_in_client, app, user_id):
     """Test that /habit-tracker/archived page only displays archived habits."""
     with app.app_context():
         from datetime import datetime, timezone
         from extensions import db
         
-        active_habit = Habit(name='My Active Habit Item', description='Not archived', is_archived=False)
+        active_habit = Habit(name='My Active Habit Item', description='Not archived', is_archived=False, user_id=user_id)
         archived_habit = Habit(
             name='My Archived Habit Item',
             description='This is archived',
             is_archived=True,
-            archived_at=datetime.now(timezone.utc)
+            archived_at=datetime.now(timezone.utc),
+            user_id=user_id
         )
         db.session.add(active_habit)
         db.session.add(archived_habit)
@@ -338,4 +375,1191 @@ def test_archived_habits_page_shows_only_archived(logged_in_client, app):
 def test_all_modules_get_returns_ok(logged_in_client, endpoint):
     """Test that all module endpoints return 200 status code on GET requests when authenticated."""
     response = logged_in_client.get(endpoint)
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+# === Completion & Streak Tests ===
+
+
+def test_complete_habit_records_today_once(logged_in_client, app, user_id):
+    """POST /habit-tracker/complete/<id> records a single completion for today."""
+    with app.app_context():
+        from extensions import db
+        habit = Habit(name='Drink Water', user_id=user_id)
+        db.session.add(habit)
+        db.session.commit()
+        habit_id = habit.id
+
+    logged_in_client.post(f'/habit-tracker/complete/{habit_id}')
+    response = logged_in_client.post(f'/habit-tracker/complete/{habit_id}')
+
+    assert response.status_code == 302
+    with app.app_context():
+        assert HabitCompletion.query.filter_by(habit_id=habit_id).count() == 1
+
+    html = logged_in_client.get('/habit-tracker').data.decode('utf-8')
+    assert '1 day streak' in html
+    assert '14% this week' in html
+
+
+def test_uncomplete_habit_removes_today(logged_in_client, app, user_id):
+    """POST /habit-tracker/uncomplete/<id> removes today's completion."""
+    with app.app_context():
+        from extensions import db
+        habit = Habit(name='Drink Water', user_id=user_id)
+        db.session.add(habit)
+        db.session.commit()
+        habit_id = habit.id
+
+    logged_in_client.post(f'/habit-tracker/complete/{habit_id}')
+    response = logged_in_client.post(f'/habit-tracker/uncomplete/{habit_id}')
+
+    assert response.status_code == 302
+    with app.app_context():
+        assert HabitCompletion.query.filter_by(habit_id=habit_id).count() == 0
+
+
+def test_complete_habit_requires_auth(client):
+    """Completing a habit without authentication redirects to signin."""
+    response = client.post('/habit-tracker/complete/1', follow_redirects=False)
+    assert response.status_code == 302
+    assert response.location == '/signin'
+
+
+def test_complete_habit_invalid_id_returns_404(logged_in_client):
+    """POST /habit-tracker/complete/<invalid_id> returns 404."""
+    response = logged_in_client.post('/habit-tracker/complete/99999')
+    assert response.status_code == 404
+
+
+# === Pagination Tests ===
+
+
+def _seed_habits(app, count, user_id, archived=False):
+    from datetime import datetime, timedelta
+
+    from extensions import db
+    base = datetime(2025, 1, 1)
+    with app.app_context():
+        for n in range(count):
+            db.session.add(Habit(
+                name=f'Habit {n:03d}',
+                user_id=user_id,
+                created_at=base + timedelta(minutes=n),
+                is_archived=archived,
+                archived_at=base + timedelta(minutes=n) if archived else None,
+            ))
+        db.session.commit()
+
+
+def test_habits_api_pages_with_cursor(logged_in_client, app, user_id):
+    """GET /habit-tracker/api/habits walks all habits newest first via cursors."""
+    _seed_habits(app, 5, user_id)
+
+    names = []
+    cursor = None
+    for _ in range(3):
+        url = '/habit-tracker/api/habits?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        data = logged_in_client.get(url).get_json()
+        names += [habit['name'] for habit in data['habits']]
+        cursor = data['next_cursor']
+
+    assert names == [f'Habit {n:03d}' for n in range(4, -1, -1)]
+    assert cursor is None
+
+
+def test_habits_api_archived_orders_by_archived_at(logged_in_client, app, user_id):
+    """?archived=1 lists only archived habits, most recently archived first."""
+    _seed_habits(app, 2, user_id)
+    _seed_habits(app, 3, user_id, archived=True)
+
+    data = logged_in_client.get('/habit-tracker/api/habits?archived=1').get_json()
+
+    assert [habit['is_archived'] for habit in data['habits']] == [True] * 3
+    assert data['habits'][0]['archived_at'] > data['habits'][-1]['archived_at']
+    assert data['next_cursor'] is None
+
+
+def test_habits_api_pages_through_null_sort_values(logged_in_client, app, user_id):
+    """Archived habits without archived_at come last and are reachable via cursors."""
+    from extensions import db
+    _seed_habits(app, 2, user_id, archived=True)
+    with app.app_context():
+        for n in range(3):
+            db.session.add(Habit(name=f'Legacy {n}', user_id=user_id, is_archived=True))
+        db.session.commit()
+
+    names = []
+    cursor = None
+    for _ in range(5):
+        url = '/habit-tracker/api/habits?archived=1&limit=1' + (f'&cursor={cursor}' if cursor else '')
+        data = logged_in_client.get(url).get_json()
+        names += [habit['name'] for habit in data['habits']]
+        cursor = data['next_cursor']
+
+    assert names == ['Habit 001', 'Habit 000', 'Legacy 2', 'Legacy 1', 'Legacy 0']
+    assert cursor is None
+
+
+def test_habits_api_rejects_bad_cursor(logged_in_client):
+    """A malformed cursor returns 400."""
+    response = logged_in_client.get('/habit-tracker/api/habits?cursor=not-a-cursor')
+    assert response.status_code == 400
+
+
+def test_habits_api_requires_auth(client):
+    """The JSON listing returns 401 without authentication."""
+    response = client.get('/habit-tracker/api/habits')
+    assert response.status_code == 401
+
+
+def test_habit_tracker_page_links_to_next_page(logged_in_client, app, user_id):
+    """The HTML list renders one page and links to the next one."""
+    _seed_habits(app, 3, user_id)
+
+    html = logged_in_client.get('/habit-tracker?limit=2').data.decode('utf-8')
+
+    assert 'Habit 002' in html and 'Habit 001' in html
+    assert 'Habit 000' not in html
+    assert 'Show more habits' in html
+
+
+def test_habit_pages_keep_the_category_filter_when_paging(logged_in_client, app, user_id):
+    """The next-page links of both lists carry ?category= and ?limit= along."""
+    import html
+    import re
+
+    from extensions import db
+    _seed_habits(app, 5, user_id)
+    _seed_habits(app, 5, user_id, archived=True)
+    with app.app_context():
+        health = Category.query.filter_by(name='Health', user_id=None).one()
+        for habit in Habit.query.filter(Habit.name.in_(['Habit 000', 'Habit 002', 'Habit 004'])):
+            habit.category_id = health.id
+        db.session.commit()
+        category_id = health.id
+
+    for path, label in (('/habit-tracker', 'Show more habits'),
+                        ('/habit-tracker/archived', 'Show more archived habits')):
+        first = logged_in_client.get(f'{path}?category={category_id}&limit=2').data.decode('utf-8')
+        assert label in first
+        [link] = re.findall(r'href="([^"]*cursor=[^"]*)"', first)
+        second = logged_in_client.get(html.unescape(link)).data.decode('utf-8')
+
+        assert 'Habit 004' in first and 'Habit 002' in first
+        assert 'Habit 000' in second
+        assert 'Habit 001' not in second and 'Habit 003' not in second
+
+
+# === Per-User Scoping Tests ===
+
+
+def _other_users_habit(app):
+    from extensions import db
+    from models import User
+    with app.app_context():
+        other = User(email='someone-else@example.com')
+        db.session.add(other)
+        db.session.commit()
+        habit = Habit(name='Not Yours', user_id=other.id)
+        db.session.add(habit)
+        db.session.commit()
+        return habit.id
+
+
+def test_otp_verification_creates_user(client, app, otp_store):
+    """Signing in creates a User for the email and stores its id in the session."""
+    from models import User
+    client.post('/signin', json={'email': 'new@example.com'})
+    otp = otp_store.get('new@example.com')
+    client.post('/signin', json={'email': 'new@example.com', 'otp': otp, 'action': 'verify'})
+
+    with app.app_context():
+        user = User.query.filter_by(email='new@example.com').first()
+        assert user is not None
+    with client.session_transaction() as sess:
+        assert sess.get('user_id') == user.id
+
+
+def test_habit_tracker_post_assigns_current_user(logged_in_client, app, user_id):
+    """New habits belong to the signed-in user."""
+    logged_in_client.post('/habit-tracker', data={'name': 'Mine'})
+
+    with app.app_context():
+        assert Habit.query.filter_by(name='Mine').first().user_id == user_id
+
+
+def test_habit_lists_hide_other_users_habits(logged_in_client, app, user_id):
+    """Habit pages and the API only show the signed-in user's habits."""
+    _other_users_habit(app)
+
+    assert 'Not Yours' not in logged_in_client.get('/habit-tracker').data.decode('utf-8')
+    assert logged_in_client.get('/habit-tracker/api/habits').get_json()['habits'] == []
+
+
+@pytest.mark.parametrize('action', ['delete', 'archive', 'unarchive', 'complete', 'uncomplete'])
+def test_mutations_reject_other_users_habits(logged_in_client, app, user_id, action):
+    """Mutating another user's habit returns 404 and leaves it untouched."""
+    habit_id = _other_users_habit(app)
+
+    response = logged_in_client.post(f'/habit-tracker/{action}/{habit_id}')
+
+    assert response.status_code == 404
+    with app.app_context():
+        habit = Habit.query.filter_by(id=habit_id).first()
+        assert habit is not None
+        assert not habit.is_archived
+        assert habit.completions.count() == 0
+
+
+def test_delete_habit_requires_auth(client):
+    """Deleting a habit without authentication redirects to signin."""
+    response = client.post('/habit-tracker/delete/1', follow_redirects=False)
+    assert response.status_code == 302
+    assert response.location == '/signin'
+
+
+# === Bulk Operation Tests ===
+
+
+def test_bulk_applies_mixed_operations(logged_in_client, app, user_id):
+    """POST /habit-tracker/bulk applies every operation and reports per-item results."""
+    from extensions import db
+    with app.app_context():
+        keep = Habit(name='Archive Me', user_id=user_id)
+        restore = Habit(name='Restore Me', user_id=user_id, is_archived=True)
+        drop = Habit(name='Delete Me', user_id=user_id)
+        db.session.add_all([keep, restore, drop])
+        db.session.commit()
+        ids = (keep.id, restore.id, drop.id)
+
+    response = logged_in_client.post('/habit-tracker/bulk', json={'operations': [
+        {'op': 'create', 'name': 'Created One', 'category': 'Health'},
+        {'op': 'archive', 'id': ids[0]},
+        {'op': 'unarchive', 'id': ids[1]},
+        {'op': 'delete', 'id': ids[2]},
+    ]})
+
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['success']
+    assert [r['op'] for r in data['results']] == ['create', 'archive', 'unarchive', 'delete']
+    with app.app_context():
+        created = db.session.get(Habit, data['results'][0]['id'])
+        assert created.name == 'Created One' and created.user_id == user_id
+        assert db.session.get(Habit, ids[0]).is_archived
+        assert db.session.get(Habit, ids[0]).archived_at is not None
+        assert not db.session.get(Habit, ids[1]).is_archived
+        assert db.session.get(Habit, ids[2]) is None
+
+
+def test_bulk_reports_item_errors_without_failing_batch(logged_in_client, app, user_id):
+    """Invalid items and other users' habits fail individually."""
+    other_id = _other_users_habit(app)
+
+    data = logged_in_client.post('/habit-tracker/bulk', json={'operations': [
+        {'op': 'create', 'name': ''},
+        {'op': 'explode', 'id': 1},
+        {'op': 'delete', 'id': other_id},
+        {'op': 'create', 'name': 'Valid'},
+    ]}).get_json()
+
+    assert not data['success']
+    assert [r['success'] for r in data['results']] == [False, False, False, True]
+    with app.app_context():
+        assert Habit.query.filter_by(id=other_id).first() is not None
+
+
+def test_bulk_and_sync_reject_over_long_names(logged_in_client, app, user_id):
+    """Names over Habit.name's 100 characters are refused, not stored or cut short."""
+    _seed_completed_habits(app, user_id, 1)
+    habit_id = _sync(logged_in_client)['changed'][0]['habit']['id']
+
+    bulk = logged_in_client.post('/habit-tracker/bulk', json={'operations': [
+        {'op': 'create', 'name': 'x' * 101},
+        {'op': 'create', 'name': 'x' * 100},
+    ]}).get_json()
+    sync = logged_in_client.post('/habit-tracker/api/sync', json={'changes': [
+        {'op': 'create', 'fields': {'name': 'y' * 101}},
+        {'op': 'update', 'id': habit_id, 'fields': {'name': 'y' * 101}, 'force': True},
+    ]}).get_json()
+
+    assert [r['success'] for r in bulk['results']] == [False, True]
+    assert bulk['results'][0]['error'] == 'Name is longer than 100 characters'
+    assert [r['status'] for r in sync['results']] == ['error', 'error']
+    with app.app_context():
+        assert sorted(len(habit.name) for habit in Habit.query) == [7, 100]
+
+
+def test_bulk_resolves_categories_once_per_name(logged_in_client, app, user_id):
+    """New category names are created once, case-insensitively, for the whole batch."""
+    data = logged_in_client.post('/habit-tracker/bulk', json={'operations': [
+        {'op': 'create', 'name': 'Nap', 'category': 'Sleep'},
+        {'op': 'create', 'name': 'Bedtime', 'category': 'sleep'},
+        {'op': 'create', 'name': 'Run', 'category': 'fitness'},
+        {'op': 'create', 'name': 'Plain'},
+    ]}).get_json()
+
+    with app.app_context():
+        habits = {h.name: h for h in Habit.query.filter_by(user_id=user_id)}
+        custom = Category.query.filter_by(user_id=user_id).all()
+        assert [category.name for category in custom] == ['Sleep']
+        assert habits['Nap'].category_id == habits['Bedtime'].category_id == custom[0].id
+        assert habits['Run'].category.name == 'Fitness'
+        assert habits['Plain'].category_id is None
+    assert data['success']
+
+
+def test_bulk_rejects_malformed_request(logged_in_client):
+    """A request without an operations list returns 400."""
+    response = logged_in_client.post('/habit-tracker/bulk', json={'operations': 'nope'})
+    assert response.status_code == 400
+
+
+def test_bulk_requires_auth(client):
+    """The bulk endpoint returns 401 without authentication."""
+    response = client.post('/habit-tracker/bulk', json={'operations': []})
+    assert response.status_code == 401
+
+
+def test_otp_request_rate_limited(client, otp_store):
+    """Requesting too many OTPs for one email returns 429."""
+    for _ in range(otp_store.issue_limit):
+        assert client.post("/signin", json={"email": "busy@example.com"}).status_code == 200
+
+    response = client.post("/signin", json={"email": "busy@example.com"})
+
+    assert response.status_code == 429
+    assert not response.get_json()["success"]
+
+
+# === App Factory Tests ===
+
+
+def test_create_app_reads_prefixed_env(monkeypatch):
+    """FLASK_-prefixed environment variables override the config class."""
+    from app import create_app
+    monkeypatch.setenv("APP_ENV", "testing")
+    monkeypatch.setenv("FLASK_OTP_STORE", "sql")
+
+    app = create_app()
+
+    assert app.config["TESTING"]
+    assert app.config["OTP_STORE"] == "sql"
+
+
+def test_create_app_mapping_overrides_env(monkeypatch):
+    """A mapping passed to create_app wins over the environment."""
+    from app import create_app
+    monkeypatch.setenv("APP_ENV", "testing")
+    monkeypatch.setenv("FLASK_SQLITE_PROFILE", "production")
+
+    app = create_app({"SQLITE_PROFILE": "default"})
+
+    assert app.config["SQLITE_PROFILE"] == "default"
+
+
+def test_production_config_requires_secret_key(monkeypatch):
+    """The production config refuses to start without an explicit secret key."""
+    from app import create_app
+    from config import ProductionConfig
+    monkeypatch.delenv("FLASK_SECRET_KEY", raising=False)
+
+    with pytest.raises(RuntimeError):
+        create_app(ProductionConfig)
+
+
+# === Conditional GET / Page Cache Tests ===
+
+
+def test_habit_tracker_returns_304_for_matching_etag(logged_in_client):
+    """A repeat GET with If-None-Match gets 304 and no body."""
+    first = logged_in_client.get('/habit-tracker')
+    etag = first.headers['ETag']
+
+    second = logged_in_client.get('/habit-tracker', headers={'If-None-Match': etag})
+
+    assert first.status_code == 200
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+
+
+def test_habit_mutation_changes_etag(logged_in_client):
+    """Creating a habit bumps the user's version, so the old ETag no longer matches."""
+    etag = logged_in_client.get('/habit-tracker').headers['ETag']
+
+    logged_in_client.post('/habit-tracker', data={'name': 'New Habit'})
+    response = logged_in_client.get('/habit-tracker', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert 'New Habit' in response.data.decode('utf-8')
+
+
+def test_archived_page_supports_if_modified_since(logged_in_client):
+    """The archived page honours If-Modified-Since via Last-Modified."""
+    first = logged_in_client.get('/habit-tracker/archived')
+
+    second = logged_in_client.get(
+        '/habit-tracker/archived',
+        headers={'If-Modified-Since': first.headers['Last-Modified']},
+    )
+
+    assert second.status_code == 304
+
+
+def test_last_modified_rounds_up_to_whole_seconds(logged_in_client, app, user_id):
+    """A change with a fractional second is never hidden by a same-second If-Modified-Since."""
+    from datetime import datetime, timedelta
+
+    from extensions import db
+    from models import User
+    changed = datetime.utcnow().replace(microsecond=250000) - timedelta(seconds=2)
+    with app.app_context():
+        db.session.get(User, user_id).habits_updated_at = changed
+        db.session.commit()
+    response = logged_in_client.get('/habit-tracker/archived')
+
+    with app.app_context():
+        db.session.get(User, user_id).habits_updated_at = datetime.utcnow() + timedelta(seconds=5)
+        db.session.commit()
+    fresh = logged_in_client.get('/habit-tracker/archived')
+
+    midnight = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    expected = max(changed.replace(microsecond=0) + timedelta(seconds=1), midnight)
+    assert response.last_modified.replace(tzinfo=None) == expected
+    assert 'Last-Modified' not in fresh.headers
+
+
+def test_asset_manifest_changes_etag(logged_in_client, app):
+    """Rebuilt CSS bundles change the ETag, so cached pages pick up the new URLs."""
+    etag = logged_in_client.get('/habit-tracker').headers['ETag']
+
+    app.extensions['asset_manifest'] = {'css/app.css': 'dist/app.0123456789ab.css'}
+    response = logged_in_client.get('/habit-tracker', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_page_cache_serves_repeat_renders(logged_in_client, app, monkeypatch):
+    """Unchanged pages are served from the page cache without re-rendering."""
+    import app as app_module
+    calls = []
+    original = app_module.render_template
+    monkeypatch.setattr(
+        app_module, 'render_template',
+        lambda *args, **kwargs: calls.append(args[0]) or original(*args, **kwargs),
+    )
+
+    first = logged_in_client.get('/habit-tracker')
+    second = logged_in_client.get('/habit-tracker')
+
+    assert first.data == second.data
+    assert len(calls) == 1
+    assert len(app.extensions['page_cache']) == 1
+
+
+# === Stats Tests ===
+
+
+def _seed_completions(app, user_id):
+    from datetime import date
+
+    from extensions import db
+    with app.app_context():
+        health = Category.query.filter_by(name='Health', user_id=None).one()
+        water = Habit(name='Drink Water', category=health, user_id=user_id)
+        read = Habit(name='Read', category=Category(name='Learning', user_id=user_id), user_id=user_id)
+        db.session.add_all([water, read])
+        db.session.flush()
+        # 2025-03-03 is a Monday
+        for day in (date(2025, 3, 3), date(2025, 3, 4), date(2025, 3, 10)):
+            db.session.add(HabitCompletion(habit_id=water.id, user_id=user_id, completed_on=day))
+        db.session.add(HabitCompletion(habit_id=read.id, user_id=user_id, completed_on=date(2025, 3, 10)))
+        db.session.commit()
+        return water.id, read.id
+
+
+def test_stats_api_aggregates_completions(logged_in_client, app, user_id):
+    """GET /habit-tracker/stats returns heatmaps, weekday counts and rates."""
+    water_id, read_id = _seed_completions(app, user_id)
+
+    data = logged_in_client.get('/habit-tracker/stats?days=14&end=2025-03-10').get_json()
+
+    assert data['start'] == '2025-02-25'
+    habits = {h['id']: h for h in data['habits']}
+    water = habits[water_id]
+    assert water['total'] == 3
+    assert water['heatmap'] == '00000011000001'
+    assert water['weekdays'] == [2, 1, 0, 0, 0, 0, 0]
+    assert water['rate_7d'] == round(2 / 7, 4)
+    assert habits[read_id]['heatmap'] == '00000000000001'
+
+    categories = {c['category']: c for c in data['categories']}
+    assert categories['Health']['total'] == 3
+    assert categories['Learning']['heatmap'][-1] == 1
+    assert data['daily']['completions'][-1] == 2
+    assert data['daily']['rolling_7d_rate'][-1] == round(3 / 14, 4)
+
+
+def test_stats_rolling_rate_uses_the_days_in_the_window(logged_in_client, app, user_id):
+    """Before seven days have passed, the rolling rate divides by the days so far."""
+    _seed_completions(app, user_id)
+
+    data = logged_in_client.get('/habit-tracker/stats?days=3&end=2025-03-04').get_json()
+
+    assert data['daily']['completions'] == [0, 1, 1]
+    assert data['daily']['rolling_7d_rate'] == [0.0, round(1 / 4, 4), round(2 / 6, 4)]
+
+
+def test_stats_api_hides_other_users_habits(logged_in_client, app, user_id):
+    """Stats only cover the signed-in user's habits."""
+    _other_users_habit(app)
+
+    data = logged_in_client.get('/habit-tracker/stats').get_json()
+
+    assert data['habits'] == []
+    assert data['categories'] == []
+
+
+def test_stats_api_rejects_bad_date(logged_in_client):
+    """A malformed ?end= is a 400."""
+    response = logged_in_client.get('/habit-tracker/stats?end=yesterday')
+    assert response.status_code == 400
+
+
+def test_stats_api_requires_auth(client):
+    """GET /habit-tracker/stats without authentication returns 401."""
+    response = client.get('/habit-tracker/stats')
+    assert response.status_code == 401
+
+
+# === Export / Import Tests ===
+
+
+def test_export_streams_csv(logged_in_client, app, user_id):
+    """GET /habit-tracker/export streams habits then completions as CSV."""
+    water_id, _ = _seed_completions(app, user_id)
+
+    response = logged_in_client.get('/habit-tracker/export')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert 'attachment' in response.headers['Content-Disposition']
+    lines = response.data.decode('utf-8').splitlines()
+    assert lines[0].startswith('type,habit_id,name')
+    assert sum(line.startswith('habit,') for line in lines) == 2
+    assert f'completion,{water_id},,,,,,,2025-03-03' in lines
+
+
+def test_export_import_round_trip_ndjson(logged_in_client, app, user_id):
+    """An NDJSON export imports back as new habits with the same history."""
+    _seed_completions(app, user_id)
+    exported = logged_in_client.get('/habit-tracker/export?format=ndjson').data
+
+    response = logged_in_client.post('/habit-tracker/import?format=ndjson', data=exported)
+
+    data = response.get_json()
+    assert data['success']
+    assert data['habits_created'] == 2
+    assert data['completions_created'] == 4
+    with app.app_context():
+        copies = Habit.query.filter_by(user_id=user_id, name='Drink Water').order_by(Habit.id).all()
+        assert len(copies) == 2
+        assert copies[1].best_streak == 2
+        assert copies[1].total_completions() == 3
+
+
+def test_import_repairs_counters_chunk_by_chunk(logged_in_client, app, user_id, monkeypatch):
+    """Counters are rebuilt per chunk, for habits whose completions come chunks later."""
+    import backup
+    import streaks
+
+    repaired = []
+
+    def repair_counters(habit_ids, **kwargs):
+        repaired.append(len(habit_ids))
+        return streaks.repair_counters(habit_ids, **kwargs)
+
+    monkeypatch.setattr(backup, 'IMPORT_CHUNK_SIZE', 1)
+    monkeypatch.setattr(backup, 'repair_counters', repair_counters)
+    _seed_completions(app, user_id)
+    exported = logged_in_client.get('/habit-tracker/export?format=ndjson').data
+
+    data = logged_in_client.post('/habit-tracker/import?format=ndjson', data=exported).get_json()
+
+    assert data['completions_created'] == 4
+    assert repaired and max(repaired) == 1
+    with app.app_context():
+        copy = Habit.query.filter_by(user_id=user_id, name='Drink Water').order_by(Habit.id).all()[1]
+        assert copy.best_streak == 2
+        assert copy.total_completions() == 3
+
+
+def test_import_reports_row_errors(logged_in_client, app, user_id):
+    """Bad rows are reported by line while good rows are still imported."""
+    from io import BytesIO
+    body = (
+        'type,habit_id,name,completed_on\n'
+        'habit,1,Run,\n'
+        'habit,2,,\n'
+        'completion,1,,2025-03-01\n'
+        'completion,9,,2025-03-01\n'
+        'completion,1,,March\n'
+    )
+
+    response = logged_in_client.post(
+        '/habit-tracker/import',
+        data={'file': (BytesIO(body.encode('utf-8')), 'habits.csv')},
+        content_type='multipart/form-data',
+    )
+
+    data = response.get_json()
+    assert not data['success']
+    assert data['habits_created'] == 1
+    assert data['completions_created'] == 1
+    assert [e['line'] for e in data['errors']] == [3, 5, 6]
+    assert data['error_count'] == 3
+
+
+def test_import_rejects_unreadable_csv(logged_in_client):
+    """A CSV without a type column is rejected as a whole."""
+    response = logged_in_client.post('/habit-tracker/import', data='name\nRun\n')
+    assert response.status_code == 400
+
+
+def test_export_requires_auth(client):
+    """Exporting without authentication redirects to signin."""
+    response = client.get('/habit-tracker/export')
+    assert response.status_code == 302
+
+
+def test_import_requires_auth(client):
+    """Importing without authentication returns 401."""
+    response = client.post('/habit-tracker/import', data='')
+    assert response.status_code == 401
+
+
+# === Search Tests ===
+
+
+def _search_habits():
+    """Dataset: the test user's habits for the search tests."""
+    from datetime import datetime
+
+    from extensions import db
+    from models import User
+    user = User(email='test@example.com')
+    health = Category.query.filter_by(name='Health', user_id=None).one()
+    db.session.add_all([
+        Habit(name='Morning run', description='5k around the park', user=user,
+              created_at=datetime(2025, 1, 10)),
+        Habit(name='Read', description='Running notes on a novel', user=user,
+              created_at=datetime(2025, 2, 10)),
+        Habit(name='Drink water', category=health, user=user,
+              created_at=datetime(2025, 3, 10)),
+        Habit(name='Runner stretches', user=user, is_archived=True,
+              created_at=datetime(2025, 3, 10)),
+    ])
+
+
+@pytest.mark.dataset(seed=_search_habits)
+def test_search_ranks_prefix_matches(logged_in_client, app, user_id):
+    """Prefix terms match name and description, with name matches first."""
+
+    data = logged_in_client.get('/habit-tracker/api/search?q=run').get_json()
+
+    assert [h['name'] for h in data['habits']] == ['Morning run', 'Read']
+
+
+@pytest.mark.dataset(seed=_search_habits)
+def test_search_matches_category_and_filters(logged_in_client, app, user_id):
+    """Category names are searchable and filters narrow the matches."""
+    health_id = Category.query.filter_by(name='Health', user_id=None).one().id
+
+    by_category = logged_in_client.get('/habit-tracker/api/search?q=heal').get_json()
+    filtered = logged_in_client.get(
+        f'/habit-tracker/api/search?q=drink&category={health_id + 1}'
+    ).get_json()
+    archived = logged_in_client.get('/habit-tracker/api/search?q=run&archived=all').get_json()
+    dated = logged_in_client.get(
+        '/habit-tracker/api/search?q=run&created_from=2025-02-01&created_to=2025-02-10'
+    ).get_json()
+
+    assert [h['name'] for h in by_category['habits']] == ['Drink water']
+    assert filtered['habits'] == []
+    assert len(archived['habits']) == 3
+    assert [h['name'] for h in dated['habits']] == ['Read']
+
+
+@pytest.mark.dataset(seed=_search_habits)
+def test_search_index_follows_updates_and_deletes(logged_in_client, app, user_id):
+    """Renames and deletes reach the index through the triggers."""
+    from extensions import db
+    with app.app_context():
+        habit = Habit.query.filter_by(name='Read').one()
+        habit.name = 'Journal'
+        db.session.delete(Habit.query.filter_by(name='Morning run').one())
+        db.session.commit()
+
+    data = logged_in_client.get('/habit-tracker/api/search?q=journ').get_json()
+    gone = logged_in_client.get('/habit-tracker/api/search?q=morning').get_json()
+
+    assert [h['name'] for h in data['habits']] == ['Journal']
+    assert gone['habits'] == []
+
+
+def test_search_hides_other_users_habits(logged_in_client, app, user_id):
+    """Only the signed-in user's habits are searched."""
+    _other_users_habit(app)
+    with app.app_context():
+        from extensions import db
+        name = db.session.scalars(db.select(Habit.name)).first()
+
+    data = logged_in_client.get(f'/habit-tracker/api/search?q={name}').get_json()
+
+    assert data['habits'] == []
+
+
+@pytest.mark.dataset(seed=_search_habits)
+def test_search_ignores_fts_syntax(logged_in_client, app, user_id):
+    """Quotes and operators in the query are treated as plain words."""
+
+    response = logged_in_client.get('/habit-tracker/api/search?q=run" OR owner:u*')
+
+    assert response.status_code == 200
+
+
+def test_search_requires_query(logged_in_client):
+    """GET /habit-tracker/api/search without q returns 400."""
+    assert logged_in_client.get('/habit-tracker/api/search').status_code == 400
+
+
+def test_search_requires_auth(client):
+    """GET /habit-tracker/api/search without authentication returns 401."""
+    assert client.get('/habit-tracker/api/search?q=run').status_code == 401
+
+
+# === Instrumentation Tests ===
+
+
+@pytest.fixture
+def instrumented_client(tmp_path):
+    """A signed-in client of an app built with INSTRUMENTATION enabled."""
+    from app import create_app
+    from categories import ensure_default_categories
+    from config import TestingConfig
+    from extensions import db
+
+    class Config(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'instrumented.db'}"
+        INSTRUMENTATION = True
+        SLOW_QUERY_MS = 0
+
+    app = create_app(Config)
+    with app.app_context():
+        db.create_all()
+        ensure_default_categories()
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["authenticated"] = True
+            sess["email"] = "test@example.com"
+        yield client
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_instrumentation_disabled_by_default(client):
+    """Without INSTRUMENTATION there is no Server-Timing header or /metrics."""
+    assert "Server-Timing" not in client.get("/signin").headers
+    assert client.get("/metrics").status_code == 404
+
+
+def test_instrumentation_adds_server_timing(instrumented_client):
+    """Instrumented responses report db, render, session and total time."""
+    response = instrumented_client.get("/habit-tracker")
+
+    timing = response.headers["Server-Timing"]
+    assert response.status_code == 200
+    for metric in ("db;dur=", "render;dur=", "session;dur=", "total;dur="):
+        assert metric in timing
+    assert '0 queries' not in timing
+
+
+def test_instrumentation_logs_request(instrumented_client, caplog):
+    """Each request logs one JSON line with counts and slow-query samples."""
+    import json
+
+    with caplog.at_level("INFO", logger="habits.perf"):
+        instrumented_client.get("/habit-tracker")
+
+    line = json.loads(caplog.records[-1].getMessage())
+    assert line["endpoint"] == "main.habit_tracker"
+    assert line["status"] == 200
+    assert line["queries"] > 0
+    # SLOW_QUERY_MS = 0 samples every statement
+    assert len(line["slow_queries"]) == line["queries"]
+
+
+def test_metrics_endpoint_exposes_histograms(instrumented_client):
+    """/metrics serves Prometheus histograms of the requests seen so far."""
+    instrumented_client.get("/habit-tracker")
+    instrumented_client.get("/habit-tracker")
+
+    body = instrumented_client.get("/metrics").get_data(as_text=True)
+
+    assert "# TYPE habits_request_duration_seconds histogram" in body
+    assert (
+        'habits_request_duration_seconds_count{endpoint="main.habit_tracker",method="GET"} 2'
+        in body
+    )
+    assert 'habits_request_queries_bucket{endpoint="main.habit_tracker",le="+Inf"} 2' in body
+    assert 'habits_responses_total{endpoint="main.habit_tracker",status="200"} 2' in body
+
+
+# === Query Budget Tests ===
+
+
+def _seed_completed_habits(app, user_id, count):
+    from datetime import date
+
+    from extensions import db
+    from streaks import record_completion
+
+    with app.app_context():
+        for index in range(count):
+            habit = Habit(name=f"Habit {index}", user_id=user_id, is_archived=index % 2 == 0,
+                          category_id=index % 3 + 1)
+            db.session.add(habit)
+            db.session.flush()
+            record_completion(habit, date.today())
+        db.session.commit()
+
+
+@pytest.mark.parametrize("path", [
+    "/habit-tracker",
+    "/habit-tracker/archived",
+    "/habit-tracker/api/habits",
+    "/habit-tracker/stats",
+    "/habit-tracker/api/search?q=habit",
+])
+def test_habit_pages_run_constant_queries(logged_in_client, app, user_id, query_budget, path):
+    """Habit pages run the same few queries however many habits there are."""
+    _seed_completed_habits(app, user_id, 12)
+
+    with query_budget(6, max_repeats=1):
+        response = logged_in_client.get(path)
+
+    assert response.status_code == 200
+
+
+def test_query_budget_flags_repeated_statements(app, user_id, query_budget):
+    """A per-row lookup fails the budget and is reported as a possible N+1."""
+    from extensions import db
+    from query_budget import QueryBudgetExceededError
+
+    _seed_completed_habits(app, user_id, 4)
+    ids = db.session.scalars(db.select(Habit.id)).all()
+    db.session.expire_all()
+
+    with pytest.raises(QueryBudgetExceededError, match="possible N\\+1"):
+        with query_budget(2):
+            for habit_id in ids:
+                db.session.execute(db.select(Habit.name).where(Habit.id == habit_id)).scalar()
+
+
+def test_query_warnings_log_over_budget_requests(tmp_path, caplog):
+    """QUERY_WARNINGS adds X-Query-Count and logs requests over QUERY_BUDGET."""
+    from app import create_app
+    from config import TestingConfig
+    from extensions import db
+
+    class Config(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'warnings.db'}"
+        QUERY_WARNINGS = True
+        QUERY_BUDGETS = {"main.habit_tracker": 0}
+
+    app = create_app(Config)
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["authenticated"] = True
+            sess["email"] = "test@example.com"
+
+        with caplog.at_level("WARNING", logger="habits.queries"):
+            response = client.get("/habit-tracker")
+            signin = client.get("/signin")
+        db.session.remove()
+        db.engine.dispose()
+
+    assert int(response.headers["X-Query-Count"]) > 0
+    assert signin.headers["X-Query-Count"] == "0"
+    assert [record.getMessage().split("\n")[0] for record in caplog.records] == [
+        f"GET /habit-tracker (main.habit_tracker) ran {response.headers['X-Query-Count']} "
+        "queries, budget 0"
+    ]
+
+
+# === Schedule Tests ===
+
+
+def _create_habit(app, user_id, **fields):
+    from extensions import db
+
+    with app.app_context():
+        habit = Habit(name="Stretch", user_id=user_id, **fields)
+        db.session.add(habit)
+        db.session.commit()
+        return habit.id
+
+
+def test_put_schedule_sets_next_reminder(logged_in_client, app, user_id):
+    """PUT a schedule stores it and computes the next reminder time."""
+    habit_id = _create_habit(app, user_id)
+
+    response = logged_in_client.put(
+        f'/habit-tracker/api/habits/{habit_id}/schedule',
+        json={'schedule': 'weekdays', 'days': ['mon', 'thu'], 'time': '18:00',
+              'timezone': 'Europe/Berlin'},
+    )
+
+    schedule = response.get_json()['schedule']
+    assert response.status_code == 200
+    assert schedule['days'] == ['mon', 'thu']
+    assert schedule['time'] == '18:00'
+    assert schedule['next_due_at'] is not None
+    with app.app_context():
+        from extensions import db
+        assert db.session.get(Habit, habit_id).next_due_at.isoformat() == schedule['next_due_at']
+
+
+def test_put_schedule_rejects_invalid_schedule(logged_in_client, app, user_id):
+    """An invalid schedule returns 400 and changes nothing."""
+    habit_id = _create_habit(app, user_id)
+
+    response = logged_in_client.put(
+        f'/habit-tracker/api/habits/{habit_id}/schedule',
+        json={'schedule': 'daily', 'time': '25:00'},
+    )
+
+    assert response.status_code == 400
+    with app.app_context():
+        from extensions import db
+        assert db.session.get(Habit, habit_id).schedule is None
+
+
+def test_delete_schedule_clears_reminders(logged_in_client, app, user_id):
+    """DELETE removes the schedule and the pending reminder."""
+    habit_id = _create_habit(app, user_id)
+    url = f'/habit-tracker/api/habits/{habit_id}/schedule'
+    logged_in_client.put(url, json={'schedule': 'daily', 'time': '07:00'})
+
+    response = logged_in_client.delete(url)
+
+    assert response.get_json()['schedule'] is None
+    with app.app_context():
+        from extensions import db
+        assert db.session.get(Habit, habit_id).next_due_at is None
+
+
+def test_unarchive_restores_next_reminder(logged_in_client, app, user_id):
+    """Unarchiving a scheduled habit schedules its next reminder again."""
+    from datetime import time
+
+    habit_id = _create_habit(app, user_id, schedule='daily', reminder_time=time(7, 0),
+                             reminder_timezone='UTC', is_archived=True)
+
+    logged_in_client.post(f'/habit-tracker/unarchive/{habit_id}')
+
+    with app.app_context():
+        from extensions import db
+        assert db.session.get(Habit, habit_id).next_due_at is not None
+
+
+def test_schedule_api_requires_auth(client):
+    """The schedule API without authentication returns 401."""
+    assert client.get('/habit-tracker/api/habits/1/schedule').status_code == 401
+
+
+def test_schedule_api_hides_other_users_habits(logged_in_client, app, user_id):
+    """Another user's habit returns 404."""
+    habit_id = _other_users_habit(app)
+
+    response = logged_in_client.get(f'/habit-tracker/api/habits/{habit_id}/schedule')
+
+    assert response.status_code == 404
+
+
+# === Sync Tests ===
+
+
+def _sync(client, since=0, **params):
+    query = '&'.join(f'{key}={value}' for key, value in {'since': since, **params}.items())
+    return client.get(f'/habit-tracker/api/sync?{query}').get_json()
+
+
+def test_sync_from_zero_returns_every_habit(logged_in_client, app, user_id):
+    """A first sync returns all of the user's habits and a version to resume from."""
+    _seed_completed_habits(app, user_id, 3)
+    _other_users_habit(app)
+
+    data = _sync(logged_in_client)
+    again = _sync(logged_in_client, data['version'])
+
+    assert sorted(change['habit']['name'] for change in data['changed']) == [
+        'Habit 0', 'Habit 1', 'Habit 2'
+    ]
+    assert data['deleted'] == [] and data['has_more'] is False
+    assert again['changed'] == [] and again['version'] == data['version']
+
+
+def test_sync_returns_only_changed_habits_and_tombstones(logged_in_client, app, user_id,
+                                                         query_budget):
+    """Later syncs carry just the habits changed since, plus deletions."""
+    _seed_completed_habits(app, user_id, 20)
+    version = _sync(logged_in_client)['version']
+    with app.app_context():
+        first, second = [h.id for h in Habit.query.order_by(Habit.id).limit(2)]
+    logged_in_client.post(f'/habit-tracker/archive/{first}')
+    logged_in_client.post(f'/habit-tracker/delete/{second}')
+
+    with query_budget(4):
+        data = _sync(logged_in_client, version)
+
+    assert [change['habit']['id'] for change in data['changed']] == [first]
+    assert data['changed'][0]['habit']['is_archived'] is True
+    assert [tombstone['id'] for tombstone in data['deleted']] == [second]
+    assert data['version'] > version
+
+
+def test_sync_pages_with_limit(logged_in_client, app, user_id):
+    """limit cuts a sync into pages that resume from the returned version."""
+    _seed_completed_habits(app, user_id, 5)
+
+    first = _sync(logged_in_client, limit=3)
+    rest = _sync(logged_in_client, first['version'], limit=3)
+
+    assert (len(first['changed']), first['has_more']) == (3, True)
+    assert (len(rest['changed']), rest['has_more']) == (2, False)
+
+
+def test_sync_upload_applies_changes(logged_in_client, app, user_id):
+    """Creates, updates and check-ins from a client are applied in one request."""
+    _seed_completed_habits(app, user_id, 1)
+    base = _sync(logged_in_client)
+    habit_id = base['changed'][0]['habit']['id']
+
+    response = logged_in_client.post('/habit-tracker/api/sync', json={
+        'base_version': base['version'],
+        'changes': [
+            {'op': 'create', 'client_id': 'tmp-1', 'fields': {'name': 'Meditate',
+                                                              'category': 'Health'}},
+            {'op': 'update', 'id': habit_id, 'fields': {'name': 'Renamed'}},
+            {'op': 'complete', 'id': habit_id, 'date': '2026-01-05'},
+        ],
+    })
+
+    data = response.get_json()
+    assert data['success'] is True
+    assert [r['status'] for r in data['results']] == ['applied'] * 3
+    assert data['results'][0]['client_id'] == 'tmp-1'
+    pulled = _sync(logged_in_client, base['version'])
+    assert {change['habit']['name'] for change in pulled['changed']} == {'Meditate', 'Renamed'}
+    assert pulled['version'] == data['version']
+
+
+def test_sync_upload_reports_conflicts(logged_in_client, app, user_id):
+    """Editing a habit changed on the server since base_version is a conflict."""
+    _seed_completed_habits(app, user_id, 2)
+    base = _sync(logged_in_client)
+    edited, deleted = sorted(change['habit']['id'] for change in base['changed'])
+    logged_in_client.post(f'/habit-tracker/archive/{edited}')
+    logged_in_client.post(f'/habit-tracker/delete/{deleted}')
+
+    data = logged_in_client.post('/habit-tracker/api/sync', json={
+        'base_version': base['version'],
+        'changes': [
+            {'op': 'update', 'id': edited, 'fields': {'name': 'Offline edit'}},
+            {'op': 'update', 'id': deleted, 'fields': {'name': 'Too late'}},
+            {'op': 'update', 'id': edited, 'fields': {'description': 'Mine'}, 'force': True},
+        ],
+    }).get_json()
+
+    conflict, gone, forced = data['results']
+    assert conflict['status'] == 'conflict'
+    assert conflict['habit']['is_archived'] is True
+    assert (gone['status'], gone['deleted']) == ('conflict', True)
+    assert forced['status'] == 'applied'
+    with app.app_context():
+        from extensions import db
+        habit = db.session.get(Habit, edited)
+        assert (habit.name, habit.description) == ('Habit 0', 'Mine')
+
+
+def test_sync_rejects_bad_requests(logged_in_client):
+    """Invalid versions and payloads return 400."""
+    assert logged_in_client.get('/habit-tracker/api/sync?since=abc').status_code == 400
+    assert logged_in_client.post('/habit-tracker/api/sync', json={'changes': 1}).status_code == 400
+
+
+def test_sync_upload_rejects_invalid_base_versions(logged_in_client, app, user_id):
+    """A change with a non-integer base_version fails on its own, not the batch."""
+    _seed_completed_habits(app, user_id, 1)
+    base = _sync(logged_in_client)
+    habit_id = base['changed'][0]['habit']['id']
+
+    response = logged_in_client.post('/habit-tracker/api/sync', json={
+        'base_version': base['version'],
+        'changes': [
+            {'op': 'update', 'id': habit_id, 'base_version': bad, 'fields': {'name': 'Bad'}}
+            for bad in ('3', None, [1], True)
+        ] + [{'op': 'update', 'id': habit_id, 'fields': {'name': 'Good'}}],
+    })
+
+    data = response.get_json()
+    assert response.status_code == 200
+    assert [r['status'] for r in data['results']] == ['error'] * 4 + ['applied']
+    assert data['results'][0]['error'] == 'base_version must be a sync version'
+
+
+def test_sync_limit_is_clamped(logged_in_client, app, user_id):
+    """Out-of-range and non-numeric limits fall back to the allowed page sizes."""
+    _seed_completed_habits(app, user_id, 3)
+
+    assert len(_sync(logged_in_client, limit=0)['changed']) == 1
+    assert len(_sync(logged_in_client, limit='abc')['changed']) == 3
+
+
+def test_sync_requires_auth(client):
+    """The sync API without authentication returns 401."""
+    assert client.get('/habit-tracker/api/sync').status_code == 401
+
+
+# === Live Stream Tests ===
+
+
+def test_stream_resumes_from_last_event_id(logged_in_client, app, user_id):
+    """The SSE stream sends what changed since Last-Event-ID, then ends at LIVE_MAX_SECONDS."""
+    _seed_completed_habits(app, user_id, 2)
+    version = _sync(logged_in_client)['version']
+    with app.app_context():
+        habit_id = Habit.query.order_by(Habit.id).first().id
+    logged_in_client.post(f'/habit-tracker/archive/{habit_id}')
+    app.config.update(LIVE_MAX_SECONDS=0.05, LIVE_HEARTBEAT_SECONDS=0.01)
+
+    response = logged_in_client.get('/habit-tracker/api/stream',
+                                    headers={'Last-Event-ID': str(version)})
+    body = response.get_data(as_text=True)
+
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert f'event: hello\nid: {version}\n' in body
+    assert body.count('event: changes') == 1 and f'"id":{habit_id}' in body
+
+
+def test_stream_requires_auth(client):
+    """The stream without authentication returns 401."""
+    assert client.get('/habit-tracker/api/stream').status_code == 401
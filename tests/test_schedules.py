@@ -0,0 +1,178 @@
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+import history
+from extensions import db
+from mailer import MailQueue
+from models import Habit, OutboundMessage, User
+from schedules import (
+    DAILY,
+    WEEKDAYS,
+    WEEKLY,
+    ScheduleError,
+    dispatch_reminders,
+    next_due,
+    parse_schedule,
+)
+
+# 2026-01-05 is a Monday
+MONDAY = date(2026, 1, 5)
+
+
+def _habit(kind=DAILY, at=time(7, 30), zone="America/New_York", done=(), **fields):
+    done = [MONDAY + timedelta(days=offset) for offset in done]
+    return Habit(
+        name="Read", schedule=kind, reminder_time=at, reminder_timezone=zone,
+        schedule_days=fields.pop("days", 0), times_per_week=fields.pop("per_week", 0),
+        completion_bits=history.encode_days(done, MONDAY) if done else None,
+        completion_bits_start=MONDAY if done else None, **fields,
+    )
+
+
+# === Schedule Calculation Tests ===
+
+
+def test_daily_reminder_uses_local_time():
+    """07:30 in New York is 12:30 UTC in winter, tomorrow once passed."""
+    habit = _habit()
+
+    assert next_due(habit, datetime(2026, 1, 5, 10, 0)) == datetime(2026, 1, 5, 12, 30)
+    assert next_due(habit, datetime(2026, 1, 5, 12, 30)) == datetime(2026, 1, 6, 12, 30)
+
+
+def test_daily_reminder_follows_dst_change():
+    """After the spring-forward change the same local time is an hour earlier in UTC."""
+    habit = _habit()
+
+    assert next_due(habit, datetime(2026, 3, 7, 13, 0)) == datetime(2026, 3, 8, 11, 30)
+
+
+def test_weekday_reminder_skips_other_days():
+    """A Monday/Wednesday schedule jumps from Monday to Wednesday."""
+    habit = _habit(WEEKDAYS, zone="UTC", days=0b101)
+
+    assert next_due(habit, datetime(2026, 1, 5, 8, 0)) == datetime(2026, 1, 7, 7, 30)
+
+
+def test_completed_day_gets_no_reminder():
+    """A habit already checked off today is next reminded tomorrow."""
+    habit = _habit(zone="UTC", done=(0,))
+
+    assert next_due(habit, datetime(2026, 1, 5, 6, 0)) == datetime(2026, 1, 6, 7, 30)
+
+
+def test_weekly_target_met_waits_for_next_week():
+    """Two of two weekly check-ins done: no reminder until next Monday."""
+    habit = _habit(WEEKLY, zone="UTC", per_week=2, done=(0, 1))
+
+    assert next_due(habit, datetime(2026, 1, 6, 8, 0)) == datetime(2026, 1, 12, 7, 30)
+
+
+def test_archived_or_unscheduled_habit_has_no_reminder():
+    """Archived and unscheduled habits are never due."""
+    assert next_due(_habit(is_archived=True), datetime(2026, 1, 5)) is None
+    assert next_due(_habit(kind=None), datetime(2026, 1, 5)) is None
+
+
+def test_parse_schedule_validates_input():
+    """parse_schedule returns column values and rejects bad input."""
+    values = parse_schedule({"schedule": "weekdays", "days": ["mon", "Fri"], "time": "07:30"})
+
+    assert values["schedule_days"] == 0b10001
+    assert values["reminder_time"] == time(7, 30)
+    assert values["reminder_timezone"] == "UTC"
+    for bad in (
+        {"schedule": "hourly", "time": "07:30"},
+        {"schedule": "daily", "time": "7.30pm"},
+        {"schedule": "daily", "time": "07:30", "timezone": "Mars/Olympus"},
+        {"schedule": "weekdays", "time": "07:30", "days": []},
+        {"schedule": "weekly", "time": "07:30", "times_per_week": 8},
+    ):
+        with pytest.raises(ScheduleError):
+            parse_schedule(bad)
+
+
+# === Reminder Dispatch Tests ===
+
+
+@pytest.fixture
+def mail_queue(app):
+    return MailQueue(app, transport=None, worker="none")
+
+
+def _scheduled_habits(count, email, due_at, **fields):
+    user = User(email=email)
+    db.session.add(user)
+    db.session.flush()
+    habits = [
+        Habit(name=f"Habit {index}", user_id=user.id, schedule=DAILY, reminder_time=time(7, 30),
+              reminder_timezone="UTC", next_due_at=due_at, **fields)
+        for index in range(count)
+    ]
+    db.session.add_all(habits)
+    db.session.commit()
+    return habits
+
+
+def test_dispatch_sends_one_email_per_user_and_reschedules(app, mail_queue, query_budget):
+    """Due habits are batched into one email per user and moved to tomorrow."""
+    due = datetime(2026, 1, 5, 7, 30)
+    _scheduled_habits(30, "a@example.com", due)
+    _scheduled_habits(1, "b@example.com", due)
+    _scheduled_habits(1, "later@example.com", due + timedelta(hours=1))
+
+    with query_budget(8):
+        totals = dispatch_reminders(mail_queue, now=due, batch_size=100)
+
+    messages = db.session.scalars(db.select(OutboundMessage).order_by(OutboundMessage.id)).all()
+    assert totals == {"reminded": 31, "messages": 2, "rescheduled": 31}
+    assert [(m.recipient, m.subject) for m in messages] == [
+        ("a@example.com", "Reminder: 30 habits due"),
+        ("b@example.com", "Reminder: Habit 0"),
+    ]
+    db.session.expire_all()
+    assert db.session.scalar(
+        db.select(db.func.count()).where(Habit.next_due_at == due + timedelta(days=1))
+    ) == 31
+
+
+def test_dispatch_works_through_batches(app, mail_queue):
+    """More due habits than batch_size are all handled, batch by batch."""
+    due = datetime(2026, 1, 5, 7, 30)
+    _scheduled_habits(25, "a@example.com", due)
+
+    totals = dispatch_reminders(mail_queue, now=due, batch_size=10)
+
+    assert totals == {"reminded": 25, "messages": 3, "rescheduled": 25}
+    assert db.session.scalar(db.select(db.func.count()).where(Habit.next_due_at <= due)) == 0
+
+
+def test_dispatch_notifies_live_streams(app, mail_queue):
+    """Owners of rescheduled habits get a live update once the batch commits."""
+    due = datetime(2026, 1, 5, 7, 30)
+    [habit] = _scheduled_habits(1, "a@example.com", due)
+    _scheduled_habits(1, "later@example.com", due + timedelta(hours=1))
+    hub = app.extensions["live_hub"]
+    owner, other = hub.subscribe(habit.user_id), hub.subscribe(habit.user_id + 1)
+
+    dispatch_reminders(mail_queue, now=due)
+
+    assert owner.wait(0)
+    assert not other.wait(0)
+    hub.unsubscribe(owner)
+    hub.unsubscribe(other)
+
+
+def test_dispatch_skips_completed_archived_and_late_reminders(app, mail_queue):
+    """Stale slots are rescheduled without sending anything."""
+    due = datetime(2026, 1, 5, 7, 30)
+    [done] = _scheduled_habits(1, "done@example.com", due,
+                               completion_bits=b"\x01", completion_bits_start=MONDAY)
+    _scheduled_habits(1, "archived@example.com", due, is_archived=True)
+    _scheduled_habits(1, "late@example.com", due - timedelta(days=1))
+
+    totals = dispatch_reminders(mail_queue, now=due, grace=timedelta(hours=1))
+
+    assert totals == {"reminded": 0, "messages": 0, "rescheduled": 3}
+    assert db.session.get(Habit, done.id).next_due_at == datetime(2026, 1, 6, 7, 30)
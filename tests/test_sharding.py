@@ -0,0 +1,164 @@
+from datetime import date
+
+import pytest
+
+from app import create_app, init_db
+from config import TestingConfig
+from extensions import db
+from models import Habit, HabitCompletion, User, UserShard
+from query_budget import record_queries
+from sharding import rebalance, shard_for, shard_stats, use_shard
+
+
+def _make_app(db_path, shards):
+    class Config(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{db_path}"
+        SQLALCHEMY_ENGINE_OPTIONS = {"connect_args": {"check_same_thread": False}}
+        SHARDS = shards
+
+    app = create_app(Config)
+    init_db(app)
+    return app
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build apps on tmp_path/app.db, disposing their engines afterwards."""
+    apps = []
+
+    def make(shards):
+        app = _make_app(tmp_path / "app.db", shards)
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        with app.app_context():
+            db.engine.dispose()
+            for engine in db.engines.values():
+                engine.dispose()
+
+
+def _emails_on(shard, count, shards=2):
+    emails = (f"user{n}@example.com" for n in range(1000))
+    return [email for email in emails if shard_for(email, shards) == shard][:count]
+
+
+def _signed_in(app, email):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["authenticated"] = True
+        sess["email"] = email
+    return client
+
+
+def _habit_names(app, shard, email):
+    with app.app_context(), use_shard(shard):
+        return sorted(db.session.scalars(
+            db.select(Habit.name).join(User, Habit.user_id == User.id).where(User.email == email)
+        ))
+
+
+def test_shard_for_is_stable_and_spreads_users():
+    """The same email always maps to the same shard, and users land on every shard."""
+    emails = [f"user{n}@example.com" for n in range(200)]
+
+    assert shard_for("A@Example.com ", 4) == shard_for("a@example.com", 4)
+    assert {shard_for(email, 4) for email in emails} == {0, 1, 2, 3}
+
+
+def test_requests_write_to_the_users_shard(make_app, tmp_path):
+    """Habits created through the routes land in the signed-in user's shard file only."""
+    app = make_app(2)
+    [first], [second] = _emails_on(0, 1), _emails_on(1, 1)
+
+    _signed_in(app, first).post("/habit-tracker", data={"name": "Flossing"})
+    _signed_in(app, second).post("/habit-tracker", data={"name": "Juggling"})
+    page = _signed_in(app, second).get("/habit-tracker").get_data(as_text=True)
+
+    assert _habit_names(app, 0, first) == ["Flossing"] and _habit_names(app, 1, second) == ["Juggling"]
+    assert _habit_names(app, 1, first) == [] and _habit_names(app, 0, second) == []
+    assert "Juggling" in page and "Flossing" not in page
+    assert (tmp_path / "app.shard0.db").exists() and (tmp_path / "app.shard1.db").exists()
+    with app.app_context():
+        ids = dict(db.session.execute(db.select(UserShard.email, UserShard.id)).all())
+        assert not db.inspect(db.engine).has_table("habit")
+    assert ids[first] != ids[second]
+
+
+def test_shard_stats_counts_each_shard(make_app):
+    """Cross-shard stats are gathered from every shard."""
+    app = make_app(2)
+    for email in _emails_on(0, 2) + _emails_on(1, 1):
+        _signed_in(app, email).post("/habit-tracker", data={"name": "Flossing"})
+
+    with app.app_context():
+        stats = shard_stats(app)
+
+    assert stats == [
+        {"shard": 0, "users": 2, "habits": 2},
+        {"shard": 1, "users": 1, "habits": 1},
+    ]
+
+
+def test_record_queries_counts_shard_statements(make_app):
+    """Query budgets see statements routed to shard databases."""
+    app = make_app(2)
+    [email] = _emails_on(1, 1)
+    client = _signed_in(app, email)
+
+    with app.app_context(), record_queries() as recorder:
+        client.post("/habit-tracker", data={"name": "Flossing"})
+
+    assert any("INSERT INTO habit " in statement for statement in recorder.statements)
+
+
+def test_rebalance_moves_users_to_their_new_shard(make_app):
+    """Growing SHARDS and rebalancing moves users with their habits and history."""
+    emails = [f"user{n}@example.com" for n in range(6)]
+    app = make_app(1)
+    for email in emails:
+        client = _signed_in(app, email)
+        client.post("/habit-tracker", data={"name": f"Habit of {email}"})
+        with app.app_context(), use_shard(0):
+            habit_id = db.session.scalar(
+                db.select(Habit.id).where(Habit.name == f"Habit of {email}")
+            )
+        client.post(f"/habit-tracker/complete/{habit_id}")
+
+    app = make_app(3)
+    with app.app_context():
+        moves = rebalance(app)
+        entries = {e.email: e.shard for e in db.session.scalars(db.select(UserShard))}
+        stats = shard_stats(app)
+
+    assert {email for email, _, _ in moves} == {e for e in emails if shard_for(e, 3) != 0}
+    assert entries == {email: shard_for(email, 3) for email in emails}
+    assert sum(s["habits"] for s in stats) == 6 and sum(s["users"] for s in stats) == 6
+    for email in emails:
+        assert _habit_names(app, shard_for(email, 3), email) == [f"Habit of {email}"]
+        page = _signed_in(app, email).get("/habit-tracker").get_data(as_text=True)
+        assert f"Habit of {email}" in page
+    with app.app_context(), use_shard(shard_for(moves[0][0], 3)):
+        assert db.session.scalar(db.select(db.func.count(HabitCompletion.id))) >= 1
+
+
+def test_rebalance_imports_an_unsharded_database(make_app):
+    """Users of a database from before sharding are moved into their shards."""
+    app = make_app(0)
+    with app.app_context():
+        user = User(email="legacy@example.com")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Habit(name="Old habit", user_id=user.id, last_completed_on=date(2026, 1, 5)))
+        db.session.commit()
+
+    app = make_app(2)
+    with app.app_context():
+        moves = rebalance(app)
+
+    shard = shard_for("legacy@example.com", 2)
+    assert moves == [("legacy@example.com", None, shard)]
+    assert _habit_names(app, shard, "legacy@example.com") == ["Old habit"]
+    with app.app_context(), use_shard(None):
+        assert db.session.scalar(db.select(db.func.count()).select_from(Habit)) == 0
@@ -0,0 +1,17 @@
+"""WSGI entry point for production servers.
+
+    pip install ".[gevent]"
+    gunicorn -k gevent --worker-connections 1000 --workers 4 wsgi:app
+
+Each open ``/habit-tracker/api/stream`` response holds its worker for up to
+``LIVE_MAX_SECONDS``, so use greenlet workers: a sync worker would serve
+nothing else while one browser tab is open. Don't combine ``-k gevent``
+with ``--preload``; the live hub's locks must be created after gevent has
+patched ``threading`` in each worker. With more than one worker set
+``FLASK_LIVE_HUB=sql`` (see live.py). Run ``flask --app wsgi migrate``
+before the first start.
+"""
+
+from app import create_app
+
+app = create_app()